@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark response size and CPU time with gzip response compression.
+
+Serves list responses of increasing size through EndpointsDispatcherMiddleware
+to a client that sends Accept-Encoding: gzip, and reports the body size and
+the CPU time per request for each compression level (0 is uncompressed).  Run
+from the repository root:
+
+  PYTHONPATH=. python benchmarks/compression_benchmark.py
+"""
+
+import cStringIO
+import time
+import timeit
+
+from endpoints import api_config
+from endpoints import apiserving
+from endpoints import endpoints_dispatcher
+from endpoints import messages
+from endpoints import remote
+from endpoints import resource_container
+
+_ITEM_COUNTS = (10, 100, 1000)
+_LEVELS = (0, 1, 6, 9)
+_REPEAT = 5
+
+
+class Item(messages.Message):
+  id = messages.IntegerField(1)
+  name = messages.StringField(2)
+  tags = messages.StringField(3, repeated=True)
+  owner = messages.StringField(4)
+  score = messages.FloatField(5)
+
+
+class ItemList(messages.Message):
+  items = messages.MessageField(Item, 1, repeated=True)
+  next_page_token = messages.StringField(2)
+
+
+LIST_RESOURCE = resource_container.ResourceContainer(
+    limit=messages.IntegerField(1))
+
+
+@api_config.api('bench', 'v1')
+class BenchService(remote.Service):
+
+  @api_config.method(LIST_RESOURCE, ItemList, path='items', http_method='GET')
+  def List(self, request):
+    return ItemList(
+        items=[Item(id=i, name='item %d' % i, tags=['red', 'green', 'blue'],
+                    owner='owner%d@example.com' % (i % 7), score=i / 3.0)
+               for i in range(request.limit)],
+        next_page_token='token')
+
+
+def _call(app, num_items):
+  environ = {
+      'wsgi.url_scheme': 'https',
+      'REQUEST_METHOD': 'GET',
+      'SERVER_NAME': 'example.appspot.com',
+      'SERVER_PORT': '443',
+      'PATH_INFO': '/_ah/api/bench/v1/items',
+      'QUERY_STRING': 'limit=%d&prettyPrint=false' % num_items,
+      'HTTP_ACCEPT_ENCODING': 'gzip',
+      'wsgi.input': cStringIO.StringIO(),
+  }
+  return ''.join(app(environ, lambda status, headers, exc_info=None: None))
+
+
+def main():
+  apps = [(level, endpoints_dispatcher.EndpointsDispatcherMiddleware(
+      apiserving._ApiServer([BenchService]), compression_level=level,
+      compression_min_size=0)) for level in _LEVELS]
+  for num_items in _ITEM_COUNTS:
+    number = max(1, 2000 // num_items)
+    results = []
+    for level, app in apps:
+      size = len(_call(app, num_items))
+      cpu_time = min(timeit.repeat(lambda: _call(app, num_items),
+                                   timer=time.clock, number=number,
+                                   repeat=_REPEAT)) / number
+      results.append('level %d: %7d bytes %6.2f ms' % (level, size,
+                                                       cpu_time * 1e3))
+    print '%4d items  %s' % (num_items, '  '.join(results))
+
+
+if __name__ == '__main__':
+  main()
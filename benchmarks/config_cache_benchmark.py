@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark starting an API server with and without the API config cache.
+
+Builds an API with _NUM_METHODS methods, then reports the time for
+_ApiServer to start when it generates the API config, and when it loads it
+from a config cache file.  Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/config_cache_benchmark.py
+"""
+
+import os
+import shutil
+import tempfile
+import timeit
+
+import endpoints
+from endpoints import apiserving
+from endpoints import message_types
+from endpoints import messages
+from endpoints import remote
+
+_NUMBER = 20
+_REPEAT = 5
+_NUM_METHODS = 50
+
+
+class Color(messages.Enum):
+  RED = 1
+  GREEN = 2
+
+
+class Item(messages.Message):
+  name = messages.StringField(1)
+  count = messages.IntegerField(2)
+  color = messages.EnumField(Color, 3)
+  created = message_types.DateTimeField(4)
+
+
+class ItemList(messages.Message):
+  items = messages.MessageField(Item, 1, repeated=True)
+  next_page_token = messages.StringField(2)
+
+
+ITEM_RESOURCE = endpoints.ResourceContainer(
+    Item, id=messages.IntegerField(1, required=True),
+    page_token=messages.StringField(2), limit=messages.IntegerField(3))
+
+
+def _make_service():
+  """Returns an API service class with _NUM_METHODS methods."""
+  methods = {}
+  for i in xrange(_NUM_METHODS):
+
+    def method(self, request):
+      return ItemList()
+
+    methods['method%d' % i] = endpoints.method(
+        ITEM_RESOURCE, ItemList, path='items%d/{id}' % i, http_method='POST',
+        name='items.method%d' % i,
+        scopes=[endpoints.EMAIL_SCOPE])(method)
+  service = type('ItemService', (remote.Service,), methods)
+  return endpoints.api(name='items', version='v1',
+                       description='Items API')(service)
+
+
+def main():
+  service = _make_service()
+  directory = tempfile.mkdtemp()
+  config_cache = os.path.join(directory, 'api_config_cache.json')
+  apiserving._ApiServer([service], config_cache=config_cache)
+
+  times = {}
+  for label, kwargs in (('generated', {}),
+                        ('cached', {'config_cache': config_cache})):
+
+    def start():
+      apiserving._ApiServer([service], **kwargs)
+
+    times[label] = min(timeit.repeat(start, number=_NUMBER,
+                                     repeat=_REPEAT)) / _NUMBER
+    print '%-9s  %8.2f ms per start' % (label, times[label] * 1e3)
+  print 'speedup    %.1fx' % (times['generated'] / times['cached'])
+  shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark serving discovery docs and the API directory.
+
+Serves /discovery/v1/apis/{api}/{version}/rest and /discovery/v1/apis through
+EndpointsDispatcherMiddleware with and without the discovery document cache,
+and reports the time per request.  Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/discovery_benchmark.py
+"""
+
+import cStringIO
+import timeit
+
+from endpoints import api_config
+from endpoints import apiserving
+from endpoints import discovery_service
+from endpoints import endpoints_dispatcher
+from endpoints import messages
+from endpoints import remote
+from endpoints import resource_container
+
+_NUMBER = 200
+_REPEAT = 5
+
+
+class Item(messages.Message):
+  id = messages.IntegerField(1)
+  name = messages.StringField(2)
+  tags = messages.StringField(3, repeated=True)
+
+
+ITEM_RESOURCE = resource_container.ResourceContainer(
+    Item, item_id=messages.IntegerField(4, required=True))
+
+
+@api_config.api('bench', 'v1')
+class BenchService(remote.Service):
+
+  @api_config.method(ITEM_RESOURCE, Item, path='items/{item_id}',
+                     http_method='GET')
+  def Get(self, request):
+    return Item(id=request.item_id)
+
+  @api_config.method(Item, Item, path='items', http_method='POST')
+  def Insert(self, request):
+    return request
+
+  @api_config.method(ITEM_RESOURCE, Item, path='items/{item_id}',
+                     http_method='PUT')
+  def Update(self, request):
+    return Item(id=request.item_id)
+
+
+def _call(app, path):
+  environ = {
+      'wsgi.url_scheme': 'https',
+      'REQUEST_METHOD': 'GET',
+      'SERVER_NAME': 'example.appspot.com',
+      'SERVER_PORT': '443',
+      'PATH_INFO': path,
+      'QUERY_STRING': '',
+      'wsgi.input': cStringIO.StringIO(),
+  }
+  return ''.join(app(environ, lambda status, headers, exc_info=None: None))
+
+
+def main():
+  cached = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+      apiserving._ApiServer([BenchService]))
+  uncached = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+      apiserving._ApiServer([BenchService]))
+  # pylint: disable=protected-access
+  uncached._discovery = discovery_service.DiscoveryService(
+      uncached.config_manager, uncached._backend)
+  # pylint: enable=protected-access
+  for name, path in (('rest doc', '/_ah/api/discovery/v1/apis/bench/v1/rest'),
+                     ('directory', '/_ah/api/discovery/v1/apis')):
+    times = {}
+    for label, app in (('uncached', uncached), ('cached', cached)):
+      times[label] = min(timeit.repeat(lambda: _call(app, path),
+                                       number=_NUMBER,
+                                       repeat=_REPEAT)) / _NUMBER
+    print '%-9s  uncached: %7.1f us  cached: %7.1f us  (%.1fx)' % (
+        name, times['uncached'] * 1e6, times['cached'] * 1e6,
+        times['uncached'] / times['cached'])
+
+
+if __name__ == '__main__':
+  main()
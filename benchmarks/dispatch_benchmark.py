@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark a REST call through EndpointsDispatcherMiddleware.
+
+Compares calling the ProtoRPC method in process with sending the transformed
+request through the backend's WSGI interface.  Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/dispatch_benchmark.py
+"""
+
+import cStringIO
+import json
+import timeit
+
+from endpoints import api_config
+from endpoints import apiserving
+from endpoints import endpoints_dispatcher
+from endpoints import messages
+from endpoints import remote
+from endpoints import resource_container
+
+_ITERATIONS = 100
+_REPEAT = 20
+
+
+class Item(messages.Message):
+  name = messages.StringField(1)
+  tags = messages.StringField(2, repeated=True)
+  count = messages.IntegerField(3)
+
+
+class ItemList(messages.Message):
+  items = messages.MessageField(Item, 1, repeated=True)
+
+
+ITEM_RESOURCE = resource_container.ResourceContainer(
+    ItemList, collection=messages.StringField(2, required=True),
+    limit=messages.IntegerField(3))
+
+
+@api_config.api('bench', 'v1')
+class BenchService(remote.Service):
+
+  @api_config.method(ITEM_RESOURCE, ItemList, path='{collection}/items',
+                     http_method='POST')
+  def Insert(self, request):
+    return ItemList(items=request.items[:request.limit])
+
+
+class _WsgiOnlyDispatcher(endpoints_dispatcher.EndpointsDispatcherMiddleware):
+
+  def _call_backend_directly(self, orig_request, params, method_config):
+    return None
+
+
+def _make_body(num_items):
+  return json.dumps({'items': [{'name': 'item%d' % i, 'tags': ['a', 'b'],
+                                'count': i} for i in range(num_items)]})
+
+
+def _call(app, body):
+  environ = {
+      'wsgi.url_scheme': 'https',
+      'REQUEST_METHOD': 'POST',
+      'SERVER_NAME': 'example.appspot.com',
+      'SERVER_PORT': '443',
+      'PATH_INFO': '/_ah/api/bench/v1/things/items',
+      'QUERY_STRING': 'limit=1000',
+      'CONTENT_TYPE': 'application/json',
+      'wsgi.input': cStringIO.StringIO(body),
+  }
+  return ''.join(app(environ, lambda status, headers, exc_info=None: None))
+
+
+def main():
+  direct = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+      apiserving._ApiServer([BenchService]))
+  wsgi = _WsgiOnlyDispatcher(apiserving._ApiServer([BenchService]))
+  for num_items in (1, 10, 100):
+    body = _make_body(num_items)
+    assert _call(direct, body) == _call(wsgi, body)
+    # Alternate between the apps so that noise affects both alike.
+    best = [float('inf')] * 2
+    for _ in range(_REPEAT):
+      for i, app in enumerate((direct, wsgi)):
+        best[i] = min(best[i], timeit.timeit(lambda: _call(app, body),
+                                             number=_ITERATIONS))
+    print '%3d items  direct: %8.2f us  through WSGI: %8.2f us' % (
+        num_items, best[0] / _ITERATIONS * 1e6, best[1] / _ITERATIONS * 1e6)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the time to import the endpoints package.
+
+Imports endpoints in a new interpreter _REPEAT times, and reports the fastest
+import, the number of modules it loaded, and any modules it loaded that are
+meant to be imported on first use.  Exits with an error if the import takes
+longer than the budget, or loads any of those modules, so it can be run as a
+check.  Python 2 has no -X importtime, so the import is timed around
+__import__.  Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/import_time_benchmark.py [--budget-ms=N]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+_REPEAT = 10
+# About twice the import time on a developer workstation, to allow for
+# slower machines.  It took over 400ms before the lazy imports.
+_DEFAULT_BUDGET_MS = 250
+# Modules that `import endpoints` mustn't load.
+_LAZY_MODULES = (
+    'endpoints._endpointscfg_impl',
+    'endpoints.directory_list_generator',
+    'endpoints.discovery_generator',
+    'endpoints.openapi_generator',
+    'endpoints_management',
+    'pkg_resources',
+)
+_IMPORT_SCRIPT = """
+import json
+import sys
+import time
+start = time.time()
+import endpoints
+seconds = time.time() - start
+print json.dumps({'seconds': seconds, 'modules': sys.modules.keys()})
+"""
+
+
+def _import_endpoints():
+  """Imports endpoints in a new interpreter.
+
+  Returns:
+    A tuple of the seconds the import took and the modules then loaded.
+  """
+  output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT])
+  result = json.loads(output.splitlines()[-1])
+  return result['seconds'], result['modules']
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--budget-ms', type=float, default=_DEFAULT_BUDGET_MS,
+                      help='The most milliseconds the import may take.')
+  args = parser.parse_args()
+
+  seconds, modules = min(_import_endpoints() for _ in xrange(_REPEAT))
+  print 'import endpoints  %6.1f ms  %d modules' % (seconds * 1e3,
+                                                   len(modules))
+  eager = sorted(name for name in modules
+                 if name.split('.')[0] in _LAZY_MODULES or
+                 name in _LAZY_MODULES)
+  failed = False
+  if eager:
+    print 'FAIL: modules that should be imported lazily were loaded:'
+    for name in eager:
+      print '  %s' % name
+    failed = True
+  if seconds * 1e3 > args.budget_ms:
+    print 'FAIL: over the budget of %.0f ms' % args.budget_ms
+    failed = True
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the JWT signature verifiers.
+
+Reports the signature verifications per second, on a single core, for each
+algorithm supported by each crypto library that's installed: PyCrypto, and
+the cryptography package.  Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/jwt_backend_benchmark.py
+"""
+
+import timeit
+
+from Crypto.Hash import SHA256
+from Crypto.Hash import SHA384
+from Crypto.Hash import SHA512
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from endpoints import users_id_token
+
+_NUMBER = 1000
+_REPEAT = 5
+_SIGNED = 'eyJhbGciOiJSUzI1NiJ9.eyJpc3MiOiJpc3N1ZXIifQ'
+_HASHES = {'RS256': SHA256, 'RS384': SHA384, 'RS512': SHA512}
+
+
+def _make_es256_key_and_signature(verifier):
+  ec = users_id_token.ec
+  private_key = ec.generate_private_key(ec.SECP256R1(),
+                                        users_id_token.default_backend())
+  numbers = private_key.public_key().public_numbers()
+  r, s = users_id_token.asymmetric_utils.decode_dss_signature(
+      private_key.sign(_SIGNED, ec.ECDSA(users_id_token.hashes.SHA256())))
+  signature = ('%064x%064x' % (r, s)).decode('hex')
+  return verifier.construct_ec_key('P-256', numbers.x, numbers.y), signature
+
+
+def main():
+  rsa_key = RSA.generate(2048)
+  verifiers = []
+  if users_id_token._PYCRYPTO_LOADED:
+    verifiers.append(users_id_token._PyCryptoVerifier())
+  if users_id_token._CRYPTOGRAPHY_LOADED:
+    verifiers.append(users_id_token._CryptographyVerifier())
+
+  for verifier in verifiers:
+    print verifier.name
+    for alg in sorted(verifier.algorithms):
+      if alg == 'ES256':
+        key, signature = _make_es256_key_and_signature(verifier)
+      else:
+        key = verifier.construct_rsa_key(rsa_key.n, rsa_key.e)
+        signature = PKCS1_v1_5.new(rsa_key).sign(_HASHES[alg].new(_SIGNED))
+      assert verifier.verify(alg, key, _SIGNED, signature)
+
+      def verify():
+        verifier.verify(alg, key, _SIGNED, signature)
+
+      seconds = min(timeit.repeat(verify, number=_NUMBER,
+                                  repeat=_REPEAT)) / _NUMBER
+      print '  %-6s  %8.0f verifications/s  %7.1f us each' % (
+          alg, 1 / seconds, seconds * 1e6)
+
+
+if __name__ == '__main__':
+  main()
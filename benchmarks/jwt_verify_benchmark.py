@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark verifying a signed JWT.
+
+Signs a token with a freshly generated RSA key, then reports the time to
+verify it with _verify_signed_jwt_with_certs, with the in-process public key
+cache warm and with it cleared before every verification, as it was before
+the cache existed.  It reports the time to verify a token that names its
+signing key with 'kid', and one that doesn't, so every key is tried.  It also
+reports the time for get_verified_jwt with and without the verified token
+cache, and the time for a worker process that hasn't seen a token to get it
+from a SharedMemoryCache that another worker put it in.  Run from the
+repository root:
+
+  PYTHONPATH=. python benchmarks/jwt_verify_benchmark.py
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from endpoints import shared_cache
+from endpoints import users_id_token
+
+_CERT_URI = 'https://example.com/certs'
+_NUM_KEYS = 5
+_NUMBER = 500
+_REPEAT = 5
+
+
+class _DictCache(object):
+  """An in-memory stand-in for memcache."""
+
+  def __init__(self):
+    self._values = {}
+    self.gets = 0
+
+  def get(self, key, namespace=None):
+    self.gets += 1
+    return self._values.get((namespace, key))
+
+  def set(self, key, value, time=None, namespace=None):
+    self._values[(namespace, key)] = value
+
+
+def _b64(data):
+  return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _long_to_b64(value):
+  hex_value = '%x' % value
+  return base64.b64encode(('0' * (len(hex_value) % 2) + hex_value).decode('hex'))
+
+
+def _make_certs():
+  keys = [RSA.generate(2048) for _ in range(_NUM_KEYS)]
+  certs = {'keyvalues': [
+      {'algorithm': 'RSA', 'modulus': _long_to_b64(key.n),
+       'exponent': _long_to_b64(key.e), 'keyid': 'key%d' % i}
+      for i, key in enumerate(keys)]}
+  return keys, certs
+
+
+def _make_token(now, keys, use_kid=True):
+  header = {'alg': 'RS256'}
+  if use_kid:
+    header['kid'] = 'key%d' % (len(keys) - 1)
+  body = _b64(json.dumps({'iss': 'accounts.google.com', 'aud': 'audience',
+                          'iat': now, 'exp': now + 3600}))
+  signed = '%s.%s' % (_b64(json.dumps(header)), body)
+  # Sign with the last key, so every key is tried when there's no kid.
+  signature = PKCS1_v1_5.new(keys[-1]).sign(SHA256.new(signed))
+  return '%s.%s' % (signed, _b64(signature))
+
+
+def main():
+  now = long(time.time())
+  keys, certs = _make_certs()
+  token = _make_token(now, keys)
+  token_without_kid = _make_token(now, keys, use_kid=False)
+  cache = _DictCache()
+  cache.set(_CERT_URI, certs, namespace=users_id_token._CERT_NAMESPACE)
+
+  def verify():
+    users_id_token._verify_signed_jwt_with_certs(token, now, cache, _CERT_URI)
+
+  def verify_uncached():
+    users_id_token._public_keys.clear()
+    verify()
+
+  def verify_without_kid():
+    users_id_token._verify_signed_jwt_with_certs(
+        token_without_kid, now, cache, _CERT_URI)
+
+  os.environ['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+  providers = [{'issuer': 'accounts.google.com', 'cert_uri': _CERT_URI}]
+
+  def get_verified_jwt():
+    users_id_token.get_verified_jwt(providers, ('audience',),
+                                    check_query_arg=False, cache=cache)
+
+  def get_verified_jwt_uncached():
+    users_id_token._verified_tokens.clear()
+    get_verified_jwt()
+
+  directory = tempfile.mkdtemp()
+  shared = shared_cache.SharedMemoryCache(os.path.join(directory, 'cache'))
+  shared.set(_CERT_URI, certs, namespace=users_id_token._CERT_NAMESPACE)
+
+  def get_verified_jwt_shared():
+    # Another worker has verified the token, but this one hasn't.
+    users_id_token._verified_tokens.clear()
+    users_id_token.get_verified_jwt(providers, ('audience',),
+                                    check_query_arg=False, cache=shared)
+
+  for name, baseline, candidate in (
+      ('public keys', ('uncached', verify_uncached), ('cached', verify)),
+      ('key selection (%d keys)' % _NUM_KEYS,
+       ('all keys', verify_without_kid), ('kid', verify)),
+      ('verified tokens', ('uncached', get_verified_jwt_uncached),
+       ('cached', get_verified_jwt)),
+      ('new worker', ('verify', get_verified_jwt_uncached),
+       ('shared', get_verified_jwt_shared))):
+    print name
+    times = []
+    for label, function in (baseline, candidate):
+      cache.gets = 0
+      times.append(min(timeit.repeat(function, number=_NUMBER,
+                                     repeat=_REPEAT)) / _NUMBER)
+      print '  %-8s  %7.1f us per verification  %5.2f cache gets' % (
+          label, times[-1] * 1e6, float(cache.gets) / (_NUMBER * _REPEAT))
+    print '  speedup   %.1fx' % (times[0] / times[1])
+  shared.close()
+  shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  main()
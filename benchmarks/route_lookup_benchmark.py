@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark REST method lookup in ApiConfigManager.
+
+Compares the segment trie used by ApiConfigManager.lookup_rest_method with a
+linear scan over the compiled path regexes, for APIs with 10, 100 and 1000
+methods.  Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/route_lookup_benchmark.py
+"""
+
+import logging
+import timeit
+
+from endpoints import api_config_manager
+
+_METHOD_COUNTS = (10, 100, 1000)
+_ITERATIONS = 2000
+
+
+def _make_config(num_methods):
+  """Build an API config with num_methods methods spread over resources."""
+  methods = {}
+  for i in range(num_methods):
+    resource = 'resource%d' % (i // 4)
+    path = (resource, '%s/{id}' % resource, '%s/{id}/items' % resource,
+            '%s/{id}/items/{item}' % resource)[i % 4]
+    methods['bench.method%d' % i] = {'httpMethod': 'GET', 'path': path}
+  return {'name': 'bench', 'version': 'v1', 'api_version': 'v1',
+          'path_version': 'v1', 'methods': methods}
+
+
+def _linear_lookup(patterns, path):
+  for compiled_path_pattern, method_name in patterns:
+    match = compiled_path_pattern.match(path)
+    if match:
+      return method_name, match.groupdict()
+  return None
+
+
+def _run(num_methods):
+  config = _make_config(num_methods)
+  manager = api_config_manager.ApiConfigManager()
+  manager.process_api_config_response({'items': [config]})
+
+  patterns = [
+      (api_config_manager.ApiConfigManager._compile_path_pattern(
+          'bench/v1/' + method['path']), method_name)
+      for method_name, method in manager._get_sorted_methods(config['methods'])]
+
+  last = num_methods // 4 - 1
+  paths = {
+      'hit (last resource)': 'bench/v1/resource%d/42/items/7' % last,
+      'miss': 'bench/v1/no/such/path',
+  }
+  for label, path in sorted(paths.items()):
+    trie_time = timeit.timeit(
+        lambda: manager.lookup_rest_method(path, path, 'GET'),
+        number=_ITERATIONS)
+    linear_time = timeit.timeit(
+        lambda: _linear_lookup(patterns, path), number=_ITERATIONS)
+    print '%5d methods, %-20s trie: %7.2f us  linear scan: %8.2f us' % (
+        num_methods, label, trie_time / _ITERATIONS * 1e6,
+        linear_time / _ITERATIONS * 1e6)
+
+
+def main():
+  # Misses log a warning on every lookup; keep the output readable.
+  logging.getLogger('endpoints.api_config_manager').setLevel(logging.ERROR)
+  for num_methods in _METHOD_COUNTS:
+    _run(num_methods)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load test the pre-forking server with 1 to N workers.
+
+Serves an echo API with PreforkServer, as `endpointscfg.py serve` does, and
+sends it POST requests from _CLIENTS_PER_WORKER client processes per worker
+for _SECONDS.  Reports the requests per second for each number of workers,
+and the scaling efficiency: the throughput divided by the single worker
+throughput times the number of workers.  Workers only scale while there are
+idle cores, and the clients need cores too, so run it on a machine with
+at least twice as many cores as the most workers.  Exits with an error if
+the efficiency at the most workers is below --min-efficiency, so it can be
+run as a check.  Run from the repository root on Linux:
+
+  PYTHONPATH=. python benchmarks/serve_load_test.py [--workers=N]
+      [--min-efficiency=0.8]
+"""
+
+import argparse
+import httplib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import endpoints
+from endpoints import messages
+from endpoints import prefork_server
+from endpoints import remote
+from endpoints import shared_cache
+
+_SECONDS = 5
+_CLIENTS_PER_WORKER = 2
+
+
+class EchoMessage(messages.Message):
+  text = messages.StringField(1)
+
+
+@endpoints.api(name='echo', version='v1')
+class EchoApi(remote.Service):
+
+  @endpoints.method(EchoMessage, EchoMessage, path='echo',
+                    http_method='POST', name='echo')
+  def echo(self, request):
+    return EchoMessage(text=request.text)
+
+
+def _run_client(port, deadline, results):
+  """Sends requests until the deadline, and puts the number sent."""
+  body = json.dumps({'text': 'hello'})
+  headers = {'Content-Type': 'application/json'}
+  count = 0
+  connection = httplib.HTTPConnection('127.0.0.1', port)
+  while time.time() < deadline:
+    connection.request('POST', '/_ah/api/echo/v1/echo', body, headers)
+    response = connection.getresponse()
+    response.read()
+    if response.status != 200:
+      raise ValueError('Unexpected status %d' % response.status)
+    # wsgiref closes the connection after each response.
+    connection.close()
+    count += 1
+  results.put(count)
+
+
+def _measure(workers, auth_cache):
+  """Returns the requests per second served by that many workers."""
+  app = endpoints.api_server([EchoApi], auth_cache=auth_cache)
+  server = prefork_server.PreforkServer(app, port=0, workers=workers)
+  port = server.server_address[1]
+  master_pid = os.fork()
+  if not master_pid:
+    status = 1
+    try:
+      server.serve_forever()
+      status = 0
+    finally:
+      os._exit(status)  # pylint: disable=protected-access
+  server.socket.close()
+  try:
+    # Let the workers start before timing them.
+    time.sleep(0.5)
+    results = multiprocessing.Queue()
+    start_time = time.time()
+    deadline = start_time + _SECONDS
+    clients = [
+        multiprocessing.Process(target=_run_client,
+                                args=(port, deadline, results))
+        for _ in xrange(workers * _CLIENTS_PER_WORKER)]
+    for client in clients:
+      client.start()
+    total = sum(results.get() for _ in clients)
+    seconds = time.time() - start_time
+    for client in clients:
+      client.join()
+  finally:
+    os.kill(master_pid, signal.SIGTERM)
+    os.waitpid(master_pid, 0)
+  return total / seconds
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--workers', type=int,
+                      default=max(1, multiprocessing.cpu_count() // 2),
+                      help='The most workers to measure.  Defaults to half '
+                      'the number of CPUs, leaving the rest for the clients.')
+  parser.add_argument('--min-efficiency', type=float, default=0,
+                      help='The lowest scaling efficiency allowed at the '
+                      'most workers, from 0 to 1.')
+  args = parser.parse_args()
+  logging.basicConfig()
+  logging.getLogger('endpoints').setLevel(logging.ERROR)
+
+  print '%d CPUs' % multiprocessing.cpu_count()
+  directory = tempfile.mkdtemp()
+  auth_cache = shared_cache.SharedMemoryCache(os.path.join(directory, 'auth'))
+  base_rate = None
+  efficiency = 1.0
+  try:
+    for workers in xrange(1, args.workers + 1):
+      rate = _measure(workers, auth_cache)
+      if base_rate is None:
+        base_rate = rate
+      efficiency = rate / (base_rate * workers)
+      print '%2d workers  %8.1f req/s  %5.1f%% efficiency' % (
+          workers, rate, efficiency * 100)
+  finally:
+    auth_cache.close()
+    shutil.rmtree(directory)
+  if efficiency < args.min_efficiency:
+    print 'FAIL: efficiency below %.0f%%' % (args.min_efficiency * 100)
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
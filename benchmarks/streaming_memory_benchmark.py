@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark peak memory when serving large responses.
+
+A backend streams a JSON list response of increasing size in 64 KB chunks
+through EndpointsDispatcherMiddleware.  Each request runs in a fresh process,
+and the growth of its peak RSS is reported for a streamed response
+(prettyPrint=false) and a buffered one (prettyPrint=true).  Run from the
+repository root:
+
+  PYTHONPATH=. python benchmarks/streaming_memory_benchmark.py
+"""
+
+import cStringIO
+import resource
+import subprocess
+import sys
+
+from endpoints import endpoints_dispatcher
+
+_SIZES_MB = (1, 8, 32)
+_CHUNK = '"%s", ' % ('x' * (64 * 1024 - 4))
+
+
+class _StreamingBackend(object):
+  """A backend that streams a list of strings in 64 KB chunks."""
+
+  base_paths = frozenset(['/_ah/api/'])
+
+  def __init__(self, num_chunks):
+    self._num_chunks = num_chunks
+
+  def get_api_configs(self):
+    return {'items': [{
+        'name': 'bench', 'version': 'v1', 'api_version': 'v1',
+        'path_version': 'v1',
+        'methods': {'bench.list': {'httpMethod': 'GET', 'path': 'items',
+                                   'rosyMethod': 'BenchService.list'}}}]}
+
+  def __call__(self, environ, start_response):
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return self._generate()
+
+  def _generate(self):
+    yield '{"items": ['
+    for _ in xrange(self._num_chunks):
+      yield _CHUNK
+    yield '""]}'
+
+
+def _max_rss_kb():
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _child(size_mb, pretty_print):
+  app = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+      _StreamingBackend(size_mb * 16))
+  environ = {
+      'wsgi.url_scheme': 'https',
+      'REQUEST_METHOD': 'GET',
+      'SERVER_NAME': 'example.appspot.com',
+      'SERVER_PORT': '443',
+      'PATH_INFO': '/_ah/api/bench/v1/items',
+      'QUERY_STRING': 'prettyPrint=%s' % pretty_print,
+      'wsgi.input': cStringIO.StringIO(),
+  }
+  baseline = _max_rss_kb()
+  size = 0
+  for chunk in app(environ, lambda status, headers, exc_info=None: None):
+    size += len(chunk)
+  print size, _max_rss_kb() - baseline
+
+
+def main():
+  if len(sys.argv) == 4 and sys.argv[1] == '--child':
+    _child(int(sys.argv[2]), sys.argv[3])
+    return
+
+  for size_mb in _SIZES_MB:
+    results = []
+    for pretty_print in ('false', 'true'):
+      output = subprocess.check_output(
+          [sys.executable, __file__, '--child', str(size_mb), pretty_print])
+      body_size, rss_growth_kb = output.split()[-2:]
+      results.append((int(body_size), int(rss_growth_kb) / 1024.0))
+    (streamed_size, streamed_rss), (buffered_size, buffered_rss) = results
+    print ('%3d MB response  streamed: %9d bytes, peak RSS +%6.1f MB  '
+           'buffered: %9d bytes, peak RSS +%6.1f MB') % (
+               size_mb, streamed_size, streamed_rss, buffered_size,
+               buffered_rss)
+
+
+if __name__ == '__main__':
+  main()
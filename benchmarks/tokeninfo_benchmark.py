@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark checking oauth bearer tokens on the dev server.
+
+Starts a local stub of the tokeninfo endpoint, then reports the time for
+_set_bearer_user_vars_local to accept a token with the tokeninfo cache warm,
+and with it cleared before every check, as it was before the cache existed.
+Run from the repository root:
+
+  PYTHONPATH=. python benchmarks/tokeninfo_benchmark.py
+"""
+
+import BaseHTTPServer
+import json
+import os
+import threading
+import timeit
+import urllib2
+
+from endpoints import users_id_token
+
+_NUMBER = 200
+_REPEAT = 5
+_CLIENT_ID = '12345.apps.googleusercontent.com'
+_SCOPE = 'https://www.googleapis.com/auth/userinfo.email'
+_TOKEN_INFO = json.dumps({
+    'azp': _CLIENT_ID,
+    'aud': _CLIENT_ID,
+    'email': 'user@example.com',
+    'email_verified': 'true',
+    'expires_in': '3600',
+    'scope': _SCOPE,
+})
+
+
+class _TokenInfoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):  # pylint: disable=g-bad-name
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(_TOKEN_INFO)))
+    self.end_headers()
+    self.wfile.write(_TOKEN_INFO)
+
+  def log_message(self, *unused_args):
+    pass
+
+
+class _FetchResult(object):
+
+  def __init__(self, response):
+    self.status_code = response.getcode()
+    self.headers = response.info()
+    self.content = response.read()
+
+
+def main():
+  httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _TokenInfoHandler)
+  thread = threading.Thread(target=httpd.serve_forever)
+  thread.daemon = True
+  thread.start()
+  tokeninfo_url = 'http://127.0.0.1:%d/tokeninfo' % httpd.server_port
+
+  def fetch(url):
+    return _FetchResult(urllib2.urlopen(
+        url.replace(users_id_token._TOKENINFO_URL, tokeninfo_url)))
+
+  def check():
+    os.environ.pop(users_id_token._ENV_AUTH_EMAIL, None)
+    users_id_token._set_bearer_user_vars_local(
+        'token', (_CLIENT_ID,), (_SCOPE,), fetch=fetch)
+    assert os.environ[users_id_token._ENV_AUTH_EMAIL] == 'user@example.com'
+
+  def check_uncached():
+    users_id_token._token_infos.clear()
+    check()
+
+  times = {}
+  for label, function in (('uncached', check_uncached), ('cached', check)):
+    times[label] = min(timeit.repeat(function, number=_NUMBER,
+                                     repeat=_REPEAT)) / _NUMBER
+    print '%-8s  %8.1f us per request' % (label, times[label] * 1e6)
+  print 'speedup   %.1fx' % (times['uncached'] / times['cached'])
+  httpd.shutdown()
+
+
+if __name__ == '__main__':
+  main()
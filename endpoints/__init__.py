@@ -35,6 +35,7 @@ from .constants import API_EXPLORER_CLIENT_ID
 from .endpoints_dispatcher import *
 from . import message_parser
 from .resource_container import ResourceContainer
+from .shared_cache import SharedMemoryCache
 from .users_id_token import get_current_user, get_verified_jwt, convert_jwks_uri
 from .users_id_token import InvalidGetUserCall
 from .users_id_token import SKIP_CLIENT_ID_CHECK
@@ -37,6 +37,20 @@ The gen_api_config command outputs an .api configuration file for a service.
 Example:
   endpointscfg.py gen_api_config -o . -a /path/to/app \
     --hostname myhost.appspot.com postservice.GreetingsV1
+
+The get_api_config_cache command outputs the API config cache that
+endpoints.api_server(config_cache=...) loads instead of generating configs.
+
+Example:
+  endpointscfg.py get_api_config_cache -o . -a /path/to/app \
+    --hostname myhost.appspot.com postservice.GreetingsV1
+
+The serve command serves the APIs of service classes from several worker
+processes, for running outside of App Engine.
+
+Example:
+  endpointscfg.py serve -a /path/to/app --host 0.0.0.0 --port 8080 \
+    --workers 4 --max-requests 10000 postservice.GreetingsV1
 """
 
 from __future__ import absolute_import
@@ -47,17 +61,24 @@ import contextlib
 import logging
 import os
 import re
+import shutil
 import sys
+import tempfile
 import urllib
 import urllib2
 
 import yaml
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import urlfetch_stub
 from google.appengine.ext import testbed
 
 from . import api_config
+from . import apiserving
 from . import discovery_generator
 from . import openapi_generator
+from . import prefork_server
 from . import remote
+from . import shared_cache
 
 # Conditional import, pylint: disable=g-import-not-at-top
 try:
@@ -69,7 +90,9 @@ except ImportError:
 
 
 CLIENT_LIBRARY_BASE = 'https://google-api-client-libraries.appspot.com/generate'
-_VISIBLE_COMMANDS = ('get_client_lib', 'get_discovery_doc', 'get_openapi_spec')
+_VISIBLE_COMMANDS = ('get_api_config_cache', 'get_client_lib',
+                     'get_discovery_doc', 'get_openapi_spec', 'serve')
+API_CONFIG_CACHE_FILENAME = 'api_config_cache.json'
 
 
 class ServerRequestException(Exception):
@@ -152,6 +175,34 @@ def _WriteFile(output_path, name, content):
   return path
 
 
+def _GetServiceClasses(service_class_names):
+  """Import the service classes with the given names.
+
+  Args:
+    service_class_names: A list of fully qualified ProtoRPC service classes,
+      or of API decorators for multi-class APIs.
+
+  Raises:
+    TypeError: If any service classes don't inherit from remote.Service.
+
+  Returns:
+    A list of the service classes.
+  """
+  resolved_services = []
+  for service_class_name in service_class_names:
+    module_name, base_service_class_name = service_class_name.rsplit('.', 1)
+    module = __import__(module_name, fromlist=base_service_class_name)
+    service = getattr(module, base_service_class_name)
+    if hasattr(service, 'get_api_classes'):
+      resolved_services.extend(service.get_api_classes())
+    elif (not isinstance(service, type) or
+          not issubclass(service, remote.Service)):
+      raise TypeError('%s is not a ProtoRPC service' % service_class_name)
+    else:
+      resolved_services.append(service)
+  return resolved_services
+
+
 def GenApiConfig(service_class_names, config_string_generator=None,
                  hostname=None, application_path=None, **additional_kwargs):
   """Write an API configuration for endpoints annotated ProtoRPC services.
@@ -178,19 +229,7 @@ def GenApiConfig(service_class_names, config_string_generator=None,
   # uniquely identified by (name, version).  Order needs to be preserved here,
   # so APIs that were listed first are returned first.
   api_service_map = collections.OrderedDict()
-  resolved_services = []
-
-  for service_class_name in service_class_names:
-    module_name, base_service_class_name = service_class_name.rsplit('.', 1)
-    module = __import__(module_name, fromlist=base_service_class_name)
-    service = getattr(module, base_service_class_name)
-    if hasattr(service, 'get_api_classes'):
-      resolved_services.extend(service.get_api_classes())
-    elif (not isinstance(service, type) or
-          not issubclass(service, remote.Service)):
-      raise TypeError('%s is not a ProtoRPC service' % service_class_name)
-    else:
-      resolved_services.append(service)
+  resolved_services = _GetServiceClasses(service_class_names)
 
   for resolved_service in resolved_services:
     services = api_service_map.setdefault(
@@ -313,6 +352,99 @@ def _GenOpenApiSpec(service_class_names, output_path, hostname=None,
   return output_files
 
 
+class _ApiConfigCacheGenerator(object):
+  """Generates API config cache entries, in place of config strings."""
+
+  def __init__(self):
+    self._generator = api_config.ApiConfigGenerator()
+
+  def pretty_print_config_to_json(self, services, hostname=None):
+    """Returns a (fingerprint, config dict) entry for the API config cache."""
+    return (self._generator.get_config_fingerprint(services, hostname=hostname),
+            self._generator.get_config_dict(services, hostname=hostname))
+
+
+def _GenApiConfigCache(service_class_names, output_path, hostname=None,
+                       application_path=None):
+  """Write the API config cache for the service classes to a file.
+
+  Args:
+    service_class_names: A list of fully qualified ProtoRPC service names.
+    output_path: The directory to write API_CONFIG_CACHE_FILENAME to.
+    hostname: A string hostname which will be used as the default version
+      hostname. If no hostname is specified in the @endpoints.api decorator,
+      this value is the fallback. Defaults to None.
+    application_path: A string containing the path to the AppEngine app.
+
+  Returns:
+    The path of the file.
+
+  Raises:
+    IOError: If the file couldn't be written.
+  """
+  service_configs = GenApiConfig(
+      service_class_names, hostname=hostname,
+      config_string_generator=_ApiConfigCacheGenerator(),
+      application_path=application_path)
+  path = os.path.join(output_path, API_CONFIG_CACHE_FILENAME)
+  # pylint: disable=protected-access
+  if not apiserving._write_config_cache(path, dict(service_configs.values())):
+    raise IOError('Couldn\'t write %s' % path)
+  return path
+
+
+def _Serve(service_class_names, host='127.0.0.1', port=8080, workers=None,
+           max_requests=0, graceful_timeout=30, connection_timeout=30,
+           base_urls=None, config_cache=None, auth_cache=None):
+  """Serve the APIs of service classes until SIGTERM or SIGINT.
+
+  The app is created and warmed once, then served by pre-forked workers.
+  Each worker starts its own service control thread, if service control is
+  enabled.
+
+  Args:
+    service_class_names: A list of fully qualified ProtoRPC service names.
+    host: A string, the address to listen on.
+    port: An int, the port to listen on.
+    workers: An int, the number of worker processes.  Defaults to the number
+      of CPUs.
+    max_requests: An int, the requests each worker handles before it's
+      replaced, or 0 to never replace workers.
+    graceful_timeout: The seconds workers have to finish their requests
+      when the server stops.
+    connection_timeout: The seconds a worker waits for a client to send or
+      receive data before closing the connection.
+    base_urls: A list of the URLs clients reach the server at, for which
+      discovery docs are generated before forking.
+    config_cache: The path of an API config cache, as written by
+      get_api_config_cache, or None.
+    auth_cache: The path of a file to keep a SharedMemoryCache of certs and
+      verified tokens in, shared by the workers, or None to keep it in a
+      temporary file.
+  """
+  _SetupServeStubs()
+  kwargs = {}
+  if config_cache:
+    kwargs['config_cache'] = config_cache
+  directory = None
+  if not auth_cache:
+    # memcache isn't available outside of App Engine.
+    directory = tempfile.mkdtemp()
+    auth_cache = os.path.join(directory, 'auth_cache')
+  try:
+    kwargs['auth_cache'] = shared_cache.SharedMemoryCache(auth_cache)
+    app = apiserving.api_server(_GetServiceClasses(service_class_names),
+                                prefork=True, **kwargs)
+    server = prefork_server.PreforkServer(
+        app, host=host, port=port, workers=workers, max_requests=max_requests,
+        graceful_timeout=graceful_timeout,
+        connection_timeout=connection_timeout)
+    server.serve_forever(base_urls=base_urls)
+  finally:
+    if directory is not None:
+      shutil.rmtree(directory, ignore_errors=True)
+
+
 def _GenClientLib(discovery_path, language, output_path, build_system):
   """Write a client library from a discovery doc.
 
@@ -467,6 +599,36 @@ def _GenOpenApiSpecCallback(args, openapi_func=_GenOpenApiSpec):
     print 'OpenAPI spec written to %s' % openapi_path
 
 
+def _GenApiConfigCacheCallback(args, cache_func=_GenApiConfigCache):
+  """Generate the API config cache to a file.
+
+  Args:
+    args: An argparse.Namespace object to extract parameters from
+    cache_func: A function that generates the API config cache and stores it
+      to a file, accepting a list of service names and an output directory.
+  """
+  cache_path = cache_func(args.service, args.output, hostname=args.hostname,
+                          application_path=args.application)
+  print 'API config cache written to %s' % cache_path
+
+
+def _ServeCallback(args, serve_func=_Serve):
+  """Serve the APIs of service classes.
+
+  Args:
+    args: An argparse.Namespace object to extract parameters from
+    serve_func: A function that serves the APIs, accepting a list of service
+      names.
+  """
+  logging.getLogger('endpoints.prefork_server').setLevel(logging.INFO)
+  serve_func(args.service, host=args.host, port=args.port,
+             workers=args.workers, max_requests=args.max_requests,
+             graceful_timeout=args.graceful_timeout,
+             connection_timeout=args.connection_timeout,
+             base_urls=args.base_url,
+             config_cache=args.config_cache, auth_cache=args.auth_cache)
+
+
 def _GenClientLibCallback(args, client_func=_GenClientLib):
   """Generate a client library to file.
 
@@ -556,6 +718,46 @@ def MakeParser(prog):
   get_openapi_spec.add_argument('--x-google-api-name', action='store_true',
                                 help="Add the 'x-google-api-name' field to the generated spec")
 
+  get_api_config_cache = subparsers.add_parser(
+      'get_api_config_cache',
+      help=('Generates the API config cache that api_server loads at '
+            'startup from service classes'))
+  get_api_config_cache.set_defaults(callback=_GenApiConfigCacheCallback)
+  AddStandardOptions(get_api_config_cache, 'application', 'hostname',
+                     'output', 'service')
+
+  serve = subparsers.add_parser(
+      'serve',
+      help='Serves the APIs of service classes from several processes')
+  serve.set_defaults(callback=_ServeCallback, testbed=False)
+  AddStandardOptions(serve, 'application', 'service')
+  serve.add_argument('--host', default='127.0.0.1',
+                     help='The address to listen on')
+  serve.add_argument('--port', type=int, default=8080,
+                     help='The port to listen on')
+  serve.add_argument('--workers', type=int,
+                     help='The number of worker processes (default: one per '
+                     'CPU)')
+  serve.add_argument('--max-requests', type=int, default=0,
+                     help='Replace each worker after about this many requests '
+                     '(default: never)')
+  serve.add_argument('--graceful-timeout', type=float, default=30,
+                     help='The seconds workers have to finish their requests '
+                     'when the server stops')
+  serve.add_argument('--connection-timeout', type=float, default=30,
+                     help='The seconds a worker waits for a client to send or '
+                     'receive data before closing the connection')
+  serve.add_argument('--base-url', action='append',
+                     help='A URL clients reach the server at, such as '
+                     'https://api.example.com, to generate discovery docs '
+                     'for before serving.  May be repeated.')
+  serve.add_argument('--config-cache',
+                     help='An API config cache file, as written by '
+                     'get_api_config_cache')
+  serve.add_argument('--auth-cache',
+                     help='A file to keep certs and verified tokens in, shared '
+                     'by the workers (default: a temporary file)')
+
   # Create an alias for get_openapi_spec called get_swagger_spec to support
   # the old-style naming. This won't be a visible command, but it will still
   # function to support legacy scripts.
@@ -597,17 +799,32 @@ def _SetupStubs():
       getattr(tb, v)()
 
 
+def _SetupServeStubs():
+  """Register the only App Engine API stub the serve command uses.
+
+  Certs and token info are fetched with urlfetch, whose stub makes real
+  requests.  The testbed isn't used: it would make the server look like a
+  development server, which turns off service control, and would stub the
+  other APIs with fakes.
+  """
+  if apiproxy_stub_map.apiproxy.GetStub('urlfetch') is None:
+    apiproxy_stub_map.apiproxy.RegisterStub(
+        'urlfetch', urlfetch_stub.URLFetchServiceStub())
+
+
 def main(argv):
   logging.basicConfig()
-  # silence warnings from endpoints.apiserving; they're not relevant
-  # to command-line operation.
-  logging.getLogger('endpoints.apiserving').setLevel(logging.ERROR)
-
-  _SetupStubs()
 
   parser = MakeParser(argv[0])
   args = parser.parse_args(argv[1:])
 
+  # The serve command runs a production server, so it sets up its own stubs.
+  if getattr(args, 'testbed', True):
+    # silence warnings from endpoints.apiserving; they're not relevant
+    # to command-line operation.
+    logging.getLogger('endpoints.apiserving').setLevel(logging.ERROR)
+    _SetupStubs()
+
   # Handle the common "application" argument here, since most of the handlers
   # use this.
   application_path = getattr(args, 'application', None)
@@ -35,9 +35,11 @@ the API is returned.
 # pylint: disable=g-statement-before-imports,g-import-not-at-top
 from __future__ import absolute_import
 
+import hashlib
 import json
 import logging
 import re
+import types
 
 from google.appengine.api import app_identity
 
@@ -1089,7 +1091,8 @@ class _MethodInfo(object):
   def __init__(self, name=None, path=None, http_method=None,
                scopes=None, audiences=None, allowed_client_ids=None,
                auth_level=None, api_key_required=None, request_body_class=None,
-               request_params_class=None, metric_costs=None, use_request_uri=None):
+               request_params_class=None, metric_costs=None, use_request_uri=None,
+               compress_response=None, etag=None):
     """Constructor.
 
     Args:
@@ -1109,6 +1112,10 @@ class _MethodInfo(object):
       metric_costs: dict with keys matching an API limit metric and values
         representing the cost for each successful call against that metric.
       use_request_uri: if true, match requests against REQUEST_URI instead of PATH_INFO
+      compress_response: bool, whether responses may be compressed for clients
+        that accept it.
+      etag: A function that takes the request message and returns a string
+        that identifies the response, such as a version number, or None.
     """
     self.__name = name
     self.__path = path
@@ -1122,6 +1129,9 @@ class _MethodInfo(object):
     self.__request_params_class = request_params_class
     self.__metric_costs = metric_costs
     self.__use_request_uri = use_request_uri
+    self.__compress_response = compress_response
+    self.__etag = etag
+    self.__auth_policies = {}
 
   def __safe_name(self, method_name):
     """Restrict method name to a-zA-Z0-9_, first char lowercase."""
@@ -1218,6 +1228,16 @@ class _MethodInfo(object):
     """Dict mapping API limit metric names to costs against that metric."""
     return self.__metric_costs
 
+  @property
+  def compress_response(self):
+    """bool whether responses may be compressed, or None for the default."""
+    return self.__compress_response
+
+  @property
+  def etag(self):
+    """Function that computes the ETag of a response from the request."""
+    return self.__etag
+
   @property
   def request_body_class(self):
     """Type of request body when using a ResourceContainer."""
@@ -1228,6 +1248,36 @@ class _MethodInfo(object):
     """Type of request parameter message when using a ResourceContainer."""
     return self.__request_params_class
 
+  def get_auth_policy(self, api_info):
+    """Get the auth settings that apply to calls to this method.
+
+    Settings on the method override the API's.  The merged settings are
+    computed once per api_info and reused on every request, so changes to the
+    API's settings after the first request aren't seen.
+
+    Args:
+      api_info: API information for this API, or None to use only the
+        method's settings.
+
+    Returns:
+      A users_id_token._AuthPolicy.
+    """
+    policy = self.__auth_policies.get(api_info)
+    if policy is None:
+      if api_info is None:
+        policy = users_id_token._AuthPolicy.create(  # pylint: disable=protected-access
+            self.scopes, self.audiences, self.allowed_client_ids, None)
+      else:
+        policy = users_id_token._AuthPolicy.create(  # pylint: disable=protected-access
+            self.scopes if self.scopes is not None else api_info.scopes,
+            (self.audiences if self.audiences is not None
+             else api_info.audiences),
+            (self.allowed_client_ids if self.allowed_client_ids is not None
+             else api_info.allowed_client_ids),
+            api_info.issuers)
+      self.__auth_policies[api_info] = policy
+    return policy
+
   def is_api_key_required(self, api_info):
     if self.api_key_required is not None:
       return self.api_key_required
@@ -1265,7 +1315,9 @@ def method(request_message=message_types.VoidMessage,
            auth_level=None,
            api_key_required=None,
            metric_costs=None,
-           use_request_uri=None):
+           use_request_uri=None,
+           compress_response=None,
+           etag=None):
   """Decorate a ProtoRPC Method for use by the framework above.
 
   This decorator can be used to specify a method name, path, http method,
@@ -1294,6 +1346,19 @@ def method(request_message=message_types.VoidMessage,
     metric_costs: dict with keys matching an API limit metric and values
       representing the cost for each successful call against that metric.
     use_request_uri: if true, match requests against REQUEST_URI instead of PATH_INFO
+    compress_response: bool, whether responses may be compressed for clients
+      that accept it.  Set to False for responses that are already compressed
+      or that mustn't be buffered by the client.  (Default: True)
+    etag: A function that takes the request message and returns a string that
+      changes whenever the response does, such as a version number, or None to
+      use a hash of the response.  A hash can't be sent before a streamed
+      (prettyPrint=false) response, so those only have one when the request
+      has If-None-Match.  It's used as the ETag of responses to GET
+      requests, and a request whose If-None-Match matches it gets a 304.
+      That's sent without calling the method only if the method is public:
+      its scopes and allowed_client_ids, which have defaults, are set to
+      empty lists, and it has no audiences or auth_level.  Otherwise the
+      method is called first, so its auth checks run.
 
   Returns:
     'apiserving_method_wrapper' function.
@@ -1362,6 +1427,7 @@ def method(request_message=message_types.VoidMessage,
         allowed_client_ids=allowed_client_ids, auth_level=auth_level,
         api_key_required=api_key_required, metric_costs=metric_costs,
         use_request_uri=use_request_uri,
+        compress_response=compress_response, etag=etag,
         request_body_class=request_body_class,
         request_params_class=request_params_class)
     invoke_remote.__name__ = invoke_remote.method_info.name
@@ -1375,10 +1441,102 @@ def method(request_message=message_types.VoidMessage,
   _CheckAudiences(audiences)
 
   _CheckType(metric_costs, dict, 'metric_costs')
+  _CheckType(compress_response, bool, 'compress_response')
+  if etag is not None and not callable(etag):
+    raise TypeError('etag must be callable.')
 
   return apiserving_method_decorator
 
 
+def _fingerprint_value(value):
+  """Returns a stable representation of a setting, for a config fingerprint.
+
+  Args:
+    value: An API or method setting, such as a list of scopes, an Issuer, a
+      function or a message class.
+
+  Returns:
+    A value made of builtin types, whose repr doesn't depend on object ids or
+    dict ordering.
+  """
+  if value is None or isinstance(value, (basestring, bool, int, long, float)):
+    return value
+  if isinstance(value, (list, tuple)):
+    return tuple(_fingerprint_value(item) for item in value)
+  if isinstance(value, (set, frozenset)):
+    return tuple(sorted(_fingerprint_value(item) for item in value))
+  if isinstance(value, dict):
+    return tuple(sorted((_fingerprint_value(key), _fingerprint_value(item))
+                        for key, item in value.iteritems()))
+  if isinstance(value, type):
+    # Message and enum definitions are recorded by _fingerprint_message_type.
+    return ('class', value.__module__, value.__name__)
+  if isinstance(value, (types.FunctionType, types.MethodType)):
+    return ('function', value.__module__, value.__name__)
+  if hasattr(value, '__dict__'):
+    return (type(value).__name__, _fingerprint_value(vars(value)))
+  if hasattr(value, '__slots__'):
+    return (type(value).__name__,
+            tuple(_fingerprint_value(getattr(value, name, None))
+                  for name in value.__slots__))
+  return repr(value)
+
+
+# Maps (class, excluded names) to the sorted names of the class's public
+# properties, since finding them is slower than reading them.
+_fingerprint_property_names = {}
+
+
+def _fingerprint_properties(obj, exclude=()):
+  """Returns the stable representation of an object's public properties."""
+  cls = type(obj)
+  names = _fingerprint_property_names.get((cls, exclude))
+  if names is None:
+    names = tuple(
+        name for name in sorted(dir(cls))
+        if isinstance(getattr(cls, name), property) and
+        not name.startswith('_') and name not in exclude)
+    _fingerprint_property_names[(cls, exclude)] = names
+  return tuple((name, _fingerprint_value(getattr(obj, name)))
+               for name in names)
+
+
+def _fingerprint_message_type(message_type, seen):
+  """Records the definitions of a message or enum type and the types it uses.
+
+  Args:
+    message_type: A messages.Message or messages.Enum subclass.
+    seen: A dict mapping the types already recorded to their definitions.
+      This is updated.
+  """
+  if message_type in seen:
+    return
+  if issubclass(message_type, messages.Enum):
+    seen[message_type] = (message_type.definition_name(), message_type.__doc__,
+                          tuple(sorted(message_type.to_dict().iteritems())))
+    return
+  # Recorded before the fields, so recursive messages terminate.
+  seen[message_type] = None
+  fields = []
+  for field in sorted(message_type.all_fields(), key=lambda f: f.number):
+    field_type = None
+    if isinstance(field, messages.MessageField):
+      # Not field.type, which is the Python type for a DateTimeField.
+      field_type = field.message_type
+    elif isinstance(field, messages.EnumField):
+      field_type = field.type
+    if field_type is not None:
+      _fingerprint_message_type(field_type, seen)
+    default = field.default
+    if isinstance(default, messages.Enum):
+      default = default.name
+    fields.append((field.name, field.number, type(field).__name__,
+                   str(field.variant), field.required, field.repeated,
+                   _fingerprint_value(default), _fingerprint_value(field_type)))
+  seen[message_type] = (message_type.definition_name(), message_type.__doc__,
+                        tuple(fields))
+
+
 class ApiConfigGenerator(object):
   """Generates an API configuration from a ProtoRPC service.
 
@@ -1955,6 +2113,9 @@ class ApiConfigGenerator(object):
 
     descriptor['useRequestUri'] = method_info.use_request_uri(service.api_info)
 
+    if method_info.compress_response is not None:
+      descriptor['compressResponse'] = method_info.compress_response
+
     return descriptor
 
   def __schema_descriptor(self, services):
@@ -2245,6 +2406,69 @@ class ApiConfigGenerator(object):
 
     return self.__api_descriptor(services, hostname=hostname)
 
+  def get_config_fingerprint(self, services, hostname=None):
+    """A fingerprint of everything get_config_dict's result depends on.
+
+    This covers the API and method settings, the docstrings used as
+    descriptions, and every field of the messages the methods use, as well as
+    the hostname and the version of this library.  Comparing fingerprints is
+    much cheaper than generating a config, so a config saved with its
+    fingerprint can be reused while the fingerprint still matches.
+
+    Args:
+      services: Either a single protorpc.remote.Service or a list of them
+        that implements an api/version.
+      hostname: string, Hostname of the API, to override the value set on the
+        current service. Defaults to None.
+
+    Returns:
+      A string, the hex SHA-256 fingerprint.
+    """
+    # pylint: disable=g-import-not-at-top
+    from . import __version__ as endpoints_version
+    if not isinstance(services, (tuple, list)):
+      services = [services]
+    message_types_seen = {}
+    services_state = []
+    for service in services:
+      api_info = service.api_info
+      methods_state = []
+      for name, method in sorted(service.all_remote_methods().iteritems()):
+        method_info = getattr(method, 'method_info', None)
+        remote_info = method.remote
+        # For a ResourceContainer, the request type combines the body and
+        # parameter fields.
+        method_types = [remote_info.request_type, remote_info.response_type]
+        if method_info is None:
+          info_state = None
+        else:
+          info_state = (
+              _fingerprint_properties(
+                  method_info,
+                  exclude=('request_body_class', 'request_params_class')),
+              method_info.get_path(api_info),
+              method_info.method_id(api_info),
+              method_info.use_request_uri(api_info),
+              method_info.is_api_key_required(api_info))
+        for message_type in method_types:
+          _fingerprint_message_type(message_type, message_types_seen)
+        methods_state.append((
+            name, remote_info.method.__doc__, info_state,
+            [_fingerprint_value(message_type) for message_type in method_types]))
+      services_state.append((
+          service.__module__, service.__name__, service.__doc__,
+          _fingerprint_properties(api_info, exclude=('hostname',)),
+          methods_state))
+    # The hostname is resolved the way get_descriptor_defaults does, so a
+    # config generated with an explicit hostname matches one generated where
+    # the hostname is the app's.
+    merged_api_info = self.__get_merged_api_info(services)
+    hostname = (hostname or endpoints_util.get_app_hostname() or
+                merged_api_info.hostname)
+    state = (endpoints_version, hostname, services_state,
+             sorted(message_types_seen.itervalues()))
+    return hashlib.sha256(repr(state)).hexdigest()
+
   def pretty_print_config_to_json(self, services, hostname=None):
     """JSON string description of a protorpc.remote.Service in API format.
 
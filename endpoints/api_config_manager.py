@@ -18,9 +18,11 @@
 from __future__ import absolute_import
 
 import base64
+import collections
 import logging
 import re
 import threading
+import time
 import urllib
 
 from . import discovery_service
@@ -30,15 +32,308 @@ _logger = logging.getLogger(__name__)
 # Internal constants
 _PATH_VARIABLE_PATTERN = r'[a-zA-Z_][a-zA-Z_.\d]*'
 _PATH_VALUE_PATTERN = r'[^/?#\[\]{}]*'
+_PATH_VARIABLE_SEGMENT_RE = re.compile('^{(%s)}$' % _PATH_VARIABLE_PATTERN)
+_INVALID_PATH_VALUE_CHARS = frozenset('/?#[]{}')
+# A constant path segment containing any of these is compiled as a regex, the
+# same way _compile_path_pattern would treat it.
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+# How long a failed lookup is remembered by the route cache.
+_DEFAULT_NEGATIVE_ROUTE_TTL_SECS = 30
+
+
+class _RestRoute(object):
+  """A saved path pattern and the methods that can be reached through it."""
+
+  def __init__(self, index, path_pattern, variables):
+    """Constructor for _RestRoute.
+
+    Args:
+      index: An int, the priority of this route.  Lower values win when more
+        than one route matches a request.
+      path_pattern: A string, the parameterized path pattern of the route.
+      variables: A list of (segment position, variable name) tuples for the
+        path segments that consist of a single variable.
+    """
+    self.index = index
+    self.path_pattern = path_pattern
+    self.variables = variables
+    # A dict of lowercase httpMethod => (method_name, method).
+    self.methods = {}
+
+
+class _RouteNode(object):
+  """A node in the path segment trie used to look up REST methods."""
+
+  def __init__(self, min_index):
+    # The lowest route index found in this node or below it.
+    self.min_index = min_index
+    # A dict of constant segment => _RouteNode.
+    self.constants = {}
+    # The _RouteNode reached through a segment that is a single variable.
+    self.variable = None
+    # A list of (compiled segment regex, _RouteNode) for segments that can
+    # only be matched with a regex, such as '{id}:action'.
+    self.patterns = []
+    # The _RestRoutes whose path pattern ends at this node, by index.
+    self.routes = []
+
+
+class _PathTrie(object):
+  """Segment trie mapping request paths to the REST methods that serve them.
+
+  Path patterns are split on '/' and stored one segment per level, so a
+  lookup only visits the nodes along the request path instead of trying
+  every pattern in turn.  Every route remembers the order in which it was
+  added, and when several patterns match the same path the earliest one wins,
+  exactly as when the patterns were scanned in order.
+
+  A _PathTrie is never modified once ApiConfigManager has published it, so
+  lookups don't need a lock.  Changes are made to a copy, which then replaces
+  the published trie.
+  """
+
+  def __init__(self):
+    self._root = _RouteNode(0)
+    self._routes = {}
+    self.uses_request_uri = False
+
+  def add(self, path_pattern, http_method, method_name, method):
+    """Add a method to the trie.
+
+    Args:
+      path_pattern: A string, the full parameterized path of the method.
+      http_method: A string, the lowercase HTTP method of the method.
+      method_name: A string containing the name of the API method.
+      method: A dict containing the method descriptor (as in the api config
+        file).
+    """
+    route = self._routes.get(path_pattern)
+    if route is None:
+      route = self._add_route(path_pattern)
+    route.methods[http_method] = method_name, method
+    if method.get('useRequestUri'):
+      self.uses_request_uri = True
+
+  def copy(self):
+    """Return a new _PathTrie with the same routes, in the same order."""
+    trie = _PathTrie()
+    for route in sorted(self._routes.itervalues(), key=lambda r: r.index):
+      for http_method, (method_name, method) in route.methods.iteritems():
+        trie.add(route.path_pattern, http_method, method_name, method)
+    return trie
+
+  def _add_route(self, path_pattern):
+    """Create the nodes for a new path pattern and return its _RestRoute."""
+    index = len(self._routes)
+    node = self._root
+    variables = []
+    for position, segment in enumerate(path_pattern.split('/')):
+      variable_match = _PATH_VARIABLE_SEGMENT_RE.match(segment)
+      if variable_match:
+        variables.append((position, variable_match.group(1)))
+        if node.variable is None:
+          node.variable = _RouteNode(index)
+        node = node.variable
+      elif _REGEX_SPECIAL_CHARS.intersection(segment):
+        segment_regex = ApiConfigManager._compile_path_segment(segment)
+        for existing_regex, child in node.patterns:
+          if existing_regex.pattern == segment_regex.pattern:
+            node = child
+            break
+        else:
+          child = _RouteNode(index)
+          node.patterns.append((segment_regex, child))
+          node = child
+      else:
+        child = node.constants.get(segment)
+        if child is None:
+          child = node.constants[segment] = _RouteNode(index)
+        node = child
+
+    route = _RestRoute(index, path_pattern, variables)
+    node.routes.append(route)
+    self._routes[path_pattern] = route
+    return route
+
+  def lookup(self, path, request_uri, http_method):
+    """Find the method that serves a request.
+
+    Args:
+      path: A string containing the path from the URL of the request.
+      request_uri: A string containing the raw request URI, used for methods
+        with useRequestUri set, or None.
+      http_method: A string, the lowercase HTTP method of the request.
+
+    Returns:
+      A tuple of (method_name, method, params), or None if no method matches.
+    """
+    found = self._find(path, http_method, False)
+    if self.uses_request_uri and request_uri is not None:
+      uri_found = self._find(request_uri, http_method, True)
+      if uri_found and (not found or uri_found[0].index < found[0].index):
+        found = uri_found
+    if not found:
+      return None
+
+    route, segments, segment_matches = found
+    params = {}
+    for position, var_name in route.variables:
+      params[var_name] = urllib.unquote_plus(segments[position])
+    for match in segment_matches:
+      params.update(ApiConfigManager._get_path_params(match))
+    method_name, method = route.methods[http_method]
+    return method_name, method, params
+
+  def _find(self, path, http_method, use_request_uri):
+    """Find the highest priority route matching a path.
+
+    Args:
+      path: A string, the path to match.
+      http_method: A string, the lowercase HTTP method of the request.
+      use_request_uri: A boolean, only consider methods whose useRequestUri
+        setting matches this value.
+
+    Returns:
+      A tuple of (_RestRoute, path segments, regex matches for the segments
+      matched by regex), or None if no route matches.
+    """
+    segments = path.split('/')
+    num_segments = len(segments)
+    best = None
+    stack = [(self._root, 0, ())]
+    while stack:
+      node, position, segment_matches = stack.pop()
+      if best is not None and node.min_index >= best[0].index:
+        continue
+
+      # Patterns accept a single optional trailing slash, which shows up here
+      # as an empty last segment.
+      if (position == num_segments or
+          (position == num_segments - 1 and not segments[position])):
+        for route in node.routes:
+          if best is not None and route.index >= best[0].index:
+            break
+          method_info = route.methods.get(http_method)
+          if (method_info and
+              bool(method_info[1].get('useRequestUri')) == use_request_uri):
+            best = route, segments, segment_matches
+            break
+        if position == num_segments:
+          continue
+
+      segment = segments[position]
+      if node.variable is not None and _INVALID_PATH_VALUE_CHARS.isdisjoint(
+          segment):
+        stack.append((node.variable, position + 1, segment_matches))
+      for segment_regex, child in node.patterns:
+        match = segment_regex.match(segment)
+        if match:
+          stack.append((child, position + 1, segment_matches + (match,)))
+      child = node.constants.get(segment)
+      if child is not None:
+        stack.append((child, position + 1, segment_matches))
+    return best
+
+
+class _RouteCache(object):
+  """Bounded LRU cache of lookup_rest_method results.
+
+  Failed lookups are cached too, but only for a limited time.
+  """
+
+  def __init__(self, max_size, negative_ttl):
+    """Constructor for _RouteCache.
+
+    Args:
+      max_size: An int, the maximum number of entries to keep.
+      negative_ttl: A number, the seconds to remember a failed lookup.
+    """
+    self._max_size = max_size
+    self._negative_ttl = negative_ttl
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    """Return the (result,) tuple cached for key, or None on a cache miss."""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        result, expiration_time = entry
+        if expiration_time is None or expiration_time > time.time():
+          # Re-insert to mark the entry as the most recently used.
+          self._entries[key] = entry
+          self.hits += 1
+          return (result,)
+      self.misses += 1
+      return None
+
+  def put(self, key, result):
+    """Cache a lookup result; a result of None is a failed lookup."""
+    expiration_time = None
+    if result is None:
+      expiration_time = time.time() + self._negative_ttl
+    with self._lock:
+      self._entries.pop(key, None)
+      self._entries[key] = result, expiration_time
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def info(self):
+    with self._lock:
+      return {'hits': self.hits, 'misses': self.misses,
+              'size': len(self._entries), 'max_size': self._max_size}
 
 
 class ApiConfigManager(object):
   """Manages loading api configs and method lookup."""
 
-  def __init__(self):
-    self._rest_methods = []
+  def __init__(self, route_cache_size=0,
+               negative_route_cache_ttl=_DEFAULT_NEGATIVE_ROUTE_TTL_SECS):
+    """Constructor for ApiConfigManager.
+
+    Args:
+      route_cache_size: An int, the number of resolved routes to keep in an
+        LRU cache in front of the route lookup.  0 disables the cache.
+      negative_route_cache_ttl: A number, the seconds that the route cache
+        remembers a request that didn't match any method.
+    """
+    # self._rest_methods and self._configs are snapshots: they are replaced,
+    # never modified, so readers can use them without holding a lock.
+    # self._config_lock only serializes writers.
+    self._rest_methods = _PathTrie()
     self._configs = {}
+    self._config_generation = 0
     self._config_lock = threading.Lock()
+    self._route_cache = None
+    if route_cache_size:
+      self._route_cache = _RouteCache(route_cache_size,
+                                      negative_route_cache_ttl)
+
+  def route_cache_info(self):
+    """Return statistics for the route cache.
+
+    Returns:
+      A dict with 'hits', 'misses', 'size' and 'max_size' keys, or None if the
+      route cache is disabled.
+    """
+    if self._route_cache is None:
+      return None
+    return self._route_cache.info()
+
+  @property
+  def config_generation(self):
+    """An int that changes whenever the configs change.
+
+    Lets callers cache values derived from the configs and notice when they
+    are stale.
+    """
+    return self._config_generation
 
   @property
   def configs(self):
@@ -47,8 +342,7 @@ class ApiConfigManager(object):
     Returns:
       A dict with the current configuration mappings.
     """
-    with self._config_lock:
-      return self._configs.copy()
+    return self._configs.copy()
 
   def process_api_config_response(self, config_json):
     """Parses a JSON API config and registers methods for dispatch.
@@ -61,20 +355,25 @@ class ApiConfigManager(object):
       config_json: A dict, the JSON body of the getApiConfigs response.
     """
     with self._config_lock:
-      self._add_discovery_config()
+      configs = self._configs.copy()
+      self._add_discovery_config(configs)
       for config in config_json.get('items', []):
         lookup_key = config.get('name', ''), config.get('version', '')
-        self._configs[lookup_key] = config
+        configs[lookup_key] = config
 
-      for config in self._configs.itervalues():
+      rest_methods = self._rest_methods.copy()
+      for config in configs.itervalues():
         name = config.get('name', '')
-        api_version = config.get('api_version', '')
         path_version = config.get('path_version', '')
         sorted_methods = self._get_sorted_methods(config.get('methods', {}))
 
-
         for method_name, method in sorted_methods:
-          self._save_rest_method(method_name, name, path_version, method)
+          self._add_rest_method(rest_methods, method_name, name, path_version,
+                                method)
+
+      self._configs = configs
+      self._config_generation += 1
+      self._publish_rest_methods(rest_methods)
 
   def _get_sorted_methods(self, methods):
     """Get a copy of 'methods' sorted the way they would be on the live server.
@@ -168,11 +467,13 @@ class ApiConfigManager(object):
   def lookup_rest_method(self, path, request_uri, http_method):
     """Look up the rest method at call time.
 
-    The method is looked up in self._rest_methods, the list it is saved
-    in for SaveRestMethod.
+    The method is looked up in self._rest_methods, the segment trie it is
+    saved in by _save_rest_method.
 
     Args:
       path: A string containing the path from the URL of the request.
+      request_uri: A string containing the raw request URI, used instead of
+        path for methods with useRequestUri set.
       http_method: A string containing HTTP method of the request.
 
     Returns:
@@ -183,33 +484,42 @@ class ApiConfigManager(object):
         <params> is a dict of path parameters matched in the rest request.
     """
     method_key = http_method.lower()
-    with self._config_lock:
-      for compiled_path_pattern, unused_path, methods in self._rest_methods:
-        if method_key not in methods:
-          continue
-        candidate_method_info = methods[method_key]
-        match_against = request_uri if candidate_method_info[1].get('useRequestUri') else path
-        match = compiled_path_pattern.match(match_against)
-        if match:
-          params = self._get_path_params(match)
-          method_name, method = candidate_method_info
-          break
-      else:
-        _logger.warn('No endpoint found for path: %r, method: %r', path, http_method)
-        method_name = None
-        method = None
-        params = None
-    return method_name, method, params
+    rest_methods = self._rest_methods
+    route_cache = self._route_cache
+    if route_cache is None:
+      result = rest_methods.lookup(path, request_uri, method_key)
+    else:
+      cache_key = (rest_methods, method_key, path,
+                   request_uri if rest_methods.uses_request_uri else None)
+      cached = route_cache.get(cache_key)
+      if cached is not None:
+        result, = cached
+        if result is None:
+          return None, None, None
+        method_name, method, params = result
+        # Callers get their own params dict, as with an uncached lookup.
+        return method_name, method, params.copy()
+      result = rest_methods.lookup(path, request_uri, method_key)
+      route_cache.put(cache_key, result)
+      if result is not None:
+        method_name, method, params = result
+        result = method_name, method, params.copy()
+
+    if result is None:
+      _logger.warn('No endpoint found for path: %r, method: %r', path, http_method)
+      return None, None, None
+    return result
 
-  def _add_discovery_config(self):
-    """Add the Discovery configuration to our list of configs.
+  @staticmethod
+  def _add_discovery_config(configs):
+    """Add the Discovery configuration to a dict of configs.
 
-    This should only be called with self._config_lock.  The code here assumes
-    the lock is held.
+    Args:
+      configs: A dict of configs, not yet published in self._configs.
     """
     lookup_key = (discovery_service.DiscoveryService.API_CONFIG['name'],
                   discovery_service.DiscoveryService.API_CONFIG['version'])
-    self._configs[lookup_key] = discovery_service.DiscoveryService.API_CONFIG
+    configs[lookup_key] = discovery_service.DiscoveryService.API_CONFIG
 
   def save_config(self, lookup_key, config):
     """Save a configuration to the cache of configs.
@@ -219,7 +529,10 @@ class ApiConfigManager(object):
       config: The dict containing the configuration to save to the cache.
     """
     with self._config_lock:
-      self._configs[lookup_key] = config
+      configs = self._configs.copy()
+      configs[lookup_key] = config
+      self._configs = configs
+      self._config_generation += 1
 
   @staticmethod
   def _to_safe_path_param_name(matched_parameter):
@@ -264,17 +577,17 @@ class ApiConfigManager(object):
     return base64.b32decode(safe_parameter_as_base32 + padding)
 
   @staticmethod
-  def _compile_path_pattern(pattern):
-    r"""Generates a compiled regex pattern for a path pattern.
+  def _replace_path_variables(pattern):
+    r"""Replaces the {variable}s in a path pattern with named regex groups.
 
     e.g. '/MyApi/v1/notes/{id}'
-    returns re.compile(r'/MyApi/v1/notes/(?P<id>[^/?#\[\]{}]*)')
+    returns r'/MyApi/v1/notes/(?P<_NFSA>[^/?#\[\]{}]*)'
 
     Args:
-      pattern: A string, the parameterized path pattern to be checked.
+      pattern: A string, the parameterized path pattern to be converted.
 
     Returns:
-      A compiled regex object to match this path pattern.
+      A string, the regex source for this path pattern.
     """
 
     def replace_variable(match):
@@ -299,36 +612,42 @@ class ApiConfigManager(object):
                                  _PATH_VALUE_PATTERN)
       return match.group(0)
 
-    pattern = re.sub('(/|^){(%s)}(?=/|$|:)' % _PATH_VARIABLE_PATTERN,
-                     replace_variable, pattern)
-    return re.compile(pattern + '/?$')
+    return re.sub('(/|^){(%s)}(?=/|$|:)' % _PATH_VARIABLE_PATTERN,
+                  replace_variable, pattern)
+
+  @staticmethod
+  def _compile_path_pattern(pattern):
+    r"""Generates a compiled regex pattern for a path pattern.
+
+    e.g. '/MyApi/v1/notes/{id}'
+    returns re.compile(r'/MyApi/v1/notes/(?P<id>[^/?#\[\]{}]*)')
+
+    Args:
+      pattern: A string, the parameterized path pattern to be checked.
+
+    Returns:
+      A compiled regex object to match this path pattern.
+    """
+    return re.compile(ApiConfigManager._replace_path_variables(pattern) +
+                      '/?$')
+
+  @staticmethod
+  def _compile_path_segment(segment):
+    """Generates a compiled regex pattern for a single path pattern segment.
+
+    This is used for the segments that the segment trie can't match as a
+    constant or as a single variable, e.g. '{id}:action'.
+
+    Args:
+      segment: A string, one '/'-delimited part of a path pattern.
+
+    Returns:
+      A compiled regex object to match this segment.
+    """
+    return re.compile(ApiConfigManager._replace_path_variables(segment) + '$')
 
   def _save_rest_method(self, method_name, api_name, version, method):
-    """Store Rest api methods in a list for lookup at call time.
-
-    The list is self._rest_methods, a list of tuples:
-      [(<compiled_path>, <path_pattern>, <method_dict>), ...]
-    where:
-      <compiled_path> is a compiled regex to match against the incoming URL
-      <path_pattern> is a string representing the original path pattern,
-        checked on insertion to prevent duplicates.     -and-
-      <method_dict> is a dict of httpMethod => (method_name, method)
-
-    This structure is a bit complex, it supports use in two contexts:
-      Creation time:
-        - SaveRestMethod is called repeatedly, each method will have a path,
-          which we want to be compiled for fast lookup at call time
-        - We want to prevent duplicate incoming path patterns, so store the
-          un-compiled path, not counting on a compiled regex being a stable
-          comparison as it is not documented as being stable for this use.
-        - Need to store the method that will be mapped at calltime.
-        - Different methods may have the same path but different http method.
-      Call time:
-        - Quickly scan through the list attempting .match(path) on each
-          compiled regex to find the path that matches.
-        - When a path is matched, look up the API method from the request
-          and get the method name and method config for the matching
-          API method and method name.
+    """Store a single Rest api method for lookup at call time.
 
     Args:
       method_name: A string containing the name of the API method.
@@ -337,14 +656,51 @@ class ApiConfigManager(object):
       method: A dict containing the method descriptor (as in the api config
         file).
     """
+    with self._config_lock:
+      rest_methods = self._rest_methods.copy()
+      self._add_rest_method(rest_methods, method_name, api_name, version,
+                            method)
+      self._publish_rest_methods(rest_methods)
+
+  def _publish_rest_methods(self, rest_methods):
+    """Replace the published route trie and invalidate the route cache.
+
+    This should only be called with self._config_lock held.
+
+    Args:
+      rest_methods: The new _PathTrie.
+    """
+    self._rest_methods = rest_methods
+    if self._route_cache is not None:
+      # Entries are keyed by the trie they were looked up in, so this only
+      # frees memory; a stale entry can't be returned for the new trie.
+      self._route_cache.clear()
+
+  @staticmethod
+  def _add_rest_method(rest_methods, method_name, api_name, version, method):
+    """Store Rest api methods in a segment trie for lookup at call time.
+
+    The trie is a _PathTrie that becomes self._rest_methods.  Each path
+    pattern is split on '/' and every segment becomes one level of the trie:
+      - constant segments are looked up in a dict,
+      - segments that are a single {variable} share one wildcard child, and
+      - anything else (e.g. '{id}:action') is matched with a small regex.
+
+    Each distinct path pattern is stored once, as a _RestRoute holding a dict
+    of httpMethod => (method_name, method), so different methods may share a
+    path with different http methods.  Routes are numbered in the order they
+    are saved; methods are saved in the order returned by _get_sorted_methods,
+    and when several routes match a request the lowest numbered one wins.
+
+    Args:
+      rest_methods: The _PathTrie to add the method to.  This must not be the
+        published self._rest_methods.
+      method_name: A string containing the name of the API method.
+      api_name: A string containing the name of the API.
+      version: A string containing the version of the API.
+      method: A dict containing the method descriptor (as in the api config
+        file).
+    """
     path_pattern = '/'.join((api_name, version, method.get('path', '')))
     http_method = method.get('httpMethod', '').lower()
-    for _, path, methods in self._rest_methods:
-      if path == path_pattern:
-        methods[http_method] = method_name, method
-        break
-    else:
-      self._rest_methods.append(
-          (self._compile_path_pattern(path_pattern),
-           path_pattern,
-           {http_method: (method_name, method)}))
+    rest_methods.add(path_pattern, http_method, method_name, method)
@@ -68,9 +68,8 @@ import os
 
 from google.appengine.api import app_identity
 
-from endpoints_management.control import client as control_client
-from endpoints_management.control import wsgi as control_wsgi
 from protorpc.wsgi import service as wsgi_service
+from protorpc.wsgi import util as wsgi_util
 
 from . import api_config
 from . import api_exceptions
@@ -79,19 +78,29 @@ from . import message_types
 from . import messages
 from . import protojson
 from . import remote
+from . import startup_trace
+from . import users_id_token
 from . import util
 
 _logger = logging.getLogger(__name__)
 package = 'google.appengine.endpoints'
 
+# api_server() arguments that configure EndpointsDispatcherMiddleware.
+_DISPATCHER_OPTIONS = ('pretty_print', 'compression_level',
+                       'compression_min_size', 'handle_warmup')
+
 
 __all__ = [
     'ApiConfigRegistry',
     'api_server',
     'EndpointsErrorMessage',
+    'get_startup_report',
     'package',
 ]
 
+# The StartupReport of the last api_server call.
+_startup_report = None
+
 
 class _Remapped405Exception(api_exceptions.ServiceException):
   """Method Not Allowed (405) ends up being remapped to 501.
@@ -164,6 +173,59 @@ class EndpointsErrorMessage(messages.Message):
   error_message = messages.StringField(2)
 
 
+def _read_config_cache(path):
+  """Read the API configs saved in a config cache file.
+
+  Args:
+    path: The path of the file written by _write_config_cache.
+
+  Returns:
+    A dict mapping config fingerprints, from
+    ApiConfigGenerator.get_config_fingerprint, to API configs.  It's empty if
+    the file doesn't exist or can't be parsed.
+  """
+  try:
+    with open(path) as cache_file:
+      cache = json.load(cache_file)
+  except IOError:
+    return {}
+  except ValueError:
+    _logger.warning('Ignoring the API config cache in %s, which isn\'t valid '
+                    'JSON.', path)
+    return {}
+  configs = cache.get('configs') if isinstance(cache, dict) else None
+  return configs if isinstance(configs, dict) else {}
+
+
+def _write_config_cache(path, configs):
+  """Save API configs to a config cache file.
+
+  The file is replaced atomically, so a process starting at the same time
+  never reads a partly written file.  Failing to write it, such as on a
+  read-only file system, is logged but isn't an error.
+
+  Args:
+    path: The path of the file.
+    configs: A dict mapping config fingerprints to API configs.
+
+  Returns:
+    True if the file was written.
+  """
+  temp_path = '%s.%d.tmp' % (path, os.getpid())
+  try:
+    with open(temp_path, 'w') as cache_file:
+      json.dump({'configs': configs}, cache_file, sort_keys=True)
+    os.rename(temp_path, path)
+  except (IOError, OSError) as e:
+    _logger.warning('Couldn\'t save the API config cache to %s: %s', path, e)
+    try:
+      os.remove(temp_path)
+    except OSError:
+      pass
+    return False
+  return True
+
+
 # pylint: disable=g-bad-name
 def _get_app_revision(environ=None):
   """Gets the app revision (minor app version) of the current app.
@@ -297,7 +359,7 @@ class _ApiServer(object):
   # EndpointsProtoJson looks to be thread safe.
   __PROTOJSON = protojson.EndpointsProtoJson()
 
-  def __init__(self, api_services, **kwargs):
+  def __init__(self, api_services, config_cache=None, **kwargs):
     """Initialize an _ApiServer instance.
 
     The primary function of this method is to set up the WSGIApplication
@@ -309,6 +371,9 @@ class _ApiServer(object):
       api_services: List of protorpc.remote.Service classes implementing the API
         or a list of _ApiDecorator instances that decorate the service classes
         for an API.
+      config_cache: The path of a file to load API configs from, instead of
+        generating them, or None.  A config is only used while the fingerprint
+        of its API matches, and the file is rewritten when one doesn't.
       **kwargs: Passed through to protorpc.wsgi.service.service_handlers except:
         protocols - ProtoRPC protocols are not supported, and are disallowed.
 
@@ -332,9 +397,25 @@ class _ApiServer(object):
       self.base_paths.add(entry.api_info.base_path)
 
     self.api_config_registry = ApiConfigRegistry()
-    self.api_name_version_map = self.__create_name_version_map(api_services)
-    protorpc_services = self.__register_services(self.api_name_version_map,
-                                                 self.api_config_registry)
+    with startup_trace.trace('map_api_versions'):
+      self.api_name_version_map = self.__create_name_version_map(api_services)
+    with startup_trace.trace('register_services'):
+      protorpc_services = self.__register_services(self.api_name_version_map,
+                                                   self.api_config_registry,
+                                                   config_cache)
+    # Map each service path to its factory and remote methods, so that
+    # call_api_method can find a method without going through service_app.
+    self.__remote_services = dict(
+        (root, (service_factory,
+                service_factory.service_class.all_remote_methods()))
+        for root, service_factory in protorpc_services)
+    # Merge each method's auth settings now rather than on its first request.
+    with startup_trace.trace('build_auth_policies'):
+      for service_class in api_services:
+        for remote_method in service_class.all_remote_methods().itervalues():
+          method_info = getattr(remote_method, 'method_info', None)
+          if method_info is not None:
+            method_info.get_auth_policy(service_class.api_info)
 
     # Disallow protocol configuration for now, Lily is json-only.
     if 'protocols' in kwargs:
@@ -348,8 +429,33 @@ class _ApiServer(object):
     # so it doesn't result in an unexpected keyword argument downstream.
     kwargs.pop('restricted', None)
 
-    self.service_app = wsgi_service.service_mappings(protorpc_services,
-                                                     **kwargs)
+    with startup_trace.trace('create_protorpc_app'):
+      self.service_app = wsgi_service.service_mappings(protorpc_services,
+                                                       **kwargs)
+
+  def warm(self):
+    """Fetch the certs of the auth issuers the APIs accept.
+
+    Everything else the backend needs to serve requests is built by the
+    constructor.
+    """
+    users_id_token._warm_certs(self.get_cert_uris())  # pylint: disable=protected-access
+
+  def get_cert_uris(self):
+    """Get the URIs of the certs of the auth issuers the APIs accept.
+
+    Returns:
+      A sorted list of cert URIs, including the default Google issuer's.
+    """
+    # pylint: disable=protected-access
+    cert_uris = set(
+        users_id_token.convert_jwks_uri(issuer.jwks_uri)
+        for issuer in users_id_token._DEFAULT_GOOGLE_ISSUER.itervalues())
+    for service in self.api_services:
+      service_class = getattr(service, 'service_class', service)
+      for issuer in (service_class.api_info.issuers or {}).itervalues():
+        cert_uris.add(users_id_token.convert_jwks_uri(issuer.jwks_uri))
+    return sorted(cert_uris)
 
   @staticmethod
   def __create_name_version_map(api_services):
@@ -389,7 +495,8 @@ class _ApiServer(object):
     return api_name_version_map
 
   @staticmethod
-  def __register_services(api_name_version_map, api_config_registry):
+  def __register_services(api_name_version_map, api_config_registry,
+                          config_cache=None):
     """Register & return a list of each URL and class that handles that URL.
 
     This finds every service class in api_name_version_map, registers it with
@@ -401,6 +508,8 @@ class _ApiServer(object):
         service factories, as returned by __create_name_version_map.
       api_config_registry: The ApiConfigRegistry where service classes will
         be registered.
+      config_cache: The path of a file to load API configs from, or None to
+        generate them.
 
     Returns:
       A list of (URL, service_factory) for each service class in
@@ -412,11 +521,27 @@ class _ApiServer(object):
         implement multiple APIs.
     """
     generator = api_config.ApiConfigGenerator()
+    cached_configs = {}
+    if config_cache:
+      with startup_trace.trace('read_config_cache'):
+        cached_configs = _read_config_cache(config_cache)
+    configs = {}
     protorpc_services = []
     for service_factories in api_name_version_map.itervalues():
       service_classes = [service_factory.service_class
                          for service_factory in service_factories]
-      config_dict = generator.get_config_dict(service_classes)
+      config_dict = None
+      if config_cache:
+        with startup_trace.trace('fingerprint_config'):
+          fingerprint = generator.get_config_fingerprint(service_classes)
+        config_dict = cached_configs.get(fingerprint)
+        if config_dict is None:
+          _logger.info('API config cache miss for %s', service_classes)
+      if config_dict is None:
+        with startup_trace.trace('generate_config'):
+          config_dict = generator.get_config_dict(service_classes)
+      if config_cache:
+        configs[fingerprint] = config_dict
       api_config_registry.register_backend(config_dict)
 
       for service_factory in service_factories:
@@ -429,6 +554,9 @@ class _ApiServer(object):
               'Can\'t reuse the same class in multiple APIs: %s' %
               protorpc_class_name)
         protorpc_services.append((root, service_factory))
+    if config_cache and configs != cached_configs:
+      with startup_trace.trace('write_config_cache'):
+        _write_config_cache(config_cache, configs)
     return protorpc_services
 
   def __is_json_error(self, status, headers):
@@ -493,6 +621,214 @@ class _ApiServer(object):
                                           rpc_error.error_message)
     return status, body
 
+  def __transform_error_response(self, status, headers, body):
+    """Transform a ProtoRPC error response into the format used by endpoints.
+
+    Args:
+      status: A string, the HTTP status of the response.
+      headers: A list of (header, value) tuples.  The content-length header is
+        updated in place if the body changes.
+      body: A string, the body of the response.
+
+    Returns:
+      A tuple of (status, body).
+    """
+    headers_dict = dict([(k.lower(), v) for k, v in headers])
+    if self.__is_json_error(status, headers_dict):
+      status, body = self.protorpc_to_endpoints_error(status, body)
+      # If the content-length header is present, update it with the new
+      # body length.
+      if 'content-length' in headers_dict:
+        for index, (header_name, _) in enumerate(headers):
+          if header_name.lower() == 'content-length':
+            headers[index] = (header_name, str(len(body)))
+            break
+    return status, body
+
+  def __send_rpc_error(self, status_code, state, message, error_name=None):
+    """Build the response that service_app sends for an RPC error.
+
+    Args:
+      status_code: HTTP integer status code.
+      state: remote.RpcState enum value to send as response.
+      message: Helpful message to send in response.
+      error_name: Error name if applicable.
+
+    Returns:
+      A tuple of (status, headers, body).
+    """
+    rpc_status = remote.RpcStatus(state=state, error_message=message,
+                                  error_name=error_name)
+    error_app = wsgi_util.error(
+        status_code, content_type=self.__PROTOJSON.CONTENT_TYPE,
+        content=self.__PROTOJSON.encode_message(rpc_status))
+    with util.StartResponseProxy() as start_response_proxy:
+      body = ''.join(error_app(None, start_response_proxy.Proxy))
+      return (start_response_proxy.response_status,
+              start_response_proxy.response_headers, body)
+
+  def __call_remote_method(self, service_path, service_factory, method,
+                           payload, headers, source_ip, port):
+    """Decode the request, call a remote method and encode its response.
+
+    This follows what service_app does for a POST request with a JSON body.
+
+    Args:
+      service_path: A string, the path the service is mapped to.
+      service_factory: The factory that creates instances of the service.
+      method: The remote method to call.
+      payload: A dict of JSON serializable values, the request message.
+      headers: A list of (header, value) tuples, the request headers.
+      source_ip: The source IP address for the request.
+      port: The port to which the request was directed.
+
+    Returns:
+      A tuple of (status, headers, body).
+    """
+    remote_info = method.remote
+    try:
+      request = self.__PROTOJSON.decode_dictionary(remote_info.request_type,
+                                                   payload)
+    except (messages.ValidationError, messages.DecodeError), err:
+      return self.__send_rpc_error(
+          httplib.BAD_REQUEST, remote.RpcState.REQUEST_ERROR,
+          'Error parsing ProtoRPC request '
+          '(Unable to parse request content: %s)' % err)
+
+    instance = service_factory()
+
+    initialize_request_state = getattr(
+        instance, 'initialize_request_state', None)
+    if initialize_request_state:
+      # Normalize the header names the way a trip through a WSGI environ
+      # would.
+      environ_headers = {}
+      util.put_headers_in_environ(headers, environ_headers)
+      request_state = remote.HttpRequestState(
+          remote_address=source_ip,
+          server_port=int(port),
+          http_method='POST',
+          service_path=service_path,
+          headers=[(name[len('HTTP_'):].lower().replace('_', '-'), value)
+                   for name, value in environ_headers.iteritems()])
+      initialize_request_state(request_state)
+
+    try:
+      response = method(instance, request)
+      encoded_response = self.__PROTOJSON.encode_message(response)
+    except remote.ApplicationError, err:
+      return self.__send_rpc_error(
+          httplib.BAD_REQUEST, remote.RpcState.APPLICATION_ERROR,
+          unicode(err), err.error_name)
+    except Exception, err:  # pylint: disable=broad-except
+      _logger.exception('Encountered unexpected error from ProtoRPC '
+                        'method implementation: %s (%s)',
+                        err.__class__.__name__, err)
+      return self.__send_rpc_error(
+          httplib.INTERNAL_SERVER_ERROR, remote.RpcState.SERVER_ERROR,
+          'Internal Server Error')
+
+    return ('%d %s' % (httplib.OK, httplib.responses[httplib.OK]),
+            [('content-type', self.__PROTOJSON.CONTENT_TYPE)],
+            encoded_response)
+
+  def call_api_method(self, path, payload, headers, source_ip, port):
+    """Call a remote method in process, without going through service_app.
+
+    The response is the same as the one this app returns for a JSON POST
+    request to path with payload as its body, but the request isn't encoded
+    and parsed again, and no WSGI environ is built.
+
+    Args:
+      path: A string, the ProtoRPC path of the method, for example
+        '/_ah/api/MyService.list'.
+      payload: A dict of JSON serializable values, the request message.
+      headers: A list of (header, value) tuples, the request headers.
+      source_ip: The source IP address for the request.
+      port: The port to which the request was directed.
+
+    Returns:
+      A tuple of (status, headers, body), or None if path isn't a method that
+      can be called directly.  In that case the request should be sent
+      through this WSGI app instead.
+    """
+    remote_method = self.__find_remote_method(path)
+    if remote_method is None:
+      return None
+    service_path, service_factory, method = remote_method
+
+    environ = {}
+    util.put_headers_in_environ(headers, environ)
+    # pylint: disable=protected-access
+    with users_id_token._request_auth_context(environ):
+      status, headers, body = self.__call_remote_method(
+          service_path, service_factory, method, payload, headers, source_ip,
+          port)
+    status, body = self.__transform_error_response(status, headers, body)
+    return status, headers, body
+
+  def get_etag_function(self, path):
+    """Get the function that computes the ETag of a method's responses.
+
+    Args:
+      path: A string, the ProtoRPC path of the method, for example
+        '/_ah/api/MyService.list'.
+
+    Returns:
+      None if path isn't a method with an etag function.  Otherwise a function
+      that takes the request payload, a dict like call_api_method's, and
+      returns the quoted ETag of the response.  It returns None if the
+      payload isn't a valid request, or if the etag function returns None or
+      raises an exception, which is logged.
+    """
+    remote_method = self.__find_remote_method(path)
+    if remote_method is None:
+      return None
+    method = remote_method[2]
+    method_info = getattr(method, 'method_info', None)
+    etag_function = method_info and method_info.etag
+    if etag_function is None:
+      return None
+
+    def get_etag(payload):
+      try:
+        request = self.__PROTOJSON.decode_dictionary(
+            method.remote.request_type, payload)
+      except (messages.ValidationError, messages.DecodeError):
+        # Calling the method reports the error.
+        return None
+      try:
+        etag = etag_function(request)
+      except Exception:  # pylint: disable=broad-except
+        # The method is still called, and its ETag is computed from the body.
+        _logger.exception('Error computing the ETag of %s', path)
+        return None
+      if etag is None:
+        return None
+      return '"%s"' % etag
+
+    return get_etag
+
+  def __find_remote_method(self, path):
+    """Find the remote method mapped to a ProtoRPC path.
+
+    Args:
+      path: A string, the ProtoRPC path of the method.
+
+    Returns:
+      A tuple of (service_path, service_factory, method), or None if no method
+      is mapped to path.
+    """
+    service_path, _, method_name = path.partition('.')
+    remote_service = self.__remote_services.get(service_path)
+    if remote_service is None:
+      return None
+    service_factory, remote_methods = remote_service
+    method = remote_methods.get(method_name)
+    if method is None:
+      return None
+    return service_path, service_factory, method
+
   def get_api_configs(self):
     return {
         'items': self.api_config_registry.all_api_configs()}
@@ -508,12 +844,21 @@ class _ApiServer(object):
       Response from service_app or appropriately transformed error response.
     """
     # Call the ProtoRPC App and capture its response
-    with util.StartResponseProxy() as start_response_proxy:
+    # pylint: disable=protected-access
+    with util.StartResponseProxy() as start_response_proxy, \
+        users_id_token._request_auth_context(environ):
       body_iter = self.service_app(environ, start_response_proxy.Proxy)
       status = start_response_proxy.response_status
       headers = start_response_proxy.response_headers
       exception = start_response_proxy.response_exc_info
 
+      headers_dict = dict([(k.lower(), v) for k, v in headers])
+      if not self.__is_json_error(status, headers_dict):
+        # Only errors are transformed, so stream anything else through
+        # without buffering it.
+        start_response(status, headers, exception)
+        return start_response_proxy.get_response_body_iter(body_iter)
+
       # Get response body
       body = start_response_proxy.response_body
       # In case standard WSGI behavior is implemented later...
@@ -521,16 +866,7 @@ class _ApiServer(object):
         body = ''.join(body_iter)
 
     # Transform ProtoRPC error into format expected by endpoints.
-    headers_dict = dict([(k.lower(), v) for k, v in headers])
-    if self.__is_json_error(status, headers_dict):
-      status, body = self.protorpc_to_endpoints_error(status, body)
-      # If the content-length header is present, update it with the new
-      # body length.
-      if 'content-length' in headers_dict:
-        for index, (header_name, _) in enumerate(headers):
-          if header_name.lower() == 'content-length':
-            headers[index] = (header_name, str(len(body)))
-            break
+    status, body = self.__transform_error_response(status, headers, body)
 
     start_response(status, headers, exception)
     return [body]
@@ -553,9 +889,30 @@ def api_server(api_services, **kwargs):
       for an API.
     **kwargs: Passed through to protorpc.wsgi.service.service_handlers except:
       protocols - ProtoRPC protocols are not supported, and are disallowed.
+      pretty_print, compression_level, compression_min_size, handle_warmup -
+        Passed to EndpointsDispatcherMiddleware.
+      refresh_certs - If True, the certs of the auth issuers the APIs accept
+        are fetched on a background thread and refreshed before they expire.
+        Background threads can't outlive requests on automatically scaled
+        App Engine standard instances, so this defaults to False.
+      config_cache - The path of a file to keep the generated API configs
+        in, so they're loaded instead of generated when an instance starts.
+        `endpointscfg.py get_api_config_cache` generates it.
+      auth_cache - A cache for the certs of auth issuers and for verified
+        tokens, such as an endpoints.SharedMemoryCache shared by the worker
+        processes on a machine.  Defaults to memcache.  This applies to every
+        API in the process.
+      count_startup_allocations - If True, the startup report counts the
+        objects each phase of startup creates, which slows startup down.
+      prefork - If True, the app is served by processes forked after it's
+        created, as `endpointscfg.py serve` does, rather than on App Engine.
+        Service control then isn't started here.  Each process starts it
+        on a standard thread by calling the app's after_fork() method.
 
   Returns:
     A new WSGIApplication that serves the API backend and config registry.
+    Its warm() method does the work that's otherwise left to the first
+    requests; see EndpointsDispatcherMiddleware.warm.
 
   Raises:
     TypeError: if protocols are configured (this feature is not supported).
@@ -564,13 +921,59 @@ def api_server(api_services, **kwargs):
   if 'protocols' in kwargs:
     raise TypeError("__init__() got an unexpected keyword argument 'protocols'")
 
+  global _startup_report  # pylint: disable=global-statement
+  count_allocations = kwargs.pop('count_startup_allocations', False)
+  with startup_trace.start(count_allocations=count_allocations) as tracer:
+    with startup_trace.trace('api_server'):
+      app = _create_api_server(api_services, **kwargs)
+  _startup_report = tracer.report()
+  _logger.info('Endpoints startup took %.1f ms:\n%s',
+               _startup_report.seconds * 1000, _startup_report.format())
+  return app
+
+
+def get_startup_report():
+  """Get how long each phase of the last api_server call took.
+
+  Returns:
+    A startup_trace.StartupReport, or None if api_server hasn't been called.
+  """
+  return _startup_report
+
+
+def _create_api_server(api_services, **kwargs):
+  """Create an api_server, tracing each phase of startup.
+
+  Args:
+    api_services: The api_services passed to api_server.
+    **kwargs: The kwargs passed to api_server, except protocols.
+
+  Returns:
+    A new WSGIApplication that serves the API backend and config registry.
+  """
   from . import _logger as endpoints_logger
   from . import __version__ as endpoints_version
   endpoints_logger.info('Initializing Endpoints Framework version %s', endpoints_version)
 
+  dispatcher_kwargs = dict((key, kwargs.pop(key))
+                           for key in _DISPATCHER_OPTIONS if key in kwargs)
+  refresh_certs = kwargs.pop('refresh_certs', False)
+  auth_cache = kwargs.pop('auth_cache', None)
+  prefork = kwargs.pop('prefork', False)
+
   # Construct the api serving app
-  apis_app = _ApiServer(api_services, **kwargs)
-  dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware(apis_app)
+  with startup_trace.trace('create_api_server'):
+    apis_app = _ApiServer(api_services, **kwargs)
+  # pylint: disable=protected-access
+  if auth_cache is not None:
+    users_id_token._set_auth_cache(auth_cache)
+  if refresh_certs:
+    with startup_trace.trace('start_cert_refresh'):
+      users_id_token._start_cert_refresh(apis_app.get_cert_uris())
+  # pylint: enable=protected-access
+  with startup_trace.trace('create_dispatcher'):
+    dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+        apis_app, **dispatcher_kwargs)
 
   # Determine the service name
   service_name = os.environ.get('ENDPOINTS_SERVICE_NAME')
@@ -581,6 +984,13 @@ def api_server(api_services, **kwargs):
                  ' it.')
     return dispatcher
 
+  # endpoints_management is only imported when service control is enabled,
+  # since importing it takes longer than the rest of this package.
+  with startup_trace.trace('import_endpoints_management'):
+    # pylint: disable=g-import-not-at-top
+    from endpoints_management.control import client as control_client
+    from endpoints_management.control import wsgi as control_wsgi
+
   # If we're using a local server, just return the dispatcher now to bypass
   # control client.
   if control_wsgi.running_on_devserver():
@@ -594,13 +1004,22 @@ def api_server(api_services, **kwargs):
   # The DEFAULT 'config' should be tuned so that it's always OK for python
   # App Engine workloads.  The config can be adjusted, but that's probably
   # unnecessary on App Engine.
-  controller = control_client.Loaders.DEFAULT.load(service_name)
+  with startup_trace.trace('load_service_control'):
+    controller = control_client.Loaders.DEFAULT.load(service_name)
 
-  # Start the GAE background thread that powers the control client's cache.
-  control_client.use_gae_thread()
-  controller.start()
+  if not prefork:
+    # Start the GAE background thread that powers the control client's cache.
+    with startup_trace.trace('start_service_control'):
+      control_client.use_gae_thread()
+      controller.start()
 
-  return control_wsgi.add_all(
+  app = control_wsgi.add_all(
       dispatcher,
       app_identity.get_application_id(),
       controller)
+  app.warm = dispatcher.warm
+  if prefork:
+    # Threads don't survive a fork, and GAE background threads don't exist
+    # outside App Engine, so each worker starts a standard thread.
+    app.after_fork = controller.start
+  return app
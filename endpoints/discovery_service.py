@@ -17,16 +17,102 @@
 # pylint: disable=g-bad-name
 from __future__ import absolute_import
 
+import collections
 import json
 import logging
+import threading
 
 from . import api_config
-from . import directory_list_generator
-from . import discovery_generator
 from . import util
 
 _logger = logging.getLogger(__name__)
 
+# The number of generated documents DiscoveryDocumentCache keeps by default.
+_DEFAULT_DOCUMENT_CACHE_SIZE = 64
+
+
+class _Document(object):
+  """A generated discovery doc or directory list, ready to be sent."""
+
+  def __init__(self, body):
+    self.body = body
+    self.etag = util.compute_etag(body)
+    self._encoded_bodies = {}
+
+  def get_encoded_body(self, compression):
+    """Returns the body encoded by a util.ResponseCompression, only once."""
+    key = (compression.encoding, compression.level)
+    encoded_body = self._encoded_bodies.get(key)
+    if encoded_body is None:
+      encoded_body = compression.compress(self.body)
+      self._encoded_bodies[key] = encoded_body
+    return encoded_body
+
+
+class DiscoveryDocumentCache(object):
+  """Bounded LRU cache of generated discovery docs and directory lists.
+
+  Documents name the host they were requested through, so entries are keyed
+  by the root URL as well as the API.  All entries are dropped when the API
+  configs change.
+  """
+
+  def __init__(self, max_size=_DEFAULT_DOCUMENT_CACHE_SIZE):
+    """Constructor for DiscoveryDocumentCache.
+
+    Args:
+      max_size: An int, the maximum number of documents to keep.
+    """
+    self._max_size = max_size
+    self._entries = collections.OrderedDict()
+    self._generation = None
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key, generation):
+    """Return the document cached for key, or None on a cache miss.
+
+    Args:
+      key: A tuple identifying the document and the root URL.
+      generation: The ApiConfigManager.config_generation the document has to
+        have been generated from.
+
+    Returns:
+      A _Document, or None.
+    """
+    with self._lock:
+      if generation != self._generation:
+        self._entries.clear()
+        self._generation = generation
+      document = self._entries.pop(key, None)
+      if document is None:
+        self.misses += 1
+        return None
+      # Re-insert to mark the entry as the most recently used.
+      self._entries[key] = document
+      self.hits += 1
+      return document
+
+  def put(self, key, generation, document):
+    """Cache a document generated from the configs of a generation."""
+    with self._lock:
+      if generation != self._generation:
+        return
+      self._entries.pop(key, None)
+      self._entries[key] = document
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def info(self):
+    with self._lock:
+      return {'hits': self.hits, 'misses': self.misses,
+              'size': len(self._entries), 'max_size': self._max_size}
+
 
 class DiscoveryService(object):
   """Implements the local discovery service.
@@ -69,32 +155,75 @@ class DiscoveryService(object):
       }
   }
 
-  def __init__(self, config_manager, backend):
+  def __init__(self, config_manager, backend, document_cache=None):
     """Initializes an instance of the DiscoveryService.
 
     Args:
       config_manager: An instance of ApiConfigManager.
       backend: An _ApiServer instance for API config generation.
+      document_cache: A DiscoveryDocumentCache to keep generated documents
+        in, or None to generate them for every request.
     """
     self._config_manager = config_manager
     self._backend = backend
+    self._document_cache = document_cache
 
-  def _send_success_response(self, response, start_response):
+  def _get_document(self, key, generate):
+    """Gets a document from the cache, or generates it.
+
+    Args:
+      key: A tuple identifying the document and the root URL.
+      generate: A function that returns the document body, or None if it
+        can't be generated.
+
+    Returns:
+      A _Document, or None if the document can't be generated.
+    """
+    generation = self._config_manager.config_generation
+    if self._document_cache is not None:
+      document = self._document_cache.get(key, generation)
+      if document is not None:
+        return document
+    body = generate()
+    if not body:
+      return None
+    document = _Document(body)
+    if self._document_cache is not None:
+      self._document_cache.put(key, generation, document)
+    return document
+
+  def _send_success_response(self, document, request, start_response,
+                             compression=None):
     """Sends an HTTP 200 json success response.
 
-    This calls start_response and returns the response body.
+    This calls start_response and returns the response body.  The body is
+    compressed as compression says, and a 304 is sent instead if the client's
+    copy is current.
 
     Args:
-      response: A string containing the response body to return.
+      document: A _Document, the response body to return.
+      request: An ApiRequest, the transformed request sent to the Discovery API.
       start_response: A function with semantics defined in PEP-333.
+      compression: A util.ResponseCompression to compress the body with, or
+        None to send it uncompressed.
 
     Returns:
       A string, the response body.
     """
-    headers = [('Content-Type', 'application/json; charset=UTF-8')]
-    return util.send_wsgi_response('200 OK', headers, response, start_response)
-
-  def _get_rest_doc(self, request, start_response):
+    if util.etag_matches(request.headers.get('If-None-Match'), document.etag):
+      return util.send_wsgi_not_modified_response(
+          document.etag, start_response, compression=compression)
+    headers = [('Content-Type', 'application/json; charset=UTF-8'),
+               ('ETag', document.etag)]
+    body = document.body
+    if compression is not None:
+      # The encoded body is cached with the document, so it's only compressed
+      # once per encoding and level.
+      headers, body = compression.compress_response(
+          headers, body, lambda _: document.get_encoded_body(compression))
+    return util.send_wsgi_response('200 OK', headers, body, start_response)
+
+  def _get_rest_doc(self, request, start_response, compression=None):
     """Sends back HTTP response with API directory.
 
     This calls start_response and returns the response body.  It will return
@@ -103,6 +232,8 @@ class DiscoveryService(object):
     Args:
       request: An ApiRequest, the transformed request sent to the Discovery API.
       start_response: A function with semantics defined in PEP-333.
+      compression: A util.ResponseCompression to compress the doc with, or
+        None to send it uncompressed.
 
     Returns:
       A string, the response body.
@@ -110,16 +241,25 @@ class DiscoveryService(object):
     api = request.body_json['api']
     version = request.body_json['version']
 
-    generator = discovery_generator.DiscoveryGenerator(request=request)
-    services = [s for s in self._backend.api_services if
-                s.api_info.name == api and s.api_info.api_version == version]
-    doc = generator.pretty_print_config_to_json(services)
-    if not doc:
+    def generate():
+      # The generators are only imported when a discovery doc is requested.
+      from . import discovery_generator  # pylint: disable=g-import-not-at-top
+      generator = discovery_generator.DiscoveryGenerator(request=request)
+      services = [s for s in self._backend.api_services if
+                  s.api_info.name == api and s.api_info.api_version == version]
+      return generator.pretty_print_config_to_json(services)
+
+    # The doc depends on the request only through its root URL.
+    key = ('rest', api, version, request.url_scheme,
+           request.reconstruct_hostname())
+    document = self._get_document(key, generate)
+    if document is None:
       error_msg = ('Failed to convert .api to discovery doc for '
                    'version %s of api %s') % (version, api)
       _logger.error('%s', error_msg)
       return util.send_wsgi_error_response(error_msg, start_response)
-    return self._send_success_response(doc, start_response)
+    return self._send_success_response(document, request, start_response,
+                                       compression)
 
   def _generate_api_config_with_root(self, request):
     """Generate an API config with a specific root hostname.
@@ -167,7 +307,7 @@ class DiscoveryService(object):
 
     return url
 
-  def _list(self, request, start_response):
+  def _list(self, request, start_response, compression=None):
     """Sends HTTP response containing the API directory.
 
     This calls start_response and returns the response body.
@@ -175,24 +315,49 @@ class DiscoveryService(object):
     Args:
       request: An ApiRequest, the transformed request sent to the Discovery API.
       start_response: A function with semantics defined in PEP-333.
+      compression: A util.ResponseCompression to compress the list with, or
+        None to send it uncompressed.
 
     Returns:
       A string containing the response body.
     """
-    configs = []
-    generator = directory_list_generator.DirectoryListGenerator(request)
-    for config in self._config_manager.configs.itervalues():
-      if config != self.API_CONFIG:
-        configs.append(config)
-    directory = generator.pretty_print_config_to_json(configs)
-    if not directory:
+    def generate():
+      # pylint: disable=g-import-not-at-top
+      from . import directory_list_generator
+      configs = []
+      generator = directory_list_generator.DirectoryListGenerator(request)
+      for config in self._config_manager.configs.itervalues():
+        if config != self.API_CONFIG:
+          configs.append(config)
+      return generator.pretty_print_config_to_json(configs)
+
+    # Discovery links in the directory are built from the request URL.
+    key = ('directory', request.url_scheme, request.reconstruct_hostname(),
+           request.relative_url)
+    document = self._get_document(key, generate)
+    if document is None:
       _logger.error('Failed to get API directory')
       # By returning a 404, code explorer still works if you select the
       # API in the URL
       return util.send_wsgi_not_found_response(start_response)
-    return self._send_success_response(directory, start_response)
+    return self._send_success_response(document, request, start_response,
+                                       compression)
+
+  @classmethod
+  def is_discovery_method(cls, path):
+    """Returns whether a request for path is handled by DiscoveryService.
+
+    Args:
+      path: A string containing the API path (the portion of the path
+        after /_ah/api/).
+
+    Returns:
+      True if handle_discovery_request handles requests for path.
+    """
+    return path in (cls._GET_REST_API, cls._GET_RPC_API, cls._LIST_API)
 
-  def handle_discovery_request(self, path, request, start_response):
+  def handle_discovery_request(self, path, request, start_response,
+                               compression=None):
     """Returns the result of a discovery service request.
 
     This calls start_response and returns the response body.
@@ -202,13 +367,15 @@ class DiscoveryService(object):
         after /_ah/api/).
       request: An ApiRequest, the transformed request sent to the Discovery API.
       start_response: A function with semantics defined in PEP-333.
+      compression: A util.ResponseCompression to compress the response with,
+        or None to send it uncompressed.
 
     Returns:
       The response body.  Or returns False if the request wasn't handled by
       DiscoveryService.
     """
     if path == self._GET_REST_API:
-      return self._get_rest_doc(request, start_response)
+      return self._get_rest_doc(request, start_response, compression)
     elif path == self._GET_RPC_API:
       error_msg = ('RPC format documents are no longer supported with the '
                    'Endpoints Framework for Python. Please use the REST '
@@ -216,5 +383,5 @@ class DiscoveryService(object):
       _logger.error('%s', error_msg)
       return util.send_wsgi_error_response(error_msg, start_response)
     elif path == self._LIST_API:
-      return self._list(request, start_response)
+      return self._list(request, start_response, compression)
     return False
@@ -26,21 +26,23 @@ configuration has changed.
 from __future__ import absolute_import
 
 import cStringIO
+import gc
 import httplib
 import json
 import logging
+import pkgutil
 import re
 import urlparse
 import wsgiref
 
-import pkg_resources
-
 from . import api_config_manager
 from . import api_exceptions
 from . import api_request
 from . import discovery_service
 from . import errors
 from . import parameter_converter
+from . import startup_trace
+from . import users_id_token
 from . import util
 
 _logger = logging.getLogger(__name__)
@@ -50,6 +52,15 @@ __all__ = ['EndpointsDispatcherMiddleware']
 
 _SERVER_SOURCE_IP = '0.2.0.3'
 
+# Number of resolved routes kept by the default ApiConfigManager.
+_ROUTE_CACHE_SIZE = 1024
+
+# Upper bound on the number of transform plans kept by a dispatcher.
+_MAX_TRANSFORM_PLANS = 1024
+
+# The standard query parameter that selects pretty printed responses.
+_PRETTY_PRINT_PARAMETER = 'prettyPrint'
+
 # Internal constants
 _CORS_HEADER_ORIGIN = 'Origin'
 _CORS_HEADER_REQUEST_METHOD = 'Access-Control-Request-Method'
@@ -64,8 +75,62 @@ _CORS_EXPOSED_HEADERS = frozenset(
     ('Content-Encoding', 'Content-Length', 'Date', 'ETag', 'Server')
 )
 
-PROXY_HTML = pkg_resources.resource_string('endpoints', 'proxy.html')
+# pkgutil reads it from eggs and zips too, without importing pkg_resources,
+# which is slow to import.
+PROXY_HTML = pkgutil.get_data('endpoints', 'proxy.html')
 PROXY_PATH = 'static/proxy.html'
+# The path App Engine sends warmup requests to.
+_WARMUP_PATH = '/_ah/warmup'
+
+
+class _TransformPlan(object):
+  """Precompiled steps for moving a method's request parameters to the body.
+
+  For each parameter in the method config this holds whether the parameter is
+  repeated, the function that validates and converts its values, and, for a
+  '.' delimited name, the name already split into the path of nested message
+  fields.
+  """
+
+  def __init__(self, method_parameters):
+    """Constructor for _TransformPlan.
+
+    Args:
+      method_parameters: A dictionary containing the API configuration for the
+        parameters for the request.
+    """
+    self._steps = dict((name, self._compile_step(name, parameter_config))
+                       for name, parameter_config
+                       in method_parameters.iteritems())
+
+  @staticmethod
+  def _compile_step(name, parameter_config):
+    field_path = tuple(name.split('.')) if '.' in name else None
+    return (parameter_config.get('repeated', False),
+            parameter_converter.get_parameter_converter(parameter_config),
+            field_path)
+
+  def get_step(self, name):
+    """Returns the (repeated, converter, field path) step for a parameter.
+
+    Args:
+      name: A string, the name of the parameter from the path or query string.
+
+    Returns:
+      A tuple of (repeated, converter, field path).  The converter is None if
+      the value is passed through unchanged, and the field path is None if the
+      name doesn't refer to a nested message field.  Parameters that aren't in
+      the method config are passed through as non-repeated values.
+    """
+    step = self._steps.get(name)
+    if step is None:
+      # Unknown names come straight from the query string, so they're not
+      # added to the plan.
+      step = self._compile_step(name, {})
+    return step
+
+
+_EMPTY_TRANSFORM_PLAN = _TransformPlan({})
 
 
 class EndpointsDispatcherMiddleware(object):
@@ -73,20 +138,42 @@ class EndpointsDispatcherMiddleware(object):
 
   _API_EXPLORER_URL = 'https://apis-explorer.appspot.com/apis-explorer/?base='
 
-  def __init__(self, backend_wsgi_app, config_manager=None):
+  def __init__(self, backend_wsgi_app, config_manager=None, pretty_print=True,
+               compression_level=6, compression_min_size=1024,
+               handle_warmup=False):
     """Constructor for EndpointsDispatcherMiddleware.
 
     Args:
       backend_wsgi_app: A WSGI server that serves the app's endpoints.
       config_manager: An ApiConfigManager instance that allows a caller to
         set up an existing configuration for testing.
+      pretty_print: Whether responses are pretty printed for requests that
+        don't set the prettyPrint query parameter.  Responses that aren't
+        pretty printed are the backend's compact JSON, passed through as is.
+      compression_level: An int from 1 to 9, the zlib level used to compress
+        responses for clients that accept gzip or deflate.  0 disables
+        response compression.
+      compression_min_size: An int, the smallest response body in bytes that
+        is compressed.
+      handle_warmup: Whether requests to /_ah/warmup call warm().  App Engine
+        sends them to new instances when the warmup inbound service is
+        enabled, if the path is routed to this app.
     """
     if config_manager is None:
-      config_manager = api_config_manager.ApiConfigManager()
+      config_manager = api_config_manager.ApiConfigManager(
+          route_cache_size=_ROUTE_CACHE_SIZE)
     self.config_manager = config_manager
 
     self._backend = backend_wsgi_app
+    self._pretty_print = pretty_print
+    self._compression_level = compression_level
+    self._compression_min_size = compression_min_size
+    self._handle_warmup = handle_warmup
     self._dispatchers = []
+    self._transform_plans = {}
+    self._discovery = discovery_service.DiscoveryService(
+        self.config_manager, self._backend,
+        document_cache=discovery_service.DiscoveryDocumentCache())
     for base_path in self._backend.base_paths:
       self._add_dispatcher('%sexplorer/?$' % base_path,
                            self.handle_api_explorer_request)
@@ -94,11 +181,129 @@ class EndpointsDispatcherMiddleware(object):
                            self.handle_api_static_request)
 
     # Get API configuration so we know how to call the backend.
-    api_config_response = self.get_api_configs()
+    with startup_trace.trace('get_api_configs'):
+      api_config_response = self.get_api_configs()
     if api_config_response:
-      self.config_manager.process_api_config_response(api_config_response)
+      with startup_trace.trace('compile_routes'):
+        self.config_manager.process_api_config_response(api_config_response)
     else:
       raise api_exceptions.ApiConfigurationError('get_api_configs() returned no configs')
+    with startup_trace.trace('compile_transform_plans'):
+      self._compile_transform_plans()
+
+  def _compile_transform_plans(self):
+    """Compiles the transform plans of all methods in the loaded configs."""
+    for config in self.config_manager.configs.itervalues():
+      for method in config.get('methods', {}).itervalues():
+        self._get_transform_plan(
+            method.get('request', {}).get('parameters', {}))
+
+  def _get_transform_plan(self, method_parameters):
+    """Returns the transform plan for a method's parameters.
+
+    Plans are cached by the identity of the method_parameters dict, which
+    is part of a loaded API config and isn't modified after loading.
+
+    Args:
+      method_parameters: A dictionary containing the API configuration for the
+        parameters for the request.
+
+    Returns:
+      A _TransformPlan for method_parameters.
+    """
+    if not method_parameters:
+      return _EMPTY_TRANSFORM_PLAN
+    entry = self._transform_plans.get(id(method_parameters))
+    # The cache holds on to method_parameters, so its id can't be reused by
+    # another dict while the entry exists.
+    if entry is None or entry[0] is not method_parameters:
+      if len(self._transform_plans) >= _MAX_TRANSFORM_PLANS:
+        self._transform_plans.clear()
+      entry = method_parameters, _TransformPlan(method_parameters)
+      self._transform_plans[id(method_parameters)] = entry
+    return entry[1]
+
+  def warm(self, base_urls=None):
+    """Do the work that's otherwise left to the first requests.
+
+    Routes, auth policies and transform plans are already built by the
+    constructors.  This fetches the certs of the auth issuers, and generates
+    the discovery docs and API directory.
+    It doesn't start any threads, and garbage is collected before it
+    returns, so it's safe to call in a process that then forks workers.
+    They share the warmed structures with it until they're modified.
+
+    Args:
+      base_urls: A list of the URLs clients reach the app at, such as
+        ['https://example.appspot.com'].  Discovery docs are generated for
+        each, since they're specific to the URL.  Defaults to the app's
+        hostname when running on App Engine, and to none otherwise.
+    """
+    if base_urls is None:
+      hostname = util.get_app_hostname()
+      base_urls = ['https://%s' % hostname] if hostname else []
+    self._backend.warm()
+    for base_url in base_urls:
+      self._warm_discovery_docs(base_url)
+    gc.collect()
+
+  def _warm_discovery_docs(self, base_url):
+    """Generate the discovery docs and API directory for a base URL.
+
+    They're requested from this app, so they're cached for exactly the
+    requests clients send.
+
+    Args:
+      base_url: A string, the scheme and host clients reach the app at.
+    """
+    url = urlparse.urlsplit(base_url)
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    paths = set()
+    for service in self._backend.api_services:
+      api_info = service.api_info
+      paths.add('%sdiscovery/v1/apis' % api_info.base_path)
+      paths.add('%sdiscovery/v1/apis/%s/%s/rest' % (
+          api_info.base_path, api_info.name, api_info.api_version))
+    for path in sorted(paths):
+      environ = {
+          'REQUEST_METHOD': 'GET',
+          'PATH_INFO': path,
+          'QUERY_STRING': '',
+          'SERVER_NAME': url.hostname,
+          'SERVER_PORT': str(port),
+          'HTTP_HOST': url.netloc,
+          'wsgi.url_scheme': url.scheme,
+          'wsgi.input': cStringIO.StringIO(),
+      }
+      statuses = []
+      ''.join(self(environ, lambda status, *args: statuses.append(status)))
+      if not statuses or not statuses[0].startswith('200'):
+        _logger.warning('Unable to warm %s%s: %s', base_url, path,
+                        statuses and statuses[0])
+
+  def _handle_warmup_request(self, environ, start_response):
+    """Handler for App Engine's requests to /_ah/warmup.
+
+    Discovery docs are generated for the URL of the warmup request, as well
+    as the app's hostname.
+
+    Args:
+      environ: An environ dict for the request as defined in PEP-333.
+      start_response: A function with semantics defined in PEP-333.
+
+    Returns:
+      A string containing the response body.
+    """
+    request_url = '%s://%s:%s' % (environ['wsgi.url_scheme'],
+                                  environ['SERVER_NAME'],
+                                  environ['SERVER_PORT'])
+    hostname = util.get_app_hostname()
+    base_urls = [request_url]
+    if hostname:
+      base_urls.append('https://%s' % hostname)
+    self.warm(base_urls)
+    return util.send_wsgi_response('200 OK', [('Content-Type', 'text/plain')],
+                                   'OK', start_response)
 
   def _add_dispatcher(self, path_regex, dispatch_function):
     """Add a request path and dispatch handler.
@@ -139,12 +344,31 @@ class EndpointsDispatcherMiddleware(object):
     Yields:
       An iterable over strings containing the body of the HTTP response.
     """
+    if self._handle_warmup and environ.get('PATH_INFO') == _WARMUP_PATH:
+      yield self._handle_warmup_request(environ, start_response)
+      return
+
     request = api_request.ApiRequest(environ,
                                      base_paths=self._backend.base_paths)
 
     # PEP-333 requires that we return an iterator that iterates over the
     # response body.  Yielding the returned body accomplishes this.
-    yield self.dispatch(request, start_response)
+    # Auth state is kept local to this request while it's dispatched.
+    # pylint: disable=protected-access
+    with users_id_token._request_auth_context(environ):
+      body = self.dispatch(request, start_response)
+    if isinstance(body, basestring):
+      yield body
+      return
+
+    # A streamed response body.
+    try:
+      for chunk in body:
+        yield chunk
+    finally:
+      close = getattr(body, 'close', None)
+      if close:
+        close()
 
   def dispatch(self, request, start_response):
     """Handles dispatch to apiserver handlers.
@@ -157,7 +381,8 @@ class EndpointsDispatcherMiddleware(object):
       start_response: A function with semantics defined in PEP-333.
 
     Returns:
-      A string, the body of the response.
+      A string, the body of the response, or an iterable over the strings of
+      a streamed body.
     """
     # Check if this matches any of our special handlers.
     dispatched_response = self.dispatch_non_api_requests(request,
@@ -324,7 +549,8 @@ class EndpointsDispatcherMiddleware(object):
       start_response: A function with semantics defined in PEP-333.
 
     Returns:
-      A string containing the response body.
+      A string containing the response body, or an iterable over the strings
+      of the body if the backend's response is streamed through unchanged.
     """
     method_config, params = self.lookup_rest_method(orig_request)
     if not method_config:
@@ -332,17 +558,45 @@ class EndpointsDispatcherMiddleware(object):
       return util.send_wsgi_not_found_response(start_response,
                                                cors_handler=cors_handler)
 
+    # Check the parameter before calling the backend, so an invalid value
+    # fails the request early.
+    pretty_print = self._should_pretty_print(orig_request)
+
+    etag = None
+    # Whether If-None-Match still has to be compared with the ETag of the
+    # backend's response.
+    check_etag = (self._is_get_method(method_config) and
+                  'If-None-Match' in orig_request.headers)
+    if self._is_get_method(method_config):
+      etag = self._get_method_etag(orig_request, params, method_config)
+      # A 304 before the backend runs would skip its auth checks, and tell
+      # any client whether the resource exists and which version it has.
+      if etag is not None and self._is_public_method(method_config):
+        if util.etag_matches(orig_request.headers.get('If-None-Match'), etag):
+          # The client's copy is current, so the backend isn't called at all.
+          return self._send_not_modified(orig_request, method_config, etag,
+                                         start_response)
+        check_etag = False
+
+    direct_response = self._call_backend_directly(orig_request, params,
+                                                   method_config)
+    if direct_response is not None:
+      status, headers, body = direct_response
+      return self.handle_backend_response(orig_request, None, status, headers,
+                                          body, method_config, start_response,
+                                          pretty_print=pretty_print, etag=etag)
+
     # Prepare the request for the back end.
     transformed_request = self.transform_request(
         orig_request, params, method_config)
 
     # Check if this call is for the Discovery service.  If so, route
     # it to our Discovery handler.
-    discovery = discovery_service.DiscoveryService(
-        self.config_manager, self._backend)
-    discovery_response = discovery.handle_discovery_request(
-        transformed_request.path, transformed_request, start_response)
-    if discovery_response:
+    discovery_response = self._discovery.handle_discovery_request(
+        transformed_request.path, transformed_request, start_response,
+        compression=self._get_response_compression(orig_request,
+                                                   method_config))
+    if discovery_response is not False:
       return discovery_response
 
     url = transformed_request.base_path + transformed_request.path
@@ -358,6 +612,21 @@ class EndpointsDispatcherMiddleware(object):
       status = start_response_proxy.response_status
       headers = start_response_proxy.response_headers
 
+      # A streamed response only has an ETag if the method's etag function
+      # supplies it.  A response that If-None-Match still has to be compared
+      # with is buffered, so its ETag can be computed from the body.
+      if not check_etag and self._can_stream_response(
+          status, headers, method_config, pretty_print):
+        if etag is not None and status.startswith('200'):
+          headers = self._set_etag_header(headers, etag)
+        cors_handler = self._create_cors_handler(orig_request)
+        return util.send_wsgi_streaming_response(
+            status, headers,
+            start_response_proxy.get_response_body_iter(body_iter),
+            start_response, cors_handler=cors_handler,
+            compression=self._get_response_compression(orig_request,
+                                                       method_config))
+
       # Get response body
       body = start_response_proxy.response_body
       # In case standard WSGI behavior is implemented later...
@@ -366,7 +635,137 @@ class EndpointsDispatcherMiddleware(object):
 
     return self.handle_backend_response(orig_request, transformed_request,
                                         status, headers, body, method_config,
-                                        start_response)
+                                        start_response,
+                                        pretty_print=pretty_print, etag=etag)
+
+  def _can_stream_response(self, status, headers, method_config,
+                           pretty_print):
+    """Returns whether a backend response can be sent without buffering it.
+
+    That's the case when handle_backend_response would send the body
+    unchanged: a successful JSON response that isn't pretty printed or
+    replaced with a 204.
+
+    Args:
+      status: A string, the status from the response.
+      headers: A list of (header, value) tuples from the response.
+      method_config: A dict, the API config of the method that was called.
+      pretty_print: Whether the response is to be pretty printed.
+
+    Returns:
+      True if the response body can be streamed through.
+    """
+    if pretty_print or int(status.split(' ', 1)[0]) >= 300:
+      return False
+    if method_config.get('response', {}).get('body') == 'empty':
+      return False
+    return not any(
+        header.lower() == 'content-type' and
+        not value.lower().startswith('application/json')
+        for header, value in headers)
+
+  def _call_backend_directly(self, orig_request, params, method_config):
+    """Calls the backend's remote method in process, if the backend allows it.
+
+    This skips encoding the request as JSON, copying it and building a WSGI
+    environ for the backend.  The response is the same as the one the backend
+    returns through its WSGI interface.
+
+    Args:
+      orig_request: An ApiRequest, the original request from the user.
+      params: A dict with URL path parameters extracted by the config_manager
+        lookup.
+      method_config: A dict, the API config of the method to be called.
+
+    Returns:
+      A tuple of (status, headers, body) from the backend, or None if the
+      request has to be sent through the backend's WSGI interface.
+    """
+    call_api_method = getattr(self._backend, 'call_api_method', None)
+    rosy_method = method_config.get('rosyMethod', '')
+    if (call_api_method is None or
+        discovery_service.DiscoveryService.is_discovery_method(rosy_method)):
+      return None
+
+    method_params = method_config.get('request', {}).get('parameters', {})
+    payload = self._build_backend_payload(orig_request, params, method_params)
+    headers = [(key, value) for key, value in orig_request.headers.items()
+               if key.lower() != 'content-type']
+    host = orig_request.server
+    if orig_request.port != 80:
+      host = '%s:%s' % (host, orig_request.port)
+    # The Host header is last, so it overrides one sent by the client, as in
+    # prepare_backend_environ.
+    headers.extend([('Content-Type', 'application/json'), ('Host', host)])
+    return call_api_method(orig_request.base_path + rosy_method, payload,
+                           headers, orig_request.source_ip, orig_request.port)
+
+  @staticmethod
+  def _is_get_method(method_config):
+    return method_config.get('httpMethod', '').upper() == 'GET'
+
+  @staticmethod
+  def _is_public_method(method_config):
+    """Returns whether a method has no auth settings, even the defaults.
+
+    Methods get the default scopes and allowed client IDs unless they're set
+    to empty lists, so a method is only public when its API or the method
+    opts out of both.
+
+    Args:
+      method_config: A dict, the API config of the method.
+
+    Returns:
+      True if the method has no scopes, audiences, client IDs or auth level.
+    """
+    if any(method_config.get(key) for key in
+           ('scopes', 'audiences', 'clientIds')):
+      return False
+    return method_config.get('authLevel', 'NONE') == 'NONE'
+
+  def _get_method_etag(self, orig_request, params, method_config):
+    """Gets the ETag of a response from the method's etag function.
+
+    Args:
+      orig_request: An ApiRequest, the original request from the user.
+      params: A dict with URL path parameters extracted by the config_manager
+        lookup.
+      method_config: A dict, the API config of the method to be called.
+
+    Returns:
+      The quoted ETag of the response, or None if the backend doesn't have an
+      etag function for the method, or if it failed.
+    """
+    get_etag_function = getattr(self._backend, 'get_etag_function', None)
+    if get_etag_function is None:
+      return None
+    etag_function = get_etag_function(
+        orig_request.base_path + method_config.get('rosyMethod', ''))
+    if etag_function is None:
+      return None
+    method_params = method_config.get('request', {}).get('parameters', {})
+    try:
+      return etag_function(
+          self._build_backend_payload(orig_request, params, method_params))
+    except Exception:  # pylint: disable=broad-except
+      _logger.exception('Error computing the ETag of %s',
+                        method_config.get('rosyMethod'))
+      return None
+
+  @staticmethod
+  def _set_etag_header(headers, etag):
+    headers = [(header, value) for header, value in headers
+               if header.lower() != 'etag']
+    headers.append(('ETag', etag))
+    return headers
+
+  def _send_not_modified(self, orig_request, method_config, etag,
+                         start_response):
+    cors_handler = self._create_cors_handler(orig_request)
+    compression = self._get_response_compression(orig_request, method_config)
+    return util.send_wsgi_not_modified_response(
+        etag, start_response, cors_handler=cors_handler,
+        compression=compression)
 
   class __CheckCorsHeaders(object):
     """Track information about CORS headers and our response to them."""
@@ -414,7 +813,8 @@ class EndpointsDispatcherMiddleware(object):
 
   def handle_backend_response(self, orig_request, backend_request,
                               response_status, response_headers,
-                              response_body, method_config, start_response):
+                              response_body, method_config, start_response,
+                              pretty_print=None, etag=None):
     """Handle backend response, transforming output as needed.
 
     This calls start_response and returns the response body.
@@ -422,16 +822,25 @@ class EndpointsDispatcherMiddleware(object):
     Args:
       orig_request: An ApiRequest, the original request from the user.
       backend_request: An ApiRequest, the transformed request that was
-                       sent to the backend handler.
+                       sent to the backend handler, or None if the backend
+                       was called directly.
       response_status: A string, the status from the response.
       response_headers: A dict, the headers from the response.
       response_body: A string, the body of the response.
       method_config: A dict, the API config of the method to be called.
       start_response: A function with semantics defined in PEP-333.
+      pretty_print: Whether to pretty print the response body, or None to
+        decide from the prettyPrint parameter of orig_request.
+      etag: The quoted ETag of the response, or None to use the one the
+        backend sent or a hash of the body.  Only responses to GET methods
+        have an ETag.
 
     Returns:
       A string containing the response body.
     """
+    if pretty_print is None:
+      pretty_print = self._should_pretty_print(orig_request)
+
     # Verify that the response is json.  If it isn't treat, the body as an
     # error message and wrap it in a json error response.
     for header, value in response_headers:
@@ -450,11 +859,44 @@ class EndpointsDispatcherMiddleware(object):
     if empty_response is not None:
       return empty_response
 
-    body = self.transform_rest_response(response_body)
+    if pretty_print:
+      body = self.transform_rest_response(response_body)
+    else:
+      body = response_body
+
+    if (self._is_get_method(method_config) and
+        response_status.startswith('200')):
+      etag = (etag or wsgiref.headers.Headers(list(response_headers))['ETag']
+              or util.compute_etag(body))
+      if util.etag_matches(orig_request.headers.get('If-None-Match'), etag):
+        return self._send_not_modified(orig_request, method_config, etag,
+                                       start_response)
+      response_headers = self._set_etag_header(response_headers, etag)
 
     cors_handler = self._create_cors_handler(orig_request)
+    compression = self._get_response_compression(orig_request, method_config)
     return util.send_wsgi_response(response_status, response_headers, body,
-                                   start_response, cors_handler=cors_handler)
+                                   start_response, cors_handler=cors_handler,
+                                   compression=compression)
+
+  def _get_response_compression(self, orig_request, method_config):
+    """Returns how to compress the response to a request.
+
+    Args:
+      orig_request: An ApiRequest, the original request from the user.
+      method_config: A dict, the API config of the method that was called.
+
+    Returns:
+      A util.ResponseCompression, or None if responses from the method are
+      never compressed.
+    """
+    if (not self._compression_level or
+        not method_config.get('compressResponse', True)):
+      return None
+    encoding = util.choose_response_encoding(
+        orig_request.headers.get('Accept-Encoding'))
+    return util.ResponseCompression(encoding, self._compression_level,
+                                    self._compression_min_size)
 
   def fail_request(self, orig_request, message, start_response):
     """Write an immediate failure response to outfile, no redirect.
@@ -511,8 +953,8 @@ class EndpointsDispatcherMiddleware(object):
     request.path = method_config.get('rosyMethod', '')
     return request
 
-  def _add_message_field(self, field_name, value, params):
-    """Converts a . delimitied field name to a message field in parameters.
+  def _add_message_field(self, field_path, value, params):
+    """Converts a split field name to a message field in parameters.
 
     This adds the field to the params dict, broken out so that message
     parameters appear as sub-dicts within the outer param.
@@ -523,19 +965,15 @@ class EndpointsDispatcherMiddleware(object):
       {'a': {'b': {'c': ['foo']}}}
 
     Args:
-      field_name: A string containing the '.' delimitied name to be converted
-        into a dictionary.
+      field_path: A tuple of strings, the '.' delimited field name split into
+        its parts, for example ('a', 'b', 'c').
       value: The value to be set.
       params: The dictionary holding all the parameters, where the value is
         eventually set.
     """
-    if '.' not in field_name:
-      params[field_name] = value
-      return
-
-    root, remaining = field_name.split('.', 1)
-    sub_params = params.setdefault(root, {})
-    self._add_message_field(remaining, value, sub_params)
+    for field_name in field_path[:-1]:
+      params = params.setdefault(field_name, {})
+    params[field_path[-1]] = value
 
   def _update_from_body(self, destination, source):
     """Updates the dictionary for an API payload with the request body.
@@ -598,6 +1036,27 @@ class EndpointsDispatcherMiddleware(object):
       URL.
     """
     request = orig_request.copy()
+    request.body_json = self._build_backend_payload(request, params,
+                                                    method_parameters)
+    request.body = json.dumps(request.body_json)
+    return request
+
+  def _build_backend_payload(self, request, params, method_parameters):
+    """Merges the path, query and body parameters of a request.
+
+    See transform_rest_request for how the values are combined.  The request
+    isn't modified.
+
+    Args:
+      request: An ApiRequest, the request from the user.
+      params: A dict with URL path parameters extracted by the config_manager
+        lookup.
+      method_parameters: A dictionary containing the API configuration for the
+        parameters for the request.
+
+    Returns:
+      A dict, the JSON payload to send to the backend.
+    """
     body_json = {}
 
     # Handle parameters from the URL path.
@@ -619,30 +1078,30 @@ class EndpointsDispatcherMiddleware(object):
     # parameters to nested parameters.  We don't use iteritems since we may
     # modify body_json within the loop.  For instance, 'a.b' is not a valid key
     # and would be replaced with 'a'.
-    for key, value in body_json.items():
-      current_parameter = method_parameters.get(key, {})
-      repeated = current_parameter.get('repeated', False)
-
+    plan = self._get_transform_plan(method_parameters)
+    for key in body_json.keys():
+      repeated, converter, field_path = plan.get_step(key)
+      value = body_json[key]
       if not repeated:
-        body_json[key] = body_json[key][0]
+        value = value[0]
 
       # Order is important here.  Parameter names are dot-delimited in
       # parameters instead of nested in dictionaries as a message field is, so
-      # we need to call transform_parameter_value on them before calling
-      # _add_message_field.
-      body_json[key] = parameter_converter.transform_parameter_value(
-          key, body_json[key], current_parameter)
-      # Remove the old key and try to convert to nested message value
-      message_value = body_json.pop(key)
-      self._add_message_field(key, message_value, body_json)
+      # we need to convert the value before calling _add_message_field.
+      if converter:
+        value = converter(key, value)
+      if field_path is None:
+        body_json[key] = value
+      else:
+        # Remove the old key and convert to nested message value
+        del body_json[key]
+        self._add_message_field(field_path, value, body_json)
 
     # Add in values from the body of the request.
     if request.body_json:
       self._update_from_body(body_json, request.body_json)
 
-    request.body_json = body_json
-    request.body = json.dumps(request.body_json)
-    return request
+    return body_json
 
   def check_error_response(self, body, status):
     """Raise an exception if the response from the backend was an error.
@@ -680,6 +1139,25 @@ class EndpointsDispatcherMiddleware(object):
       cors_handler = self._create_cors_handler(orig_request)
       return util.send_wsgi_no_content_response(start_response, cors_handler)
 
+  def _should_pretty_print(self, orig_request):
+    """Returns whether the response to a request should be pretty printed.
+
+    Args:
+      orig_request: An ApiRequest, the original request from the user.
+
+    Returns:
+      The value of the prettyPrint query parameter, or the server default if
+      the request doesn't set it.
+
+    Raises:
+      BasicTypeParameterError: If the prettyPrint value isn't a boolean.
+    """
+    values = orig_request.parameters.get(_PRETTY_PRINT_PARAMETER)
+    if not values:
+      return self._pretty_print
+    return parameter_converter.transform_parameter_value(
+        _PRETTY_PRINT_PARAMETER, values[0], {'type': 'boolean'})
+
   def transform_rest_response(self, response_body):
     """Translates an apiserving REST response so it's ready to return.
 
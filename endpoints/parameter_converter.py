@@ -24,7 +24,7 @@ from __future__ import absolute_import
 
 from . import errors
 
-__all__ = ['transform_parameter_value']
+__all__ = ['get_parameter_converter', 'transform_parameter_value']
 
 
 def _check_enum(parameter_name, value, parameter_config):
@@ -147,6 +147,61 @@ def _get_parameter_conversion_entry(parameter_config):
   return entry
 
 
+def get_parameter_converter(parameter_config):
+  """Builds a function that validates and transforms values of a parameter.
+
+  The work that only depends on the parameter configuration, like finding the
+  conversion entry or collecting the allowed enum values, is done here once,
+  so the returned function can be applied to many request values cheaply.
+
+  Args:
+    parameter_config: The dictionary containing information specific to the
+      parameter in question. This is retrieved from request.parameters in the
+      method config.
+
+  Returns:
+    A function that takes a parameter name and a value (or list of values) and
+    returns the converted value(s), with the same semantics as
+    transform_parameter_value.  None if values of this parameter are passed
+    through unchanged.
+  """
+  entry = _get_parameter_conversion_entry(parameter_config)
+  if not entry:
+    return None
+
+  validation_func, conversion_func, type_name = entry
+  if validation_func is _check_enum:
+    enum_values = [enum['backendValue']
+                   for enum in parameter_config['enum'].values()
+                   if 'backendValue' in enum]
+    allowed_values = frozenset(enum_values)
+
+    def validate(parameter_name, value):
+      if value not in allowed_values:
+        raise errors.EnumRejectionError(parameter_name, value, enum_values)
+  elif validation_func:
+    def validate(parameter_name, value):
+      validation_func(parameter_name, value, parameter_config)
+  else:
+    validate = None
+
+  def convert(parameter_name, value):
+    if isinstance(value, list):
+      # See transform_parameter_value for the parameter renaming done here.
+      return [convert('%s[%d]' % (parameter_name, index), element)
+              for index, element in enumerate(value)]
+    if validate:
+      validate(parameter_name, value)
+    if conversion_func:
+      try:
+        return conversion_func(value)
+      except ValueError:
+        raise errors.BasicTypeParameterError(parameter_name, value, type_name)
+    return value
+
+  return convert
+
+
 def transform_parameter_value(parameter_name, value, parameter_config):
   """Validates and transforms parameters to the type expected by the API.
 
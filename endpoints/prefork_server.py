@@ -0,0 +1,396 @@
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A pre-forking WSGI server, for serving APIs outside of App Engine.
+
+PreforkServer warms the app once in a master process, then forks workers that
+accept connections on the master's listening socket and handle one request
+at a time.  The workers share everything the master built copy-on-write.
+
+The master restarts workers that exit, including workers that exit after
+handling their budget of requests.  Workers that fail soon after starting are
+restarted after a delay, which doubles with each such failure.  It stops them
+gracefully on SIGTERM or SIGINT, letting requests in progress finish.
+
+On SIGHUP it forks a new set of workers, then stops the old ones gracefully,
+so connections are accepted throughout.  The new workers are forked from the
+same master, so this renews the workers' processes but reloads nothing: not
+the code, the APIs or the warmed app.
+
+This is what `endpointscfg.py serve` runs.  Example:
+  app = endpoints.api_server([EchoApi])
+  prefork_server.PreforkServer(app, port=8080, workers=4).serve_forever()
+"""
+
+from __future__ import absolute_import
+
+import cStringIO
+import errno
+import logging
+import os
+import random
+import signal
+import socket
+import time
+import urlparse
+from wsgiref import simple_server
+
+__all__ = ['PreforkServer']
+
+_logger = logging.getLogger(__name__)
+
+# How often workers check whether they've been asked to stop, in seconds.
+_WORKER_POLL_SECS = 1.0
+# How often the master checks whether stopped workers have exited.
+_STOP_POLL_SECS = 0.05
+# A worker that fails sooner than this after starting delays the next one
+# started, by between these times.
+_MIN_WORKER_SECS = 1.0
+_MIN_RESPAWN_DELAY_SECS = 0.1
+_MAX_RESPAWN_DELAY_SECS = 10.0
+# Linux's value, for Pythons built without socket.SO_REUSEPORT.
+_SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
+
+class _BodyReader(object):
+  """WSGI middleware that reads the request body before calling the app.
+
+  wsgiref passes the connection itself as wsgi.input, where read() without a
+  size waits for the client to close it.  Apps may read the whole input, as
+  they can on App Engine, so it's replaced with the body alone.
+  """
+
+  def __init__(self, app):
+    self._app = app
+
+  def __call__(self, environ, start_response):
+    try:
+      length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+      length = 0
+    environ['wsgi.input'] = cStringIO.StringIO(
+        environ['wsgi.input'].read(length) if length > 0 else '')
+    return self._app(environ, start_response)
+
+
+class _RequestHandler(simple_server.WSGIRequestHandler):
+  """Logs requests to the module's logger rather than to stderr.
+
+  A worker handles one connection at a time, so a client that's idle for
+  longer than the server's connection_timeout is disconnected.
+
+  SERVER_NAME and SERVER_PORT are taken from the Host header, as they are on
+  App Engine, rather than from the address the server is bound to.
+  Discovery docs are generated and cached for them, so they're the URL the
+  client used, and they match the docs warmed for the server's base URLs.
+  """
+
+  def get_environ(self):
+    environ = simple_server.WSGIRequestHandler.get_environ(self)
+    host = self.headers.get('Host')
+    if host:
+      url = urlparse.urlsplit('//' + host)
+      try:
+        port = url.port
+      except ValueError:
+        # Not a valid port, so the server's name and port are used.
+        return environ
+      if url.hostname:
+        environ['SERVER_NAME'] = url.hostname
+        # The server only speaks HTTP.
+        environ['SERVER_PORT'] = str(port or 80)
+    return environ
+
+  def setup(self):
+    # StreamRequestHandler sets this as the connection's socket timeout.
+    self.timeout = self.server.connection_timeout
+    simple_server.WSGIRequestHandler.setup(self)
+
+  def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+    _logger.debug('%s %s', self.address_string(), format % args)
+
+
+class _WorkerServer(simple_server.WSGIServer):
+  """Serves requests in a worker, on a socket that's already listening."""
+
+  def __init__(self, listener, app, connection_timeout):
+    simple_server.WSGIServer.__init__(
+        self, listener.getsockname(), _RequestHandler,
+        bind_and_activate=False)
+    self.socket.close()
+    self.socket = listener
+    self.server_name, self.server_port = listener.getsockname()[:2]
+    self.setup_environ()
+    self.set_app(_BodyReader(app))
+    self.timeout = _WORKER_POLL_SECS
+    self.connection_timeout = connection_timeout
+    self.requests_handled = 0
+
+  def finish_request(self, request, client_address):
+    simple_server.WSGIServer.finish_request(self, request, client_address)
+    self.requests_handled += 1
+
+  def handle_error(self, request, client_address):
+    _logger.exception('Error handling a request from %s', client_address)
+
+
+class PreforkServer(object):
+  """Serves a WSGI app from several pre-forked worker processes."""
+
+  def __init__(self, app, host='127.0.0.1', port=8080, workers=None,
+               max_requests=0, graceful_timeout=30, connection_timeout=30,
+               backlog=128):
+    """Constructor for PreforkServer.
+
+    The listening socket is created here, so the address is known before
+    serve_forever is called.  It's bound with SO_REUSEPORT, so a new server
+    can start listening on the same port before this one stops.
+
+    Args:
+      app: The WSGI app to serve, such as the one endpoints.api_server
+        returns.  If it has a warm() method, it's called before the workers
+        are forked.  If it has an after_fork() method, each worker calls it
+        before serving requests, eg. to start threads.
+      host: A string, the address to listen on.
+      port: An int, the port to listen on, or 0 for any free port.
+      workers: An int, the number of worker processes.  Defaults to the
+        number of CPUs.
+      max_requests: An int.  Workers are replaced after handling about this
+        many requests; up to a tenth more, so they aren't all replaced at
+        once.  0 means they're never replaced.
+      graceful_timeout: The seconds workers have to finish the requests
+        they're handling when the server stops, before they're killed.
+      connection_timeout: The seconds a worker waits for a client to send or
+        receive data before closing the connection, or None to wait forever.
+        Each worker serves one connection at a time, so idle clients keep
+        others waiting until this expires.
+      backlog: An int, the number of connections the socket queues.
+    """
+    self._app = app
+    self._workers = workers or _cpu_count()
+    self._max_requests = max_requests
+    self._graceful_timeout = graceful_timeout
+    self._connection_timeout = connection_timeout
+    # Maps the pid of each worker to the time it was started.
+    self._worker_pids = {}
+    self._respawn_delay = 0
+    self._respawn_time = 0
+    self._master_pid = None
+    self._stopping = False
+    self._reloading = False
+
+    self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+      self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+      try:
+        self._listener.setsockopt(socket.SOL_SOCKET, _SO_REUSEPORT, 1)
+      except socket.error:
+        _logger.warning('SO_REUSEPORT is not supported on this platform.')
+      self._listener.bind((host, port))
+      self._listener.listen(backlog)
+    except:
+      self._listener.close()
+      raise
+    # Every worker is woken by a new connection, and only one accepts it.
+    # The others mustn't block in accept(), where they can't be stopped.
+    self._listener.setblocking(False)
+
+  @property
+  def server_address(self):
+    """The (host, port) the server is listening on."""
+    return self._listener.getsockname()[:2]
+
+  @property
+  def socket(self):
+    return self._listener
+
+  def serve_forever(self, base_urls=None):
+    """Warm the app, then run workers until SIGTERM or SIGINT.
+
+    Args:
+      base_urls: Passed to the app's warm() method: a list of the URLs
+        clients reach the server at, for which discovery docs are generated.
+    """
+    self._master_pid = os.getpid()
+    warm = getattr(self._app, 'warm', None)
+    if warm is not None:
+      start_time = time.time()
+      warm(base_urls)
+      _logger.info('Warmed the app in %.1f ms',
+                   (time.time() - start_time) * 1000)
+
+    signal.signal(signal.SIGTERM, self._handle_stop)
+    signal.signal(signal.SIGINT, self._handle_stop)
+    signal.signal(signal.SIGHUP, self._handle_reload)
+    host, port = self.server_address
+    _logger.info('Serving on http://%s:%d with %d workers', host, port,
+                 self._workers)
+    try:
+      while not self._stopping:
+        delay = self._respawn_time - time.time()
+        if delay > 0 and len(self._worker_pids) < self._workers:
+          # Signals interrupt the sleep.
+          time.sleep(delay)
+          continue
+        while len(self._worker_pids) < self._workers and not self._stopping:
+          self._spawn_worker()
+        if self._reloading:
+          self._reloading = False
+          _logger.info('Replacing the workers')
+          old_worker_pids = self._worker_pids
+          self._worker_pids = {}
+          try:
+            # The new workers are accepting connections before the old ones
+            # stop.
+            while len(self._worker_pids) < self._workers:
+              self._spawn_worker()
+          finally:
+            self._stop_workers(old_worker_pids)
+          continue
+        try:
+          pid, status = os.waitpid(-1, 0)
+        except OSError as e:
+          if e.errno in (errno.EINTR, errno.ECHILD):
+            continue
+          raise
+        if pid in self._worker_pids:
+          self._handle_worker_exit(pid, status)
+    finally:
+      self._stop_workers()
+      self._listener.close()
+      for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+    _logger.info('Stopped')
+
+  def _handle_stop(self, unused_signum, unused_frame):
+    self._stopping = True
+
+  def _handle_reload(self, unused_signum, unused_frame):
+    self._reloading = True
+
+  def _handle_worker_exit(self, pid, status):
+    """Forget an exited worker, delaying the next if it failed at startup."""
+    seconds = time.time() - self._worker_pids.pop(pid)
+    if not status:
+      self._respawn_delay = 0
+      return
+    _logger.warning('Worker %d %s', pid, _describe_exit_status(status))
+    if seconds >= _MIN_WORKER_SECS:
+      self._respawn_delay = 0
+      return
+    self._respawn_delay = min(
+        max(self._respawn_delay * 2, _MIN_RESPAWN_DELAY_SECS),
+        _MAX_RESPAWN_DELAY_SECS)
+    self._respawn_time = time.time() + self._respawn_delay
+    _logger.warning('Worker %d failed %.1f s after starting; waiting %.1f s '
+                    'to replace it', pid, seconds, self._respawn_delay)
+
+  def _spawn_worker(self):
+    """Fork a worker process."""
+    pid = os.fork()
+    if pid:
+      self._worker_pids[pid] = time.time()
+      return
+    status = 1
+    try:
+      self._run_worker()
+      status = 0
+    except BaseException:  # pylint: disable=broad-except
+      _logger.exception('Worker %d failed', os.getpid())
+    finally:
+      # Don't run the master's exit handlers or unwind its stack.
+      os._exit(status)  # pylint: disable=protected-access
+
+  def _run_worker(self):
+    """Serve requests until asked to stop, or until the request budget."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *unused_args: stopping.append(True))
+    # Let a request that's being handled finish, rather than interrupting
+    # its socket reads and writes.
+    signal.siginterrupt(signal.SIGTERM, False)
+    # The master stops the workers when it gets these.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # Each worker needs its own random sequence.
+    random.seed()
+    after_fork = getattr(self._app, 'after_fork', None)
+    if after_fork is not None:
+      after_fork()
+
+    max_requests = self._max_requests
+    if max_requests:
+      max_requests += random.randint(0, max_requests // 10)
+    server = _WorkerServer(self._listener, self._app,
+                           self._connection_timeout)
+    while not stopping and os.getppid() == self._master_pid:
+      if max_requests and server.requests_handled >= max_requests:
+        _logger.info('Worker %d handled %d requests; exiting', os.getpid(),
+                     server.requests_handled)
+        break
+      server.handle_request()
+
+  def _stop_workers(self, worker_pids=None):
+    """Ask workers to stop, and kill any still running after a timeout.
+
+    Args:
+      worker_pids: A dict like self._worker_pids of the workers to stop,
+        which are removed from it as they exit.  Defaults to all the workers.
+    """
+    if worker_pids is None:
+      worker_pids = self._worker_pids
+    for pid in worker_pids:
+      _kill(pid, signal.SIGTERM)
+    deadline = time.time() + self._graceful_timeout
+    while worker_pids:
+      for pid in list(worker_pids):
+        try:
+          exited, _ = os.waitpid(pid, os.WNOHANG)
+        except OSError as e:
+          if e.errno == errno.EINTR:
+            continue
+          exited = pid
+        if exited:
+          del worker_pids[pid]
+      if not worker_pids:
+        break
+      if time.time() >= deadline:
+        for pid in worker_pids:
+          _logger.warning('Killing worker %d', pid)
+          _kill(pid, signal.SIGKILL)
+        deadline = float('inf')
+      time.sleep(_STOP_POLL_SECS)
+
+
+def _describe_exit_status(status):
+  """Describes how a process exited, from its status as returned by waitpid."""
+  if os.WIFSIGNALED(status):
+    return 'was killed by signal %d' % os.WTERMSIG(status)
+  return 'exited with status %d' % os.WEXITSTATUS(status)
+
+
+def _kill(pid, signum):
+  try:
+    os.kill(pid, signum)
+  except OSError as e:
+    if e.errno != errno.ESRCH:
+      raise
+
+
+def _cpu_count():
+  # pylint: disable=g-import-not-at-top
+  import multiprocessing
+  try:
+    return multiprocessing.cpu_count()
+  except NotImplementedError:
+    return 1
@@ -106,3 +106,52 @@ class EndpointsProtoJson(protojson.ProtoJson):
         raise messages.DecodeError('Base64 decoding error: %s' % err)
 
     return super(EndpointsProtoJson, self).decode_field(field, value)
+
+  @classmethod
+  def __normalize_json_value(cls, value):
+    """Make a value look as if it went through json.dumps and json.loads.
+
+    Args:
+      value: A JSON serializable value.
+
+    Returns:
+      The value with byte strings decoded as UTF-8 and tuples turned into
+      lists, recursively.
+
+    Raises:
+      UnicodeDecodeError: If a byte string isn't valid UTF-8, as json.dumps
+        would.
+    """
+    if isinstance(value, str):
+      return value.decode('utf-8')
+    if isinstance(value, dict):
+      return dict((cls.__normalize_json_value(key),
+                   cls.__normalize_json_value(item))
+                  for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+      return [cls.__normalize_json_value(item) for item in value]
+    return value
+
+  def decode_dictionary(self, message_type, dictionary):
+    """Decode a message from a dictionary of JSON values.
+
+    This gives the same result as
+    decode_message(message_type, json.dumps(dictionary)), without
+    serializing and parsing the JSON.
+
+    Args:
+      message_type: Message class to decode the dictionary to.
+      dictionary: A dict of JSON serializable values.
+
+    Returns:
+      Decoded instance of message_type.
+
+    Raises:
+      messages.ValidationError: If the decoded message is not initialized.
+      messages.DecodeError: If a value can't be decoded.
+    """
+    # pylint: disable=protected-access
+    message = self._ProtoJson__decode_dictionary(
+        message_type, self.__normalize_json_value(dictionary))
+    message.check_initialized()
+    return message
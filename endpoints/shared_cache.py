@@ -0,0 +1,302 @@
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A cache shared by the worker processes on one machine.
+
+SharedMemoryCache keeps a fixed-size hash table in a memory-mapped file, so
+every process that opens the same file sees the same entries.  It has the
+parts of the memcache API that users_id_token needs, so it can be passed
+anywhere a cache of issuer certs is accepted, such as get_verified_jwt's
+cache argument.  Verified tokens are shared through it too.
+
+Values must be JSON serializable.  Entries are trusted as they're read, so
+the file must be owned by the user running the server and be private to it;
+SharedMemoryCache refuses any other file.
+"""
+
+from __future__ import absolute_import
+
+import contextlib
+import errno
+import hashlib
+import json
+import logging
+import os
+import stat
+import struct
+import threading
+import time
+
+try:
+  # pylint: disable=g-import-not-at-top
+  import fcntl
+  import mmap
+except ImportError:
+  # Neither is available on App Engine standard, which also has no way to run
+  # several worker processes on one machine.
+  fcntl = None
+  mmap = None
+
+__all__ = ['SharedMemoryCache']
+
+_logger = logging.getLogger(__name__)
+
+_MAGIC = 'EPSCACHE'
+# The magic string, the number of slots and the size of each slot.
+_FILE_HEADER = struct.Struct('<8sII')
+_FILE_HEADER_SIZE = 64
+# Each slot starts with the hash of its key, when it expires (0 for an empty
+# slot) and the length of its JSON encoded value.
+_SLOT_HEADER = struct.Struct('<16sdI')
+# How many slots after the one a key hashes to are tried before evicting.
+_MAX_PROBES = 8
+# Where it's available, the file isn't opened through a symlink.
+_O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+# Like memcache, expiration times longer than this are absolute timestamps.
+_MAX_RELATIVE_EXPIRATION_SECS = 30 * 24 * 60 * 60
+
+
+def _now():
+  # SharedMemoryCache.set has an argument named time, like memcache's.
+  return time.time()
+
+
+class SharedMemoryCache(object):
+  """A cache in a memory-mapped file, shared by processes on one machine.
+
+  Each entry is stored in one fixed-size slot, in a table of num_slots slots.
+  A key can only be stored in one of a few slots, so when those are all in use
+  the entry that expires soonest is evicted.  Values that don't fit in a slot
+  aren't cached.
+
+  Access is serialized across processes with flock, and across the threads of
+  a process with a lock.  The file is reopened by a process that's forked
+  after using the cache, since a forked process shares its parent's flock.
+  """
+
+  def __init__(self, path, num_slots=1024, slot_size=4096):
+    """Constructor for SharedMemoryCache.
+
+    Args:
+      path: The file to keep the cache in.  It's created if it doesn't exist.
+        If it does, the number and size of slots it was created with are used.
+        It must not be a symlink, and must be owned by the effective user and
+        not accessible to any other user.
+      num_slots: An int, the most entries the cache can hold.
+      slot_size: An int, the bytes in each slot.  The key's hash and 28 bytes
+        of bookkeeping are kept in it along with the value.
+
+    Raises:
+      NotImplementedError: If mmap or fcntl can't be imported on this platform.
+      ValueError: If path exists but isn't a cache file, or is a symlink, or
+        isn't owned by and private to the effective user.
+    """
+    if mmap is None or fcntl is None:
+      raise NotImplementedError(
+          'SharedMemoryCache requires the mmap and fcntl modules.')
+    if slot_size <= _SLOT_HEADER.size:
+      raise ValueError('slot_size must be more than %d.' % _SLOT_HEADER.size)
+    self._path = path
+    self._num_slots = num_slots
+    self._slot_size = slot_size
+    self._fd = None
+    self._mmap = None
+    self._pid = None
+    self._lock = threading.Lock()
+    self._open()
+
+  @property
+  def path(self):
+    return self._path
+
+  def _open(self):
+    """Open and map the cache file, creating it if it doesn't exist."""
+    self.close()
+    try:
+      fd = os.open(self._path, os.O_RDWR | os.O_CREAT | _O_NOFOLLOW, 0600)
+    except OSError as e:
+      if e.errno == errno.ELOOP:
+        raise ValueError('%s is a symlink.' % self._path)
+      raise
+    try:
+      # Anyone who can write the file can plant verified tokens and certs.
+      file_stat = os.fstat(fd)
+      if not stat.S_ISREG(file_stat.st_mode):
+        raise ValueError('%s is not a regular file.' % self._path)
+      if file_stat.st_uid != os.geteuid():
+        raise ValueError('%s is owned by another user.' % self._path)
+      if file_stat.st_mode & 0077:
+        raise ValueError('%s is accessible to other users; its mode must be '
+                         '0600.' % self._path)
+      fcntl.flock(fd, fcntl.LOCK_EX)
+      header = os.read(fd, _FILE_HEADER.size)
+      if not header:
+        os.write(fd, _FILE_HEADER.pack(_MAGIC, self._num_slots,
+                                       self._slot_size))
+        os.ftruncate(fd, _FILE_HEADER_SIZE + self._num_slots * self._slot_size)
+      elif (len(header) == _FILE_HEADER.size and
+            header.startswith(_MAGIC)):
+        _, num_slots, slot_size = _FILE_HEADER.unpack(header)
+        if (num_slots, slot_size) != (self._num_slots, self._slot_size):
+          _logger.warning('%s has %d slots of %d bytes; using those.',
+                          self._path, num_slots, slot_size)
+          self._num_slots, self._slot_size = num_slots, slot_size
+      else:
+        raise ValueError('%s is not a SharedMemoryCache file.' % self._path)
+      fcntl.flock(fd, fcntl.LOCK_UN)
+      self._mmap = mmap.mmap(
+          fd, _FILE_HEADER_SIZE + self._num_slots * self._slot_size)
+    except:
+      os.close(fd)
+      raise
+    self._fd = fd
+    self._pid = os.getpid()
+    self._lock = threading.Lock()
+
+  def close(self):
+    """Unmap the cache file.  The cache reopens it if it's used again."""
+    if self._mmap is not None:
+      self._mmap.close()
+      self._mmap = None
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+    self._pid = None
+
+  @contextlib.contextmanager
+  def _locked(self, operation):
+    """Lock the cache file, reopening it first in a new process.
+
+    Args:
+      operation: fcntl.LOCK_SH to read, or fcntl.LOCK_EX to write.
+
+    Yields:
+      The mapped file.
+    """
+    if self._pid != os.getpid():
+      self._open()
+    with self._lock:
+      fcntl.flock(self._fd, operation)
+      try:
+        yield self._mmap
+      finally:
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+  @staticmethod
+  def _hash(key, namespace):
+    if isinstance(key, unicode):
+      key = key.encode('utf-8')
+    return hashlib.sha1('%s\0%s' % (namespace or '', key)).digest()[:16]
+
+  def _offsets(self, key_hash):
+    """Returns the offsets of the slots a key can be stored in."""
+    first = struct.unpack_from('<Q', key_hash)[0] % self._num_slots
+    return [_FILE_HEADER_SIZE +
+            ((first + probe) % self._num_slots) * self._slot_size
+            for probe in xrange(min(_MAX_PROBES, self._num_slots))]
+
+  def get(self, key, namespace=None):
+    """Get a value from the cache.
+
+    Args:
+      key: The key, a string.
+      namespace: A string to keep the key separate from others, or None.
+
+    Returns:
+      The value, or None if it isn't cached or has expired.
+    """
+    key_hash = self._hash(key, namespace)
+    time_now = _now()
+    with self._locked(fcntl.LOCK_SH) as mapped:
+      for offset in self._offsets(key_hash):
+        slot_hash, expiration_time, length = _SLOT_HEADER.unpack_from(
+            mapped, offset)
+        if slot_hash == key_hash and expiration_time:
+          if expiration_time <= time_now:
+            return None
+          start = offset + _SLOT_HEADER.size
+          value = mapped[start:start + length]
+          break
+      else:
+        return None
+    return json.loads(value)
+
+  def set(self, key, value, time=0, namespace=None):  # pylint: disable=redefined-outer-name
+    """Set a value in the cache.
+
+    Args:
+      key: The key, a string.
+      value: The value, which must be JSON serializable.
+      time: When the value expires, like memcache.  Either seconds from now,
+        or an absolute timestamp if it's more than 30 days.  0 means never.
+      namespace: A string to keep the key separate from others, or None.
+
+    Returns:
+      True if the value was cached, False if it's too large for a slot.
+    """
+    data = json.dumps(value, separators=(',', ':'))
+    if len(data) > self._slot_size - _SLOT_HEADER.size:
+      _logger.debug('Not caching %s; %d bytes is too large.', key, len(data))
+      return False
+    if not time:
+      expiration_time = float('inf')
+    elif time > _MAX_RELATIVE_EXPIRATION_SECS:
+      expiration_time = float(time)
+    else:
+      expiration_time = _now() + time
+    key_hash = self._hash(key, namespace)
+
+    with self._locked(fcntl.LOCK_EX) as mapped:
+      time_now = _now()
+      chosen = None
+      chosen_expiration = None
+      for offset in self._offsets(key_hash):
+        slot_hash, slot_expiration, _ = _SLOT_HEADER.unpack_from(
+            mapped, offset)
+        if slot_hash == key_hash:
+          chosen = offset
+          break
+        if slot_expiration <= time_now:
+          slot_expiration = 0
+        if chosen is None or slot_expiration < chosen_expiration:
+          chosen, chosen_expiration = offset, slot_expiration
+      # Mark the slot empty while it's written, so a process that dies
+      # partway through doesn't leave a corrupt entry.
+      _SLOT_HEADER.pack_into(mapped, chosen, key_hash, 0, 0)
+      start = chosen + _SLOT_HEADER.size
+      mapped[start:start + len(data)] = data
+      _SLOT_HEADER.pack_into(mapped, chosen, key_hash, expiration_time,
+                             len(data))
+    return True
+
+  def delete(self, key, namespace=None):
+    """Delete a value from the cache.
+
+    Args:
+      key: The key, a string.
+      namespace: A string to keep the key separate from others, or None.
+    """
+    key_hash = self._hash(key, namespace)
+    with self._locked(fcntl.LOCK_EX) as mapped:
+      for offset in self._offsets(key_hash):
+        if _SLOT_HEADER.unpack_from(mapped, offset)[0] == key_hash:
+          _SLOT_HEADER.pack_into(mapped, offset, '', 0, 0)
+
+  def flush_all(self):
+    """Delete every value from the cache."""
+    with self._locked(fcntl.LOCK_EX) as mapped:
+      for slot in xrange(self._num_slots):
+        _SLOT_HEADER.pack_into(
+            mapped, _FILE_HEADER_SIZE + slot * self._slot_size, '', 0, 0)
+
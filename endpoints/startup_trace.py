@@ -0,0 +1,207 @@
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records how long each phase of starting an API server takes.
+
+api_server traces its startup with start(), and the constructors it calls
+mark their phases with trace().  Outside of start(), trace() does nothing, so
+constructing the classes directly isn't slowed down.
+
+Example:
+  with startup_trace.start() as tracer:
+    with startup_trace.trace('api_server'):
+      with startup_trace.trace('create_api_server'):
+        ...
+  print tracer.report().format()
+"""
+
+from __future__ import absolute_import
+
+import contextlib
+import gc
+import threading
+import time
+
+import attr
+
+__all__ = ['start', 'StartupPhase', 'StartupReport', 'trace']
+
+# Separates the names of nested phases in StartupPhase.name.
+_SEPARATOR = '/'
+
+_local = threading.local()
+
+
+@attr.s(frozen=True, slots=True)
+class StartupPhase(object):
+  """How long a phase of startup took.
+
+  Attributes:
+    name: The names of the phase and the phases it's nested in, separated by
+      slashes, such as 'api_server/create_api_server/register_services'.
+    seconds: A float, the wall time the phase took.
+    allocations: An int, the net number of objects tracked by the garbage
+      collector that the phase created, or None if they weren't counted.
+    calls: An int, the number of times the phase ran.  A phase that runs
+      more than once, such as once for each API, is reported in total.
+  """
+  name = attr.ib()
+  seconds = attr.ib()
+  allocations = attr.ib(default=None)
+  calls = attr.ib(default=1)
+
+  @property
+  def depth(self):
+    return self.name.count(_SEPARATOR)
+
+  def to_dict(self):
+    return {
+        'name': self.name,
+        'seconds': self.seconds,
+        'allocations': self.allocations,
+        'calls': self.calls,
+    }
+
+
+@attr.s(frozen=True, slots=True)
+class StartupReport(object):
+  """The phases of starting an API server, in the order they started.
+
+  Attributes:
+    phases: A tuple of StartupPhase.  A phase comes before the phases nested
+      in it.
+  """
+  phases = attr.ib(converter=tuple)
+
+  @property
+  def seconds(self):
+    """The total wall time of the phases that aren't nested in another."""
+    return sum(phase.seconds for phase in self.phases if not phase.depth)
+
+  def get_phase(self, name):
+    """Get a phase by name.
+
+    Args:
+      name: The full, slash separated name of the phase.
+
+    Returns:
+      The StartupPhase, or None if there isn't one with that name.
+    """
+    for phase in self.phases:
+      if phase.name == name:
+        return phase
+    return None
+
+  def to_dict(self):
+    """Returns the report as a JSON serializable dict."""
+    # pylint: disable=g-import-not-at-top
+    from . import __version__ as endpoints_version
+    return {
+        'version': endpoints_version,
+        'seconds': self.seconds,
+        'phases': [phase.to_dict() for phase in self.phases],
+    }
+
+  def format(self):
+    """Returns the report as a table, with nested phases indented."""
+    lines = []
+    for phase in self.phases:
+      label = '  ' * phase.depth + phase.name.rsplit(_SEPARATOR, 1)[-1]
+      if phase.calls > 1:
+        label += ' (x%d)' % phase.calls
+      line = '%-48s %9.2f ms' % (label, phase.seconds * 1000)
+      if phase.allocations is not None:
+        line += '  %8d objects' % phase.allocations
+      lines.append(line)
+    return '\n'.join(lines)
+
+
+class _Tracer(object):
+  """Records the phases traced on a thread while it's active."""
+
+  def __init__(self, count_allocations=False):
+    self._count_allocations = count_allocations
+    self._names = []
+    # Maps each phase's name to [seconds, allocations, calls], in the order
+    # the phases started.
+    self._totals = {}
+    self._order = []
+
+  def _count_objects(self):
+    return len(gc.get_objects()) if self._count_allocations else 0
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    """A context manager that records the time the block it runs takes."""
+    self._names.append(name)
+    full_name = _SEPARATOR.join(self._names)
+    totals = self._totals.get(full_name)
+    if totals is None:
+      totals = self._totals[full_name] = [0.0, 0, 0]
+      self._order.append(full_name)
+    start_objects = self._count_objects()
+    start_time = time.time()
+    try:
+      yield
+    finally:
+      totals[0] += time.time() - start_time
+      totals[1] += self._count_objects() - start_objects
+      totals[2] += 1
+      self._names.pop()
+
+  def report(self):
+    """Returns a StartupReport of the phases recorded so far."""
+    phases = []
+    for name in self._order:
+      seconds, allocations, calls = self._totals[name]
+      phases.append(StartupPhase(
+          name, seconds,
+          allocations if self._count_allocations else None, calls))
+    return StartupReport(phases)
+
+
+@contextlib.contextmanager
+def start(count_allocations=False):
+  """Trace the phases of startup run on this thread in the block.
+
+  Args:
+    count_allocations: Whether to count the objects each phase creates.
+      Python 2 has no cheap way to count allocations, so this lists every
+      object tracked by the garbage collector at the start and end of each
+      phase, which makes startup noticeably slower.
+
+  Yields:
+    The tracer, whose report() method returns a StartupReport.
+  """
+  outer = getattr(_local, 'tracer', None)
+  tracer = _local.tracer = _Tracer(count_allocations)
+  try:
+    yield tracer
+  finally:
+    _local.tracer = outer
+
+
+@contextlib.contextmanager
+def trace(name):
+  """Record the time the block takes as a phase, if startup is being traced.
+
+  Args:
+    name: A string, the name of the phase.  It mustn't contain a slash.
+  """
+  tracer = getattr(_local, 'tracer', None)
+  if tracer is None:
+    yield
+  else:
+    with tracer.phase(name):
+      yield
@@ -22,11 +22,15 @@ will be provided elsewhere in the future.
 from __future__ import absolute_import
 
 import base64
+import collections
+import contextlib
+import hashlib
 import hmac
 import json
 import logging
 import os
 import re
+import threading
 import time
 import urllib
 from collections import Container as _Container
@@ -38,7 +42,10 @@ from google.appengine.api import oauth
 from google.appengine.api import urlfetch
 from google.appengine.api import users
 
+import attr
+
 from . import constants
+from . import shared_cache
 from . import types as endpoints_types
 
 try:
@@ -48,11 +55,31 @@ try:
   # Disable "Import not at top of file" warning.
   # pylint: disable=g-import-not-at-top
   from Crypto.Hash import SHA256
+  from Crypto.Hash import SHA384
+  from Crypto.Hash import SHA512
   from Crypto.PublicKey import RSA
   # pylint: enable=g-import-not-at-top
-  _CRYPTO_LOADED = True
+  _PYCRYPTO_LOADED = True
 except ImportError:
-  _CRYPTO_LOADED = False
+  _PYCRYPTO_LOADED = False
+
+try:
+  # The cryptography package is faster than PyCrypto, and supports EC keys,
+  # so it's used instead when it's installed.
+  # pylint: disable=g-import-not-at-top
+  from cryptography import exceptions as cryptography_exceptions
+  from cryptography.hazmat.backends import default_backend
+  from cryptography.hazmat.primitives import hashes
+  from cryptography.hazmat.primitives.asymmetric import ec
+  from cryptography.hazmat.primitives.asymmetric import padding
+  from cryptography.hazmat.primitives.asymmetric import rsa
+  from cryptography.hazmat.primitives.asymmetric import utils as asymmetric_utils
+  # pylint: enable=g-import-not-at-top
+  _CRYPTOGRAPHY_LOADED = True
+except ImportError:
+  _CRYPTOGRAPHY_LOADED = False
+
+_CRYPTO_LOADED = _CRYPTOGRAPHY_LOADED or _PYCRYPTO_LOADED
 
 
 __all__ = [
@@ -78,6 +105,33 @@ _EMAIL_SCOPE = 'https://www.googleapis.com/auth/userinfo.email'
 _TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v3/tokeninfo'
 _MAX_AGE_REGEX = re.compile(r'\s*max-age\s*=\s*(\d+)\s*')
 _CERT_NAMESPACE = '__verify_jwt'
+# The key in cached certs that records when they expire, in seconds since the
+# epoch.
+_CERT_EXPIRATION_KEY = 'endpointsExpirationTime'
+# How long public keys are kept in process when the cached certs they were
+# built from don't record when they expire.
+_DEFAULT_PUBLIC_KEY_CACHE_SECS = 60
+# The number of token verification results kept in process.
+_VERIFIED_TOKEN_CACHE_SIZE = 1024
+# How long a token that failed verification is remembered.
+_NEGATIVE_TOKEN_CACHE_SECS = 10
+# The namespace of verification results in a SharedMemoryCache.
+_VERIFIED_TOKEN_NAMESPACE = '__verified_token'
+# The number of tokeninfo endpoint responses kept in process.
+_TOKEN_INFO_CACHE_SIZE = 1024
+# The longest a tokeninfo endpoint response is kept, if the token doesn't
+# expire first.
+_TOKEN_INFO_CACHE_SECS = 300
+# The most time before certs expire that they're refreshed in the background.
+_CERT_REFRESH_MARGIN_SECS = 300
+# How long to wait before trying again to refresh certs that couldn't be
+# fetched.
+_CERT_REFRESH_RETRY_SECS = 30
+# How long past their expiration time keys may still be used while new certs
+# are being fetched, or when they can't be fetched.
+_MAX_STALE_CERT_SECS = 3600
+# How long a request waits for certs that another request is fetching.
+_CERT_FETCH_WAIT_SECS = 10
 _ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
 _DEFAULT_GOOGLE_ISSUER = {
     'google_id_token': endpoints_types.Issuer(_ISSUERS, _DEFAULT_CERT_URI)
@@ -122,25 +176,26 @@ def get_current_user():
   if not _is_auth_info_available():
     raise InvalidGetUserCall('No valid endpoints user in environment.')
 
-  if _ENDPOINTS_USER_INFO in os.environ:
-    user_info = os.environ[_ENDPOINTS_USER_INFO]
+  auth_vars = _get_auth_vars()
+  if _ENDPOINTS_USER_INFO in auth_vars:
+    user_info = auth_vars[_ENDPOINTS_USER_INFO]
     return users.User(user_info.email)
 
-  if _ENV_USE_OAUTH_SCOPE in os.environ:
+  if _ENV_USE_OAUTH_SCOPE in auth_vars:
     # We can get more information from the oauth.get_current_user function,
     # as long as we know what scope to use.  Since that scope has been
     # cached, we can just return this:
-    return oauth.get_current_user(os.environ[_ENV_USE_OAUTH_SCOPE].split())
+    return oauth.get_current_user(auth_vars[_ENV_USE_OAUTH_SCOPE].split())
 
-  if (_ENV_AUTH_EMAIL in os.environ and
-      _ENV_AUTH_DOMAIN in os.environ):
-    if not os.environ[_ENV_AUTH_EMAIL]:
+  if (_ENV_AUTH_EMAIL in auth_vars and
+      _ENV_AUTH_DOMAIN in auth_vars):
+    if not auth_vars[_ENV_AUTH_EMAIL]:
       # Either there was no id token or we were unable to validate it,
       # so there's no user.
       return None
 
-    return users.User(os.environ[_ENV_AUTH_EMAIL],
-                      os.environ[_ENV_AUTH_DOMAIN] or None)
+    return users.User(auth_vars[_ENV_AUTH_EMAIL],
+                      auth_vars[_ENV_AUTH_DOMAIN] or None)
 
   # Shouldn't hit this, because all the _is_auth_info_available cases were
   # checked, but just in case.
@@ -150,9 +205,175 @@ def get_current_user():
 # pylint: disable=g-bad-name
 def _is_auth_info_available():
   """Check if user auth info has been set in environment variables."""
-  return (_ENDPOINTS_USER_INFO in os.environ or
-          (_ENV_AUTH_EMAIL in os.environ and _ENV_AUTH_DOMAIN in os.environ) or
-          _ENV_USE_OAUTH_SCOPE in os.environ)
+  auth_vars = _get_auth_vars()
+  return (_ENDPOINTS_USER_INFO in auth_vars or
+          (_ENV_AUTH_EMAIL in auth_vars and _ENV_AUTH_DOMAIN in auth_vars) or
+          _ENV_USE_OAUTH_SCOPE in auth_vars)
+
+
+class _ThreadLocalContextStorage(object):
+  """Keeps the auth context of the request a thread is handling."""
+
+  def __init__(self):
+    self._local = threading.local()
+
+  def get(self):
+    return getattr(self._local, 'context', None)
+
+  def set(self, context):
+    self._local.context = context
+
+
+_context_storage = _ThreadLocalContextStorage()
+
+
+# The cache for issuer certs and verified tokens used to authenticate calls to
+# API methods.  api_server's auth_cache argument replaces it.
+_auth_cache = memcache
+
+
+def _set_auth_cache(cache):
+  """Replace the cache used to authenticate calls to API methods.
+
+  Args:
+    cache: A cache with the memcache module's get and set functions, such as
+      a SharedMemoryCache, or None to restore memcache.
+  """
+  global _auth_cache  # pylint: disable=global-statement
+  _auth_cache = cache or memcache
+
+
+def _set_context_storage(storage):
+  """Replace where the auth context of the current request is kept.
+
+  Requests are assumed to be handled on their own threads.  Servers that
+  handle them on greenlets or coroutines that don't have their own
+  threading.local should keep the context elsewhere, eg. in a
+  contextvars.ContextVar.
+
+  Args:
+    storage: An object with a get() method that returns the current context,
+      or None if there isn't one, and a set(context) method.  None restores
+      the thread-local default.
+  """
+  global _context_storage  # pylint: disable=global-statement
+  _context_storage = storage or _ThreadLocalContextStorage()
+
+
+@contextlib.contextmanager
+def _request_auth_context(environ):
+  """Keep auth state in a request-local context while handling a request.
+
+  Inside the context, the auth variables that used to be set in os.environ,
+  such as ENDPOINTS_AUTH_EMAIL, are kept in a dict that's local to the
+  request instead, so concurrent requests on other threads can't see them.
+  The Authorization header and the user info set by
+  endpoints_management.control.wsgi.AuthenticationMiddleware are read from
+  environ rather than os.environ.  Outside any context, os.environ is used as
+  before.
+
+  If a context is already active, eg. because the request went through the
+  EndpointsDispatcherMiddleware, that context is used.
+
+  Args:
+    environ: The WSGI environ of the request.
+
+  Yields:
+    The dict of auth variables for the request.
+  """
+  context = _context_storage.get()
+  if context is not None:
+    yield context
+    return
+  context = dict((name, environ[name])
+                 for name in ('HTTP_AUTHORIZATION', _ENDPOINTS_USER_INFO)
+                 if environ.get(name) is not None)
+  _context_storage.set(context)
+  try:
+    yield context
+  finally:
+    _context_storage.set(None)
+
+
+def _get_auth_vars():
+  """Get the mapping that auth variables are read from and set in.
+
+  Returns:
+    The auth context of the current request if there is one, or os.environ.
+  """
+  context = _context_storage.get()
+  return os.environ if context is None else context
+
+
+def _freeze(value):
+  """Returns an immutable copy of a list-like or mapping auth setting."""
+  if value is None or isinstance(value, basestring):
+    return value
+  if isinstance(value, _Mapping):
+    return dict((key, _freeze(item)) for key, item in value.iteritems())
+  return tuple(value)
+
+
+@attr.s(frozen=True, slots=True)
+class _AuthPolicy(object):
+  """The effective auth settings for calls to one API method.
+
+  Merging the method's settings with the API's and parsing the scopes only
+  needs to happen once per method, so _MethodInfo.get_auth_policy builds a
+  policy on first use and every request after that shares it.  Nothing in a
+  policy may be modified.
+  """
+  scopes = attr.ib()
+  audiences = attr.ib()
+  allowed_client_ids = attr.ib()
+  # allowed_client_ids with the API Explorer's client ID, for the dev server.
+  local_allowed_client_ids = attr.ib()
+  issuers = attr.ib()
+  # The return value of _process_scopes(scopes).
+  processed_scopes = attr.ib()
+  # Whether bearer tokens should be checked as id tokens first.
+  check_id_token = attr.ib()
+
+  @classmethod
+  def create(cls, scopes, audiences, allowed_client_ids, issuers):
+    """Build a policy from the settings that apply to a method.
+
+    Args:
+      scopes: List of acceptable scopes, or None.
+      audiences: List of acceptable audiences, a dict mapping issuer names to
+        lists of audiences, or None.
+      allowed_client_ids: List of client IDs that are acceptable, or None.
+      issuers: dict mapping issuer names to endpoints.Issuer objects, or None
+        for just the Google id token issuer.  This isn't modified.
+
+    Returns:
+      An _AuthPolicy.
+    """
+    scopes = _freeze(scopes)
+    allowed_client_ids = _freeze(allowed_client_ids)
+    local_allowed_client_ids = allowed_client_ids
+    if allowed_client_ids:
+      local_allowed_client_ids = (
+          (constants.API_EXPLORER_CLIENT_ID,) + tuple(allowed_client_ids))
+    if issuers is None:
+      issuers = _DEFAULT_GOOGLE_ISSUER
+    else:
+      issuers = dict(issuers)
+      issuers.setdefault('google_id_token',
+                         _DEFAULT_GOOGLE_ISSUER['google_id_token'])
+    all_scopes, sufficient_scopes = _process_scopes(scopes or ())
+    return cls(
+        scopes=scopes, audiences=_freeze(audiences),
+        allowed_client_ids=allowed_client_ids,
+        local_allowed_client_ids=local_allowed_client_ids, issuers=issuers,
+        processed_scopes=(frozenset(all_scopes), frozenset(sufficient_scopes)),
+        check_id_token=bool(scopes == (_EMAIL_SCOPE,) and allowed_client_ids))
+
+  @property
+  def is_empty(self):
+    """Whether the method accepts no tokens at all."""
+    return (not self.scopes and not self.audiences and
+            not self.allowed_client_ids)
 
 
 def _maybe_set_current_user_vars(method, api_info=None, request=None):
@@ -172,12 +393,12 @@ def _maybe_set_current_user_vars(method, api_info=None, request=None):
     return
 
   # By default, there's no user.
-  os.environ[_ENV_AUTH_EMAIL] = ''
-  os.environ[_ENV_AUTH_DOMAIN] = ''
+  auth_vars = _get_auth_vars()
+  auth_vars[_ENV_AUTH_EMAIL] = ''
+  auth_vars[_ENV_AUTH_DOMAIN] = ''
 
-  # Choose settings on the method, if specified.  Otherwise, choose settings
-  # from the API.  Specifically check for None, so that methods can override
-  # with empty lists.
+  # The method's settings, if specified, override the API's.  They're merged
+  # once per method, in _MethodInfo.get_auth_policy.
   try:
     api_info = api_info or method.im_self.api_info
   except AttributeError:
@@ -189,21 +410,9 @@ def _maybe_set_current_user_vars(method, api_info=None, request=None):
     _logger.warning('AttributeError when accessing %s.im_self.  An unbound '
                     'method was probably passed as an endpoints handler.',
                     method.__name__)
-    scopes = method.method_info.scopes
-    audiences = method.method_info.audiences
-    allowed_client_ids = method.method_info.allowed_client_ids
-  else:
-    scopes = (method.method_info.scopes
-              if method.method_info.scopes is not None
-              else api_info.scopes)
-    audiences = (method.method_info.audiences
-                 if method.method_info.audiences is not None
-                 else api_info.audiences)
-    allowed_client_ids = (method.method_info.allowed_client_ids
-                          if method.method_info.allowed_client_ids is not None
-                          else api_info.allowed_client_ids)
-
-  if not scopes and not audiences and not allowed_client_ids:
+  policy = method.method_info.get_auth_policy(api_info)
+
+  if policy.is_empty:
     # The user hasn't provided any information to allow us to parse either
     # an id_token or an Oauth token.  They appear not to be interested in
     # auth.
@@ -213,36 +422,33 @@ def _maybe_set_current_user_vars(method, api_info=None, request=None):
   if not token:
     return None
 
-  if allowed_client_ids and _is_local_dev():
-    allowed_client_ids = (constants.API_EXPLORER_CLIENT_ID,) + tuple(allowed_client_ids)
+  local_dev = _is_local_dev()
+  allowed_client_ids = (policy.local_allowed_client_ids if local_dev
+                        else policy.allowed_client_ids)
 
   # When every item in the acceptable scopes list is
   # "https://www.googleapis.com/auth/userinfo.email", and there is a non-empty
   # allowed_client_ids list, the API code will first attempt OAuth 2/OpenID
   # Connect ID token processing for any incoming bearer token.
-  if ((scopes == [_EMAIL_SCOPE] or scopes == (_EMAIL_SCOPE,)) and
-      allowed_client_ids):
+  if policy.check_id_token:
     _logger.debug('Checking for id_token.')
-    issuers = api_info.issuers
-    if issuers is None:
-      issuers = _DEFAULT_GOOGLE_ISSUER
-    elif 'google_id_token' not in issuers:
-      issuers.update(_DEFAULT_GOOGLE_ISSUER)
     time_now = long(time.time())
-    user = _get_id_token_user(token, issuers, audiences, allowed_client_ids,
-                              time_now, memcache)
+    user = _get_id_token_user(token, policy.issuers, policy.audiences,
+                              allowed_client_ids, time_now, _auth_cache)
     if user:
-      os.environ[_ENV_AUTH_EMAIL] = user.email()
-      os.environ[_ENV_AUTH_DOMAIN] = user.auth_domain()
+      auth_vars[_ENV_AUTH_EMAIL] = user.email()
+      auth_vars[_ENV_AUTH_DOMAIN] = user.auth_domain()
       return
 
   # Check if the user is interested in an oauth token.
-  if scopes:
+  if policy.scopes:
     _logger.debug('Checking for oauth token.')
-    if _is_local_dev():
-      _set_bearer_user_vars_local(token, allowed_client_ids, scopes)
+    if local_dev:
+      _set_bearer_user_vars_local(token, allowed_client_ids, policy.scopes,
+                                  processed_scopes=policy.processed_scopes)
     else:
-      _set_bearer_user_vars(allowed_client_ids, scopes)
+      _set_bearer_user_vars(allowed_client_ids, policy.scopes,
+                            processed_scopes=policy.processed_scopes)
 
 
 def _get_token(
@@ -266,7 +472,7 @@ def _get_token(
   allowed_auth_schemes = _listlike_guard(
       allowed_auth_schemes, 'allowed_auth_schemes', iterable_only=True)
   # Check if the token is in the Authorization header.
-  auth_header = os.environ.get('HTTP_AUTHORIZATION')
+  auth_header = _get_auth_vars().get('HTTP_AUTHORIZATION')
   if auth_header:
     for auth_scheme in allowed_auth_schemes:
       if auth_header.startswith(auth_scheme):
@@ -285,9 +491,170 @@ def _get_token(
         return token
 
 
+class _VerifiedTokenCache(object):
+  """Bounded LRU cache of token verification results.
+
+  A token that verified is remembered until it expires.  One that didn't is
+  remembered briefly, so a client repeating a bad token can't make us check
+  its signature on every request.
+  """
+
+  def __init__(self, max_size, negative_ttl):
+    """Constructor for _VerifiedTokenCache.
+
+    Args:
+      max_size: An int, the maximum number of results to keep.
+      negative_ttl: A number, the seconds to remember a failed verification.
+    """
+    self._max_size = max_size
+    self._negative_ttl = negative_ttl
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def make_key(token, *policy):
+    """Returns the cache key for verifying token against a policy.
+
+    Args:
+      token: The token string.
+      *policy: Values that the verification result depends on, such as the
+        allowed issuers and audiences.  Their repr must be stable.
+
+    Returns:
+      A string.  Only a hash of the token is kept.
+    """
+    return hashlib.sha256(repr((token,) + policy)).digest()
+
+  def get(self, key, time_now):
+    """Return the (result,) tuple cached for key, or None on a cache miss.
+
+    Args:
+      key: A key from make_key.
+      time_now: The current time, as a long (eg. long(time.time())).
+
+    Returns:
+      A tuple with the cached result, which is None for a token that failed
+      verification.  None if nothing's cached for key.
+    """
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        result, verified_time, expiration_time = entry
+        if verified_time <= time_now < expiration_time:
+          # Re-insert to mark the entry as the most recently used.
+          self._entries[key] = entry
+          self.hits += 1
+          return (result,)
+      self.misses += 1
+      return None
+
+  def put(self, key, result, time_now, expiration_time=None):
+    """Cache a verification result.
+
+    Args:
+      key: A key from make_key.
+      result: The result of verifying the token, or None if it failed.
+      time_now: The time the token was verified at.
+      expiration_time: When the token expires, in seconds since the epoch.
+        Only used if result isn't None.
+    """
+    if result is None:
+      expiration_time = time_now + self._negative_ttl
+    elif expiration_time is None:
+      return
+    with self._lock:
+      self._entries.pop(key, None)
+      self._entries[key] = result, time_now, expiration_time
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def info(self):
+    with self._lock:
+      return {'hits': self.hits, 'misses': self.misses,
+              'size': len(self._entries), 'max_size': self._max_size}
+
+
+_verified_tokens = _VerifiedTokenCache(_VERIFIED_TOKEN_CACHE_SIZE,
+                                       _NEGATIVE_TOKEN_CACHE_SECS)
+# Responses from the tokeninfo endpoint, used on the dev server.
+_token_infos = _VerifiedTokenCache(_TOKEN_INFO_CACHE_SIZE,
+                                   _NEGATIVE_TOKEN_CACHE_SECS)
+
+
+def _get_verified_token(key, time_now, cache, decode=None):
+  """Look up a token verification result in process, then in cache.
+
+  Results are only shared through cache if it's a SharedMemoryCache, since
+  other caches, such as memcache, are slower to check than a signature.
+
+  Args:
+    key: A key from _VerifiedTokenCache.make_key.
+    time_now: The current time, as a long (eg. long(time.time())).
+    cache: The cache the token's certs are kept in.
+    decode: A function to rebuild a result from what encode returned in
+      _put_verified_token, or None if results are stored as is.
+
+  Returns:
+    A tuple with the cached result, which is None for a token that failed
+    verification.  None if nothing's cached for key.
+  """
+  cached = _verified_tokens.get(key, time_now)
+  if cached is None and isinstance(cache, shared_cache.SharedMemoryCache):
+    entry = cache.get(key.encode('hex'), namespace=_VERIFIED_TOKEN_NAMESPACE)
+    if entry is not None:
+      result, expiration_time = entry
+      if result is not None and decode is not None:
+        result = decode(result)
+      _verified_tokens.put(key, result, time_now, expiration_time)
+      cached = (result,)
+  return cached
+
+
+def _put_verified_token(key, result, time_now, expiration_time, cache,
+                        encode=None):
+  """Cache a token verification result in process, and in cache if shared.
+
+  Args:
+    key: A key from _VerifiedTokenCache.make_key.
+    result: The result of verifying the token, or None if it failed.
+    time_now: The time the token was verified at.
+    expiration_time: When the token expires, in seconds since the epoch.
+    cache: The cache the token's certs are kept in.
+    encode: A function to make a result JSON serializable, or None if it
+      already is.
+  """
+  _verified_tokens.put(key, result, time_now, expiration_time)
+  if not isinstance(cache, shared_cache.SharedMemoryCache):
+    return
+  if result is None:
+    expiration_time = time_now + _NEGATIVE_TOKEN_CACHE_SECS
+  elif expiration_time is None:
+    return
+  elif encode is not None:
+    result = encode(result)
+  # Expiration times are absolute, as memcache allows for large values.
+  cache.set(key.encode('hex'), [result, expiration_time],
+            time=expiration_time, namespace=_VERIFIED_TOKEN_NAMESPACE)
+
+
+def _sorted_items(value):
+  """Returns the sorted items of a mapping, or value if it isn't one."""
+  if isinstance(value, _Mapping):
+    return sorted(value.items())
+  return value
+
+
 def _get_id_token_user(token, issuers, audiences, allowed_client_ids, time_now, cache):
   """Get a User for the given id token, if the token is valid.
 
+  Results are cached, so a token is only verified once for a policy.
+
   Args:
     token: The id_token to check.
     issuers: dict of Issuers
@@ -299,6 +666,35 @@ def _get_id_token_user(token, issuers, audiences, allowed_client_ids, time_now,
   Returns:
     A User if the token is valid, None otherwise.
   """
+  key = _verified_tokens.make_key(
+      token, 'id_token', _sorted_items(issuers), _sorted_items(audiences),
+      allowed_client_ids)
+  cached = _get_verified_token(key, time_now, cache, decode=users.User)
+  if cached is not None:
+    return cached[0]
+  user, expiration_time = _verify_id_token_user(
+      token, issuers, audiences, allowed_client_ids, time_now, cache)
+  _put_verified_token(key, user, time_now, expiration_time, cache,
+                      encode=lambda user: user.email())
+  return user
+
+
+def _verify_id_token_user(token, issuers, audiences, allowed_client_ids,
+                          time_now, cache):
+  """Verify an id token and get its User.
+
+  Args:
+    token: The id_token to check.
+    issuers: dict of Issuers
+    audiences: List of audiences that are acceptable.
+    allowed_client_ids: List of client IDs that are acceptable.
+    time_now: The current time as a long (eg. long(time.time())).
+    cache: Cache to use (eg. the memcache module).
+
+  Returns:
+    A tuple (user, expiration_time).  user is a User if the token is valid,
+    None otherwise, and expiration_time is the token's exp if it's valid.
+  """
   # Verify that the token is valid before we try to extract anything from it.
   # This verifies the signature and some of the basic info in the token.
   for issuer_key, issuer in issuers.items():
@@ -327,7 +723,8 @@ def _get_id_token_user(token, issuers, audiences, allowed_client_ids, time_now,
       # and retrieved the ID from that, it'd be different from the ID we'd
       # return here, so it's safer to not return the ID.
       # Instead, we'll only return the email.
-      return users.User(email)
+      return users.User(email), parsed_token.get('exp')
+  return None, None
 
 
 # pylint: disable=unused-argument
@@ -376,7 +773,7 @@ def _are_scopes_sufficient(authorized_scopes, sufficient_scopes):
 
 
 
-def _set_bearer_user_vars(allowed_client_ids, scopes):
+def _set_bearer_user_vars(allowed_client_ids, scopes, processed_scopes=None):
   """Validate the oauth bearer token and set endpoints auth user variables.
 
   If the bearer token is valid, this sets ENDPOINTS_USE_OAUTH_SCOPE.  This
@@ -386,8 +783,10 @@ def _set_bearer_user_vars(allowed_client_ids, scopes):
   Args:
     allowed_client_ids: List of client IDs that are acceptable.
     scopes: List of acceptable scopes.
+    processed_scopes: The return value of _process_scopes(scopes), if it's
+      already known.
   """
-  all_scopes, sufficient_scopes = _process_scopes(scopes)
+  all_scopes, sufficient_scopes = processed_scopes or _process_scopes(scopes)
   try:
     authorized_scopes = oauth.get_authorized_scopes(sorted(all_scopes))
   except oauth.Error:
@@ -406,11 +805,12 @@ def _set_bearer_user_vars(allowed_client_ids, scopes):
     _logger.warning('Client ID is not allowed: %s', client_id)
     return
 
-  os.environ[_ENV_USE_OAUTH_SCOPE] = ' '.join(authorized_scopes)
+  _get_auth_vars()[_ENV_USE_OAUTH_SCOPE] = ' '.join(authorized_scopes)
   _logger.debug('get_current_user() will return user from matched oauth_user.')
 
 
-def _set_bearer_user_vars_local(token, allowed_client_ids, scopes):
+def _set_bearer_user_vars_local(token, allowed_client_ids, scopes, fetch=None,
+                                processed_scopes=None):
   """Validate the oauth bearer token on the dev server.
 
   Since the functions in the oauth module return only example results in local
@@ -422,19 +822,14 @@ def _set_bearer_user_vars_local(token, allowed_client_ids, scopes):
     token: String with the oauth token to validate.
     allowed_client_ids: List of client IDs that are acceptable.
     scopes: List of acceptable scopes.
+    fetch: A function like urlfetch.fetch to call the tokeninfo endpoint with.
+      Defaults to urlfetch.fetch.
+    processed_scopes: The return value of _process_scopes(scopes), if it's
+      already known.
   """
-  # Get token info from the tokeninfo endpoint.
-  result = urlfetch.fetch(
-      '%s?%s' % (_TOKENINFO_URL, urllib.urlencode({'access_token': token})))
-  if result.status_code != 200:
-    try:
-      error_description = json.loads(result.content)['error_description']
-    except (ValueError, KeyError):
-      error_description = ''
-    _logger.error('Token info endpoint returned status %s: %s',
-                  result.status_code, error_description)
+  token_info = _get_token_info(token, fetch)
+  if token_info is None:
     return
-  token_info = json.loads(result.content)
 
   # Validate email.
   if 'email' not in token_info:
@@ -452,17 +847,63 @@ def _set_bearer_user_vars_local(token, allowed_client_ids, scopes):
     return
 
   # Verify at least one of the scopes matches.
-  _, sufficient_scopes = _process_scopes(scopes)
+  _, sufficient_scopes = processed_scopes or _process_scopes(scopes)
   authorized_scopes = token_info.get('scope', '').split(' ')
   if not _are_scopes_sufficient(authorized_scopes, sufficient_scopes):
     _logger.warning('Oauth token scopes don\'t match any acceptable scopes.')
     return
 
-  os.environ[_ENV_AUTH_EMAIL] = token_info['email']
-  os.environ[_ENV_AUTH_DOMAIN] = ''
+  auth_vars = _get_auth_vars()
+  auth_vars[_ENV_AUTH_EMAIL] = token_info['email']
+  auth_vars[_ENV_AUTH_DOMAIN] = ''
   _logger.debug('Local dev returning user from token.')
 
 
+def _get_token_info(token, fetch=None):
+  """Get the tokeninfo endpoint's response for an oauth token.
+
+  Responses are cached in process by a hash of the token, for up to
+  _TOKEN_INFO_CACHE_SECS but never past the token's expires_in.  Error
+  responses are cached for _NEGATIVE_TOKEN_CACHE_SECS.
+
+  Args:
+    token: String with the oauth token.
+    fetch: A function like urlfetch.fetch to call the tokeninfo endpoint with.
+      Defaults to urlfetch.fetch.
+
+  Returns:
+    A dict with the token info, or None if the endpoint returned an error.
+  """
+  time_now = long(time.time())
+  key = _token_infos.make_key(token, 'tokeninfo')
+  cached = _token_infos.get(key, time_now)
+  if cached is not None:
+    return cached[0]
+
+  result = (fetch or urlfetch.fetch)(
+      '%s?%s' % (_TOKENINFO_URL, urllib.urlencode({'access_token': token})))
+  if result.status_code != 200:
+    try:
+      error_description = json.loads(result.content)['error_description']
+    except (ValueError, KeyError):
+      error_description = ''
+    _logger.error('Token info endpoint returned status %s: %s',
+                  result.status_code, error_description)
+    _token_infos.put(key, None, time_now)
+    return None
+  token_info = json.loads(result.content)
+
+  try:
+    expires_in = int(token_info.get('expires_in'))
+  except (TypeError, ValueError):
+    # Without knowing when the token expires, don't cache its info.
+    expiration_time = None
+  else:
+    expiration_time = time_now + min(expires_in, _TOKEN_INFO_CACHE_SECS)
+  _token_infos.put(key, token_info, time_now, expiration_time)
+  return token_info
+
+
 def _is_local_dev():
   return os.environ.get('SERVER_SOFTWARE', '').startswith('Development')
 
@@ -561,12 +1002,14 @@ def _get_cert_expiration_time(headers):
   return max(0, cache_time_seconds)
 
 
-def _get_cached_certs(cert_uri, cache):
+def _get_cached_certs(cert_uri, cache, fetch=None):
   """Get certs from cache if present; otherwise, gets from URI and caches them.
 
   Args:
     cert_uri: URI from which to retrieve certs if cache is stale or empty.
     cache: Cache of pre-fetched certs.
+    fetch: A function like urlfetch.fetch to retrieve the certs with.  Defaults
+      to urlfetch.fetch.
 
   Returns:
     The retrieved certs.
@@ -574,22 +1017,40 @@ def _get_cached_certs(cert_uri, cache):
   certs = cache.get(cert_uri, namespace=_CERT_NAMESPACE)
   if certs is None:
     _logger.debug('Cert cache miss for %s', cert_uri)
-    try:
-      result = urlfetch.fetch(cert_uri)
-    except AssertionError:
-      # This happens in unit tests.  Act as if we couldn't get any certs.
-      return None
+    certs = _fetch_certs(cert_uri, cache, fetch)
+  return certs
 
-    if result.status_code == 200:
-      certs = json.loads(result.content)
-      expiration_time_seconds = _get_cert_expiration_time(result.headers)
-      if expiration_time_seconds:
-        cache.set(cert_uri, certs, time=expiration_time_seconds,
-                  namespace=_CERT_NAMESPACE)
-    else:
-      _logger.error(
-          'Certs not available, HTTP request returned %d', result.status_code)
 
+def _fetch_certs(cert_uri, cache, fetch=None):
+  """Get certs from URI, bypassing the cache, and cache them.
+
+  Args:
+    cert_uri: URI from which to retrieve certs.
+    cache: Cache of pre-fetched certs.
+    fetch: A function like urlfetch.fetch to retrieve the certs with.  Defaults
+      to urlfetch.fetch.
+
+  Returns:
+    The retrieved certs, or None if they couldn't be retrieved.  The time they
+    expire is recorded in the certs under _CERT_EXPIRATION_KEY.
+  """
+  try:
+    result = (fetch or urlfetch.fetch)(cert_uri)
+  except AssertionError:
+    # This happens in unit tests.  Act as if we couldn't get any certs.
+    return None
+
+  if result.status_code != 200:
+    _logger.error(
+        'Certs not available, HTTP request returned %d', result.status_code)
+    return None
+
+  certs = json.loads(result.content)
+  expiration_time_seconds = _get_cert_expiration_time(result.headers)
+  certs[_CERT_EXPIRATION_KEY] = time.time() + expiration_time_seconds
+  if expiration_time_seconds:
+    cache.set(cert_uri, certs, time=expiration_time_seconds,
+              namespace=_CERT_NAMESPACE)
   return certs
 
 
@@ -600,6 +1061,489 @@ def _b64_to_long(b):
   return long(b.encode('hex'), 16)
 
 
+class _PublicKeyCache(object):
+  """In-process cache of the public keys constructed from certs.
+
+  Keys are cached by cert URI for as long as the certs they were built from
+  may be cached, so verifying a token needs no parsing and no cache RPC.
+  Entries are kept per backing cache (eg. the memcache module), since each
+  can hold different certs.
+  """
+
+  def __init__(self):
+    # id(backing cache) => (backing cache, {cert_uri: (keys, expiration)}).
+    # Modules can't be weakly referenced, so the backing cache is held here
+    # to keep its id from being reused.
+    self._entries = {}
+    self._lock = threading.Lock()
+
+  def get(self, cache, cert_uri):
+    """Returns the cached entry for cert_uri, even if it has expired.
+
+    Args:
+      cache: The backing cache the keys were loaded from.
+      cert_uri: The URI of the certs the keys were built from.
+
+    Returns:
+      A (keys, expiration time) tuple, or None on a cache miss.
+    """
+    with self._lock:
+      _, entries = self._entries.get(id(cache), (None, {}))
+      return entries.get(cert_uri)
+
+  def put(self, cache, cert_uri, keys, expiration_time):
+    """Caches the keys for cert_uri until expiration_time."""
+    if expiration_time <= time.time():
+      return
+    with self._lock:
+      _, entries = self._entries.setdefault(id(cache), (cache, {}))
+      entries[cert_uri] = keys, expiration_time
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+_public_keys = _PublicKeyCache()
+
+
+class _CertFetch(object):
+  """A fetch of certs in progress, which other requests can wait for."""
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.keys = None
+    self.expiration_time = None
+
+
+class _CertManager(object):
+  """Keeps the public keys of issuers' certs ready to verify tokens with.
+
+  Keys are served from a _PublicKeyCache.  When they're missing or expired,
+  one request fetches the certs while concurrent requests for the same certs
+  wait for its result, so expiring certs don't send every request to the cert
+  URI at once.  Expired keys keep being served, for up to
+  _MAX_STALE_CERT_SECS, while new certs are being fetched or if they can't be
+  fetched.
+
+  Cert URIs passed to start() are also fetched on a background thread as soon
+  as it starts, then refreshed shortly before they expire, so requests don't
+  wait for certs at all.
+  """
+
+  def __init__(self, public_keys, fetch=None):
+    """Constructor for _CertManager.
+
+    Args:
+      public_keys: The _PublicKeyCache to keep keys in.
+      fetch: A function like urlfetch.fetch to retrieve certs with.  Defaults
+        to urlfetch.fetch.
+    """
+    self._public_keys = public_keys
+    self._fetch = fetch
+    self._lock = threading.Lock()
+    # Fetches in progress, as (id(cache), cert_uri) => _CertFetch.
+    self._fetches = {}
+    # Certs refreshed in the background, as (cert_uri, cache) => the time of
+    # their next refresh, or None if they haven't been fetched yet.
+    self._refresh_times = {}
+    self._wakeup = threading.Event()
+    self._stopped = False
+    self._thread = None
+
+  def get_keys(self, cert_uri, cache):
+    """Get the public keys of the certs at cert_uri.
+
+    Args:
+      cert_uri: URI from which to retrieve certs if cache is stale or empty.
+      cache: Cache of pre-fetched certs.
+
+    Returns:
+      A _PublicKeySet, or None if the certs can't be retrieved.
+    """
+    entry = self._public_keys.get(cache, cert_uri)
+    stale_keys = None
+    if entry is not None:
+      keys, expiration_time = entry
+      time_now = time.time()
+      if time_now < expiration_time:
+        return keys
+      if time_now < expiration_time + _MAX_STALE_CERT_SECS:
+        stale_keys = keys
+        with self._lock:
+          if (id(cache), cert_uri) in self._fetches:
+            return stale_keys
+    keys = self._load(cert_uri, cache).keys
+    if keys is None and stale_keys is not None:
+      _logger.warning('Using expired certs from %s', cert_uri)
+      return stale_keys
+    return keys
+
+  def _load(self, cert_uri, cache, use_cache=True):
+    """Fetch certs and build their keys, unless another thread is doing so.
+
+    Args:
+      cert_uri: URI from which to retrieve certs.
+      cache: Cache of pre-fetched certs.
+      use_cache: Whether certs may be read from cache, rather than fetched
+        from cert_uri.
+
+    Returns:
+      The _CertFetch with the keys that were built, or that another thread
+      built.  Its keys are None if the certs couldn't be retrieved.
+    """
+    key = id(cache), cert_uri
+    with self._lock:
+      fetch = self._fetches.get(key)
+      waiting = fetch is not None
+      if not waiting:
+        fetch = self._fetches[key] = _CertFetch()
+    if waiting:
+      fetch.done.wait(_CERT_FETCH_WAIT_SECS)
+      return fetch
+
+    try:
+      if use_cache:
+        certs = _get_cached_certs(cert_uri, cache, self._fetch)
+      else:
+        certs = _fetch_certs(cert_uri, cache, self._fetch)
+      if certs is not None:
+        expiration_time = certs.get(_CERT_EXPIRATION_KEY)
+        if expiration_time is None:
+          expiration_time = time.time() + _DEFAULT_PUBLIC_KEY_CACHE_SECS
+        fetch.keys = _construct_public_keys(certs)
+        fetch.expiration_time = expiration_time
+        self._public_keys.put(cache, cert_uri, fetch.keys, expiration_time)
+    finally:
+      with self._lock:
+        del self._fetches[key]
+      fetch.done.set()
+    return fetch
+
+  def start(self, cert_uris, cache):
+    """Fetch certs in the background and keep them from expiring.
+
+    Args:
+      cert_uris: The URIs of the certs to refresh.
+      cache: Cache of pre-fetched certs.
+    """
+    with self._lock:
+      for cert_uri in cert_uris:
+        self._refresh_times.setdefault((cert_uri, cache), None)
+      self._stopped = False
+      if self._thread is None or not self._thread.is_alive():
+        self._thread = threading.Thread(
+            target=self._run, name='endpoints-cert-refresh')
+        self._thread.daemon = True
+        self._thread.start()
+    self._wakeup.set()
+
+  def stop(self):
+    """Stop refreshing certs in the background."""
+    with self._lock:
+      thread = self._thread
+      self._thread = None
+      self._stopped = True
+      self._refresh_times.clear()
+    self._wakeup.set()
+    if thread is not None and thread is not threading.current_thread():
+      thread.join()
+
+  def _run(self):
+    while True:
+      self._wakeup.clear()
+      with self._lock:
+        if self._stopped:
+          return
+        time_now = time.time()
+        due = [entry for entry, refresh_time in self._refresh_times.items()
+               if refresh_time is None or refresh_time <= time_now]
+      for cert_uri, cache in due:
+        self._refresh(cert_uri, cache)
+      with self._lock:
+        if self._stopped:
+          return
+        next_refresh_time = min(self._refresh_times.values() or [None])
+      if next_refresh_time is None:
+        self._wakeup.wait()
+      else:
+        self._wakeup.wait(max(0, next_refresh_time - time.time()))
+
+  def _refresh(self, cert_uri, cache):
+    """Fetch the certs at cert_uri, and schedule their next refresh."""
+    with self._lock:
+      # Certs that haven't been fetched yet may be in the cache already.
+      use_cache = self._refresh_times.get((cert_uri, cache)) is None
+    try:
+      fetch = self._load(cert_uri, cache, use_cache=use_cache)
+    except Exception:  # pylint: disable=broad-except
+      _logger.exception('Unable to refresh certs from %s', cert_uri)
+      fetch = _CertFetch()
+    time_now = time.time()
+    if fetch.expiration_time is not None and fetch.expiration_time > time_now:
+      time_left = fetch.expiration_time - time_now
+      refresh_time = fetch.expiration_time - min(_CERT_REFRESH_MARGIN_SECS,
+                                                 time_left / 2)
+    else:
+      refresh_time = time_now + _CERT_REFRESH_RETRY_SECS
+    with self._lock:
+      if (cert_uri, cache) in self._refresh_times:
+        self._refresh_times[cert_uri, cache] = refresh_time
+
+
+_cert_manager = _CertManager(_public_keys)
+
+
+def _start_cert_refresh(cert_uris, cache=None):
+  """Keep the certs at cert_uris fresh on a background thread.
+
+  Args:
+    cert_uris: The URIs of the certs to refresh.
+    cache: Cache of pre-fetched certs.  Defaults to the cache used to
+      authenticate calls to API methods.
+  """
+  _cert_manager.start(cert_uris, cache or _auth_cache)
+
+
+def _warm_certs(cert_uris, cache=None):
+  """Fetch the certs at cert_uris now, unless they're cached already.
+
+  Unlike _start_cert_refresh, this doesn't start a thread, so it's safe to
+  call in a process that then forks.  Certs that can't be fetched are
+  logged, and fetched again when they're first needed.
+
+  Args:
+    cert_uris: The URIs of the certs to fetch.
+    cache: Cache of pre-fetched certs.  Defaults to the cache used to
+      authenticate calls to API methods.
+  """
+  cache = cache or _auth_cache
+  for cert_uri in cert_uris:
+    try:
+      keys = _cert_manager.get_keys(cert_uri, cache)
+    except Exception as e:  # pylint: disable=broad-except
+      _logger.warning('Unable to fetch certs from %s: %s', cert_uri, e)
+      continue
+    if keys is None:
+      _logger.warning('Unable to fetch certs from %s', cert_uri)
+
+
+def _b64url_to_long(b):
+  return long(_urlsafe_b64decode(b).encode('hex'), 16)
+
+
+class _PyCryptoVerifier(object):
+  """Verifies JWT signatures with PyCrypto, which only supports RSA keys.
+
+  PyCrypto's PKCS1_v1_5 module encodes the expected message in pure Python
+  for every verification, so the signature is checked here by applying the
+  public key and comparing the result to the expected EMSA-PKCS1-v1_5 encoding
+  (RFC 8017, section 8.2.2).
+  """
+
+  name = 'pycrypto'
+
+  def __init__(self):
+    # The hash and DER encoded DigestInfo prefix for each algorithm.
+    self._hashes = {
+        'RS256': (SHA256, '3031300d060960864801650304020105000420'),
+        'RS384': (SHA384, '3041300d060960864801650304020205000430'),
+        'RS512': (SHA512, '3051300d060960864801650304020305000440'),
+    }
+    self.algorithms = frozenset(self._hashes)
+
+  def construct_rsa_key(self, modulus, exponent):
+    return RSA.construct((modulus, exponent))
+
+  def construct_ec_key(self, curve, x, y):
+    raise NotImplementedError('PyCrypto does not support EC keys')
+
+  def verify(self, algorithm, key, signed, signature):
+    """Check the signature of a JWT.
+
+    Args:
+      algorithm: The JWT's 'alg', which must be one of self.algorithms.
+      key: A public key built by this verifier.
+      signed: The signed part of the JWT, its header and payload.
+      signature: The decoded signature.
+
+    Returns:
+      True if signature is a valid signature of signed by key.
+    """
+    hash_module, digest_info = self._hashes[algorithm]
+    # The length of the key's modulus in bytes.
+    length = (key.size() + 8) // 8
+    if len(signature) != length:
+      return False
+    signature_long = long(signature.encode('hex'), 16)
+    if signature_long >= key.n:
+      return False
+    encoded = '%0*x' % (length * 2, key.encrypt(signature_long, '')[0])
+    # 0x00 0x01, at least 8 bytes of 0xff, 0x00, then the DigestInfo.
+    suffix = '00' + digest_info + hash_module.new(signed).hexdigest()
+    padding_length = length * 2 - 4 - len(suffix)
+    if padding_length < 16:
+      return False
+    expected = '0001' + 'f' * padding_length + suffix
+    # hmac.compare_digest(a, b) is used to avoid timing attacks.
+    return hmac.compare_digest(encoded, expected)
+
+
+class _CryptographyVerifier(object):
+  """Verifies JWT signatures with the cryptography package."""
+
+  name = 'cryptography'
+
+  def __init__(self):
+    self._backend = default_backend()
+    self._hashes = {
+        'RS256': hashes.SHA256, 'RS384': hashes.SHA384,
+        'RS512': hashes.SHA512, 'ES256': hashes.SHA256,
+    }
+    self._curves = {'P-256': ec.SECP256R1}
+    self.algorithms = frozenset(self._hashes)
+
+  def construct_rsa_key(self, modulus, exponent):
+    return rsa.RSAPublicNumbers(exponent, modulus).public_key(self._backend)
+
+  def construct_ec_key(self, curve, x, y):
+    numbers = ec.EllipticCurvePublicNumbers(x, y, self._curves[curve]())
+    return numbers.public_key(self._backend)
+
+  def verify(self, algorithm, key, signed, signature):
+    """Check the signature of a JWT.
+
+    Args:
+      algorithm: The JWT's 'alg', which must be one of self.algorithms.
+      key: A public key built by this verifier.
+      signed: The signed part of the JWT, its header and payload.
+      signature: The decoded signature.
+
+    Returns:
+      True if signature is a valid signature of signed by key.
+    """
+    hash_algorithm = self._hashes[algorithm]()
+    try:
+      if algorithm.startswith('RS'):
+        if not isinstance(key, rsa.RSAPublicKey):
+          return False
+        key.verify(signature, signed, padding.PKCS1v15(), hash_algorithm)
+      else:
+        # JWS encodes ECDSA signatures as the concatenated r and s values
+        # (RFC 7518, section 3.4), rather than in DER.
+        if (not isinstance(key, ec.EllipticCurvePublicKey) or
+            len(signature) != 64):
+          return False
+        r = long(signature[:32].encode('hex'), 16)
+        s = long(signature[32:].encode('hex'), 16)
+        key.verify(asymmetric_utils.encode_dss_signature(r, s), signed,
+                   ec.ECDSA(hash_algorithm))
+    except cryptography_exceptions.InvalidSignature:
+      return False
+    return True
+
+
+def _get_default_verifier():
+  """Get a verifier for the fastest crypto library available, if any."""
+  if _CRYPTOGRAPHY_LOADED:
+    return _CryptographyVerifier()
+  if _PYCRYPTO_LOADED:
+    return _PyCryptoVerifier()
+  return None
+
+
+_verifier = _get_default_verifier()
+
+
+class _PublicKeySet(object):
+  """The public keys constructed from a set of certs, indexed by key id."""
+
+  def __init__(self, keys):
+    """Constructor for _PublicKeySet.
+
+    Args:
+      keys: A list of (key id, public key) tuples.  The key id may be None.
+    """
+    self._keys = keys
+    self._keys_by_id = dict((key_id, key) for key_id, key in keys
+                            if key_id is not None)
+
+  def __len__(self):
+    return len(self._keys)
+
+  def __iter__(self):
+    return iter(self._keys)
+
+  def find(self, key_id):
+    """Get the keys to try when verifying a token signed with key_id.
+
+    Args:
+      key_id: The 'kid' in the token's header, or None if it has none.
+
+    Returns:
+      A list with just the key named key_id, or an empty list if there's no
+      such key.  All the keys are returned when the token doesn't name its key,
+      or when none of the certs have key ids to match it against.
+    """
+    if key_id is None or not self._keys_by_id:
+      return [key for _, key in self._keys]
+    key = self._keys_by_id.get(key_id)
+    return [] if key is None else [key]
+
+
+def _construct_public_keys(certs, verifier=None):
+  """Construct the public keys in a set of certs.
+
+  Args:
+    certs: A dict of certs, either with the modulus and exponent of each key in
+      'keyvalues', or a JSON Web Key Set (RFC 7517) with the keys in 'keys'.
+    verifier: The verifier to build keys for.  Defaults to _verifier.
+
+  Returns:
+    A _PublicKeySet.  Keys that can't be constructed are left out.
+  """
+  verifier = verifier or _verifier
+  keys = []
+  for keyvalue in certs.get('keyvalues', ()):
+    try:
+      modulus = _b64_to_long(keyvalue['modulus'])
+      exponent = _b64_to_long(keyvalue['exponent'])
+      keys.append((keyvalue.get('keyid'),
+                   verifier.construct_rsa_key(modulus, exponent)))
+    except Exception, e:  # pylint: disable=broad-except
+      # Log the exception for debugging purpose.
+      _logger.debug('Unable to construct public key: %s; skipping it.', e)
+  for jwk in certs.get('keys', ()):
+    if jwk.get('use', 'sig') != 'sig':
+      continue
+    try:
+      if jwk.get('kty') == 'RSA':
+        key = verifier.construct_rsa_key(_b64url_to_long(jwk['n']),
+                                         _b64url_to_long(jwk['e']))
+      elif jwk.get('kty') == 'EC':
+        key = verifier.construct_ec_key(jwk['crv'], _b64url_to_long(jwk['x']),
+                                        _b64url_to_long(jwk['y']))
+      else:
+        continue
+      keys.append((jwk.get('kid'), key))
+    except Exception, e:  # pylint: disable=broad-except
+      _logger.debug('Unable to construct public key: %s; skipping it.', e)
+  return _PublicKeySet(keys)
+
+
+def _get_public_keys(cert_uri, cache):
+  """Get the public keys to verify JWTs with, constructing them only once.
+
+  Args:
+    cert_uri: URI from which to retrieve certs if cache is stale or empty.
+    cache: Cache of pre-fetched certs.
+
+  Returns:
+    A _PublicKeySet, or None if the certs can't be retrieved.
+  """
+  return _cert_manager.get_keys(cert_uri, cache)
+
+
 def _verify_signed_jwt_with_certs(
     jwt, time_now, cache,
     cert_uri=_DEFAULT_CERT_URI):
@@ -608,20 +1552,20 @@ def _verify_signed_jwt_with_certs(
   See http://self-issued.info/docs/draft-jones-json-web-token.html.
 
   The PyCrypto library included with Google App Engine is severely limited and
-  so you have to use it very carefully to verify JWT signatures. The first
-  issue is that the library can't read X.509 files, so we make a call to a
-  special URI that has the public cert in modulus/exponent form in JSON.
+  can't read X.509 files, so we make a call to a special URI that has the
+  public cert in modulus/exponent form in JSON, or that serves a JSON Web Key
+  Set.
 
-  The second issue is that the RSA.verify method doesn't work, at least for
-  how the JWT tokens are signed, so we have to manually verify the signature
-  of the JWT, which means hashing the signed part of the JWT and comparing
-  that to the signature that's been encrypted with the public key.
+  Signatures are checked by _verifier, which uses the cryptography package if
+  it's installed and PyCrypto otherwise.  RS256, RS384 and RS512 are
+  supported with either; ES256 needs the cryptography package.
 
   Args:
     jwt: string, A JWT.
     time_now: The current time, as a long (eg. long(time.time())).
     cache: Cache to use (eg. the memcache module).
-    cert_uri: string, URI to get cert modulus and exponent in JSON format.
+    cert_uri: string, URI to get cert modulus and exponent in JSON format, or
+      a JSON Web Key Set.
 
   Returns:
     dict, The deserialized JSON payload in the JWT.
@@ -641,56 +1585,38 @@ def _verify_signed_jwt_with_certs(
 
   signature = _urlsafe_b64decode(segments[2])
 
-  # pycrypto only deals in integers, so we have to convert the string of bytes
-  # into a long.
-  lsignature = long(signature.encode('hex'), 16)
-
   # Verify expected header.
   header_body = _urlsafe_b64decode(segments[0])
   try:
     header = json.loads(header_body)
   except:
     raise _AppIdentityError("Can't parse header")
-  if header.get('alg') != 'RS256':
-    raise _AppIdentityError('Unexpected encryption algorithm: %r' %
-                            header.get('alg'))
 
   # Formerly we would parse the token body here.
   # However, it's not safe to do that without first checking the signature.
 
-  certs = _get_cached_certs(cert_uri, cache)
-  if certs is None:
-    raise _AppIdentityError(
-        'Unable to retrieve certs needed to verify the signed JWT')
-
   # Verify that we were able to load the Crypto libraries, before we try
   # to use them.
   if not _CRYPTO_LOADED:
-    raise _AppIdentityError('Unable to load pycrypto library.  Can\'t verify '
-                            'id_token signature.  See http://www.pycrypto.org '
-                            'for more information on pycrypto.')
+    raise _AppIdentityError('Unable to load the cryptography or pycrypto '
+                            'library.  Can\'t verify id_token signature.  See '
+                            'https://cryptography.io for more information on '
+                            'cryptography.')
+
+  algorithm = header.get('alg')
+  if algorithm not in _verifier.algorithms:
+    raise _AppIdentityError('Unexpected encryption algorithm: %r' % algorithm)
 
-  # SHA256 hash of the already 'signed' segment from the JWT. Since a SHA256
-  # hash, will always have length 64.
-  local_hash = SHA256.new(signed).hexdigest()
+  keys = _get_public_keys(cert_uri, cache)
+  if keys is None:
+    raise _AppIdentityError(
+        'Unable to retrieve certs needed to verify the signed JWT')
 
-  # Check signature.
+  # Check signature.  Only the key the token names is tried, if it names one.
   verified = False
-  for keyvalue in certs['keyvalues']:
+  for key in keys.find(header.get('kid')):
     try:
-      modulus = _b64_to_long(keyvalue['modulus'])
-      exponent = _b64_to_long(keyvalue['exponent'])
-      key = RSA.construct((modulus, exponent))
-
-      # Encrypt, and convert to a hex string.
-      hexsig = '%064x' % key.encrypt(lsignature, '')[0]
-      # Make sure we have only last 64 base64 chars
-      hexsig = hexsig[-64:]
-
-      # Check the signature on 'signed' by encrypting 'signature' with the
-      # public key and confirming the result matches the SHA256 hash of
-      # 'signed'. hmac.compare_digest(a, b) is used to avoid timing attacks.
-      verified = hmac.compare_digest(hexsig, local_hash)
+      verified = _verifier.verify(algorithm, key, signed, signature)
       if verified:
         break
     except Exception, e:  # pylint: disable=broad-except
@@ -771,7 +1697,8 @@ def get_verified_jwt(
   check_query_arg - Boolean; check 'access_token' query arg
 
   request - Must be the request object if check_query_arg is true; otherwise ignored.
-  cache - In testing, override the certificate cache
+  cache - The certificate cache.  A SharedMemoryCache also shares verified
+          tokens between processes.  In testing, override the certificate cache
   """
   if not (check_authorization_header or check_query_arg):
       raise ValueError(
@@ -786,12 +1713,52 @@ def get_verified_jwt(
   if token is None:
     return None
   time_now = long(time.time())
-  for provider in providers:
-    parsed_token = _parse_and_verify_jwt(
-        token, time_now, (provider['issuer'],), audiences, provider['cert_uri'], cache)
-    if parsed_token is not None:
-      return parsed_token
-  return None
+  key = _verified_tokens.make_key(
+      token, 'jwt', [(provider['issuer'], provider['cert_uri'])
+                     for provider in providers], audiences)
+  cached = _get_verified_token(key, time_now, cache)
+  if cached is not None:
+    parsed_token = cached[0]
+  else:
+    # Only verify the token against providers for the issuer it claims; the
+    # claim is checked again once the signature has been verified.
+    issuer = _get_unverified_issuer(token)
+    parsed_token = None
+    for provider in providers:
+      if provider['issuer'] != issuer:
+        continue
+      parsed_token = _parse_and_verify_jwt(
+          token, time_now, (provider['issuer'],), audiences, provider['cert_uri'], cache)
+      if parsed_token is not None:
+        break
+    _put_verified_token(key, parsed_token, time_now,
+                        parsed_token and parsed_token.get('exp'), cache)
+  # Callers get their own copy of the cached claims.
+  return dict(parsed_token) if parsed_token is not None else None
+
+
+def _get_unverified_issuer(token):
+  """Get the issuer a JWT claims, without verifying it.
+
+  The result can't be trusted; it's only useful to pick the certs to verify
+  the token with.
+
+  Args:
+    token: string, A JWT.
+
+  Returns:
+    The token's 'iss' claim, or None if it can't be decoded.
+  """
+  segments = token.split('.')
+  if len(segments) != 3:
+    return None
+  try:
+    body = json.loads(_urlsafe_b64decode(segments[1]))
+  except (TypeError, ValueError, UnicodeError):
+    return None
+  if not isinstance(body, dict):
+    return None
+  return body.get('iss')
 
 
 def _parse_and_verify_jwt(token, time_now, issuers, audiences, cert_uri, cache):
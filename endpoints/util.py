@@ -18,14 +18,26 @@
 from __future__ import absolute_import
 
 import cStringIO
+import hashlib
 import json
 import os
+import re
 import wsgiref.headers
+import zlib
 
 from google.appengine.api import app_identity
 from google.appengine.api.modules import modules
 
 
+# Content codings used to compress responses, in order of preference, and the
+# zlib wbits value that produces each of them.
+_RESPONSE_ENCODINGS = (('gzip', 16 + zlib.MAX_WBITS),
+                       ('deflate', zlib.MAX_WBITS))
+
+# An entity tag in an If-None-Match header, or '*'.
+_ENTITY_TAG_RE = re.compile(r'(?:W/)?"[^"]*"|\*')
+
+
 class StartResponseProxy(object):
   """Proxy for the typical WSGI start_response object."""
 
@@ -81,6 +93,43 @@ class StartResponseProxy(object):
   def response_exc_info(self):
     return self.call_context.get('exc_info')
 
+  def get_response_body_iter(self, body_iter):
+    """Get an iterable over the whole body, without buffering body_iter.
+
+    This must be called before the proxy is closed.
+
+    Args:
+      body_iter: The iterable returned by the WSGI app that was called with
+        Proxy as its start_response.
+
+    Returns:
+      An iterable over anything the app wrote through the callable returned
+      by Proxy, followed by the strings in body_iter.
+    """
+    written = self.response_body
+    if not written:
+      return body_iter
+    return _ChainedResponseBody(written, body_iter)
+
+
+class _ChainedResponseBody(object):
+  """A WSGI response body that starts with an already written string."""
+
+  def __init__(self, written, body_iter):
+    self._written = written
+    self._body_iter = body_iter
+
+  def __iter__(self):
+    yield self._written
+    for chunk in self._body_iter:
+      yield chunk
+
+  def close(self):
+    # Pass close() on to the app's iterable, as PEP-333 requires.
+    close = getattr(self._body_iter, 'close', None)
+    if close:
+      close()
+
 
 def send_wsgi_not_found_response(start_response, cors_handler=None):
   return send_wsgi_response('404 Not Found', [('Content-Type', 'text/plain')],
@@ -112,8 +161,15 @@ def send_wsgi_no_content_response(start_response, cors_handler=None):
                             cors_handler)
 
 
+def send_wsgi_not_modified_response(etag, start_response, cors_handler=None,
+                                    compression=None):
+  return send_wsgi_response('304 Not Modified', [('ETag', etag)], '',
+                            start_response, cors_handler=cors_handler,
+                            compression=compression)
+
+
 def send_wsgi_response(status, headers, content, start_response,
-                       cors_handler=None):
+                       cors_handler=None, compression=None):
   """Dump reformatted response to CGI start_response.
 
   This calls start_response and returns the response body.
@@ -126,6 +182,8 @@ def send_wsgi_response(status, headers, content, start_response,
     start_response: A function with semantics defined in PEP-333.
     cors_handler: A handler to process CORS request headers and update the
       headers in the response.  Or this can be None, to bypass CORS checks.
+    compression: A ResponseCompression to compress the content with, or None
+      to send it uncompressed.
 
   Returns:
     A string containing the response body.
@@ -133,16 +191,268 @@ def send_wsgi_response(status, headers, content, start_response,
   if cors_handler:
     cors_handler.update_headers(headers)
 
-  # Update content length.
+  if compression:
+    headers, content = compression.compress_response(headers, content)
+
+  # Update content length.  A 304 has no body, and its Content-Length would be
+  # the length of the body it stands for, so it's left out.
   content_len = len(content) if content else 0
   headers = [(header, value) for header, value in headers
              if header.lower() != 'content-length']
-  headers.append(('Content-Length', '%s' % content_len))
+  if not status.startswith('304'):
+    headers.append(('Content-Length', '%s' % content_len))
 
   start_response(status, headers)
   return content
 
 
+def send_wsgi_streaming_response(status, headers, body_iter, start_response,
+                                 cors_handler=None, compression=None):
+  """Start a response whose body is streamed from an iterable.
+
+  Unlike send_wsgi_response, this doesn't need the whole body in memory.
+  The Content-Length header is only set when the length is known: from the
+  headers passed in, or from body_iter if it's a list or tuple.
+
+  Args:
+    status: A string containing the HTTP status code to send.
+    headers: A list of (header, value) tuples, the headers to send in the
+      response.
+    body_iter: An iterable over the strings of the body content.
+    start_response: A function with semantics defined in PEP-333.
+    cors_handler: A handler to process CORS request headers and update the
+      headers in the response.  Or this can be None, to bypass CORS checks.
+    compression: A ResponseCompression to compress the body with as it's
+      streamed, or None to send it uncompressed.
+
+  Returns:
+    An iterable over the strings of the body to send.
+  """
+  if cors_handler:
+    cors_handler.update_headers(headers)
+
+  if compression:
+    headers, body_iter = compression.compress_response_iter(headers, body_iter)
+
+  if isinstance(body_iter, (list, tuple)):
+    headers = [(header, value) for header, value in headers
+               if header.lower() != 'content-length']
+    headers.append(('Content-Length',
+                    '%s' % sum(len(chunk) for chunk in body_iter)))
+
+  start_response(status, headers)
+  return body_iter
+
+
+def _get_header(headers, name):
+  """Returns the value of a header in a list of (header, value) tuples."""
+  name = name.lower()
+  for header, value in headers:
+    if header.lower() == name:
+      return value
+  return None
+
+
+def compute_etag(content):
+  """Compute a strong entity tag for a response body.
+
+  Args:
+    content: A string, the response body.
+
+  Returns:
+    A quoted entity tag string, suitable for an ETag header.
+  """
+  return '"%s"' % hashlib.sha1(content).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+  """Check whether an If-None-Match header matches an entity tag.
+
+  This uses the weak comparison that If-None-Match calls for, so W/"x"
+  matches "x".
+
+  Args:
+    if_none_match: The value of the request's If-None-Match header, or None.
+    etag: A quoted entity tag string, the ETag of the current response.
+
+  Returns:
+    True if the client's cached response is current, so a 304 can be sent.
+  """
+  if not if_none_match:
+    return False
+  if etag.startswith('W/'):
+    etag = etag[2:]
+  for tag in _ENTITY_TAG_RE.findall(if_none_match):
+    if tag.startswith('W/'):
+      tag = tag[2:]
+    if tag in ('*', etag):
+      return True
+  return False
+
+
+def choose_response_encoding(accept_encoding):
+  """Choose the content coding for a response from Accept-Encoding.
+
+  Args:
+    accept_encoding: The value of the request's Accept-Encoding header, or
+      None.
+
+  Returns:
+    'gzip' or 'deflate', whichever the client accepts with the higher
+    quality value, preferring gzip.  None if the client accepts neither.
+  """
+  if not accept_encoding:
+    return None
+
+  qualities = {}
+  for coding in accept_encoding.split(','):
+    coding, _, params = coding.partition(';')
+    quality = 1.0
+    for param in params.split(';'):
+      name, _, value = param.partition('=')
+      if name.strip().lower() == 'q':
+        try:
+          quality = float(value)
+        except ValueError:
+          quality = 0.0
+    qualities[coding.strip().lower()] = quality
+
+  chosen, chosen_quality = None, 0.0
+  for encoding, _ in _RESPONSE_ENCODINGS:
+    quality = qualities.get(encoding, qualities.get('*', 0.0))
+    if quality > chosen_quality:
+      chosen, chosen_quality = encoding, quality
+  return chosen
+
+
+class ResponseCompression(object):
+  """Compresses response bodies with a negotiated content coding."""
+
+  def __init__(self, encoding, level, min_size):
+    """Constructor for ResponseCompression.
+
+    Args:
+      encoding: The content coding from choose_response_encoding, or None if
+        the client doesn't accept a compressed response.
+      level: An int from 1 to 9, the zlib compression level.
+      min_size: An int, the smallest response body in bytes that's
+        compressed.  Streamed bodies of unknown length are always compressed.
+    """
+    self.encoding = encoding
+    self.level = level
+    self._min_size = min_size
+    self._wbits = dict(_RESPONSE_ENCODINGS).get(encoding)
+
+  def _compressobj(self):
+    return zlib.compressobj(self.level, zlib.DEFLATED, self._wbits)
+
+  def compress(self, content):
+    """Returns content encoded with self.encoding."""
+    compressor = self._compressobj()
+    return compressor.compress(content) + compressor.flush()
+
+  def _prepare_headers(self, headers):
+    """Returns the headers for a response that might be compressed.
+
+    Args:
+      headers: A list of (header, value) tuples.
+
+    Returns:
+      A tuple (compress, headers).  compress is whether the body can be
+      compressed; it can't if it's already encoded.  headers is the list of
+      headers, with Accept-Encoding added to Vary.
+    """
+    vary = _get_header(headers, 'Vary')
+    headers = [(header, value) for header, value in headers
+               if header.lower() != 'vary']
+    if not vary:
+      vary = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+      vary += ', Accept-Encoding'
+    headers.append(('Vary', vary))
+    compress = (self.encoding is not None and
+                _get_header(headers, 'Content-Encoding') is None)
+    return compress, headers
+
+  def _set_encoding(self, headers, content_length=None):
+    """Returns headers for a body encoded with self.encoding.
+
+    A strong ETag is made weak, since the encoded bytes differ from the ones
+    it was computed from.
+    """
+    headers = [(header, 'W/' + value
+                if header.lower() == 'etag' and value.startswith('"')
+                else value)
+               for header, value in headers
+               if header.lower() != 'content-length']
+    headers.append(('Content-Encoding', self.encoding))
+    if content_length is not None:
+      headers.append(('Content-Length', '%s' % content_length))
+    return headers
+
+  def compress_response(self, headers, content, compress_content=None):
+    """Compress a response body that's entirely in memory.
+
+    Args:
+      headers: A list of (header, value) tuples, the response headers.
+      content: A string, the response body.
+      compress_content: A function that returns content encoded with
+        self.encoding, to call instead of compress, e.g. to reuse an encoded
+        copy cached with the content.
+
+    Returns:
+      A tuple (headers, content) with the headers and body to send.
+    """
+    compress, headers = self._prepare_headers(headers)
+    if not compress or not content or len(content) < self._min_size:
+      return headers, content
+    content = (compress_content or self.compress)(content)
+    return self._set_encoding(headers, len(content)), content
+
+  def compress_response_iter(self, headers, body_iter):
+    """Compress a streamed response body incrementally.
+
+    Args:
+      headers: A list of (header, value) tuples, the response headers.
+      body_iter: An iterable over the strings of the response body.
+
+    Returns:
+      A tuple (headers, body_iter) with the headers and body to send.
+    """
+    if isinstance(body_iter, (list, tuple)):
+      # The body is already in memory.
+      headers, content = self.compress_response(headers, ''.join(body_iter))
+      return headers, [content]
+
+    compress, headers = self._prepare_headers(headers)
+    content_length = _get_header(headers, 'Content-Length')
+    if not compress or (content_length is not None and
+                        int(content_length) < self._min_size):
+      return headers, body_iter
+    return (self._set_encoding(headers),
+            _CompressedResponseBody(body_iter, self._compressobj()))
+
+
+class _CompressedResponseBody(object):
+  """A WSGI response body that compresses another one as it's iterated."""
+
+  def __init__(self, body_iter, compressor):
+    self._body_iter = body_iter
+    self._compressor = compressor
+
+  def __iter__(self):
+    for chunk in self._body_iter:
+      compressed = self._compressor.compress(chunk)
+      if compressed:
+        yield compressed
+    yield self._compressor.flush()
+
+  def close(self):
+    close = getattr(self._body_iter, 'close', None)
+    if close:
+      close()
+
+
 def get_headers_from_environ(environ):
   """Get a wsgiref.headers.Headers object with headers from the environment.
 
@@ -15,8 +15,10 @@
 """Unit tests for the api_config_manager module."""
 
 import re
+import threading
 import unittest
 
+import mock
 from endpoints import api_config_manager
 
 
@@ -264,6 +266,197 @@ class ApiConfigManagerTest(unittest.TestCase):
     self.assertEqual(fake_method, method_spec)
     self.assertEqual({}, params)
 
+  def test_lookup_rest_method_priority(self):
+    methods = {
+        'guestbook_api.get': {'httpMethod': 'GET', 'path': 'greetings/{gid}'},
+        'guestbook_api.mine': {'httpMethod': 'GET', 'path': 'greetings/mine'},
+        'guestbook_api.f3': {'httpMethod': 'GET',
+                             'path': '{a}/{b}/property/{c}'},
+        'guestbook_api.f4': {'httpMethod': 'GET',
+                             'path': 'greetings/{gid}/property/{c}'},
+    }
+    config = {'name': 'guestbook_api',
+              'version': 'X',
+              'api_version': 'X',
+              'path_version': 'X',
+              'methods': methods}
+    self.config_manager.process_api_config_response({'items': [config]})
+
+    # Constant segments take priority over variables, regardless of order.
+    self.assertEqual(
+        ('guestbook_api.mine', methods['guestbook_api.mine'], {}),
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/X/greetings/mine', '', 'GET'))
+    self.assertEqual(
+        ('guestbook_api.get', methods['guestbook_api.get'], {'gid': 'mine2'}),
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/X/greetings/mine2', '', 'GET'))
+    self.assertEqual(
+        ('guestbook_api.f4', methods['guestbook_api.f4'],
+         {'gid': '1', 'c': 'x'}),
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/X/greetings/1/property/x', '', 'GET'))
+    self.assertEqual(
+        ('guestbook_api.f3', methods['guestbook_api.f3'],
+         {'a': 'other', 'b': '1', 'c': 'x'}),
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/X/other/1/property/x', '', 'GET'))
+    # An empty variable still matches, as with the regex lookup.
+    self.assertEqual(
+        'guestbook_api.get',
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/X/greetings/', '', 'GET')[0])
+
+  def test_lookup_rest_method_http_method_mismatch(self):
+    fake_method = {'httpMethod': 'GET', 'path': 'greetings/{id}'}
+    other_method = {'httpMethod': 'POST', 'path': '{collection}/{id}'}
+    self.config_manager._save_rest_method('guestbook_api.get', 'guestbook_api',
+                                          'v1', fake_method)
+    self.config_manager._save_rest_method('guestbook_api.post',
+                                          'guestbook_api', 'v1', other_method)
+
+    # The first matching path doesn't have a POST method, so keep looking.
+    self.assertEqual(
+        ('guestbook_api.post', other_method,
+         {'collection': 'greetings', 'id': '1'}),
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/v1/greetings/1', '', 'POST'))
+    self.assertEqual(
+        (None, None, None),
+        self.config_manager.lookup_rest_method(
+            'guestbook_api/v1/greetings/1', '', 'PUT'))
+
+  def test_lookup_rest_method_with_message_variable(self):
+    fake_method = {'httpMethod': 'GET', 'path': 'greetings/{x.y}/{id}:hello'}
+    self.config_manager._save_rest_method('guestbook_api.get', 'guestbook_api',
+                                          'v1', fake_method)
+
+    method_name, _, params = self.config_manager.lookup_rest_method(
+        'guestbook_api/v1/greetings/foo+bar/1:hello', '', 'GET')
+    self.assertEqual('guestbook_api.get', method_name)
+    self.assertEqual({'x.y': 'foo bar', 'id': '1'}, params)
+
+  def test_lookup_rest_method_invalid_value(self):
+    fake_method = {'httpMethod': 'GET', 'path': 'greetings/{id}'}
+    self.config_manager._save_rest_method('guestbook_api.get', 'guestbook_api',
+                                          'v1', fake_method)
+
+    for reserved in ['?', '#', '[', ']', '{', '}']:
+      self.assertEqual(
+          (None, None, None),
+          self.config_manager.lookup_rest_method(
+              'guestbook_api/v1/greetings/123%s' % reserved, '', 'GET'))
+
+  def test_configs_snapshot(self):
+    self.config_manager.save_config(('guestbook_api', 'v1'), {'a': 1})
+    configs = self.config_manager.configs
+    self.config_manager.save_config(('guestbook_api', 'v2'), {'b': 2})
+    self.assertNotIn(('guestbook_api', 'v2'), configs)
+    self.assertIn(('guestbook_api', 'v2'), self.config_manager.configs)
+
+  def test_lookup_during_reload(self):
+    fake_method = {'httpMethod': 'GET', 'path': 'greetings/{id}'}
+    config = {'name': 'guestbook_api',
+              'version': 'v1',
+              'api_version': 'v1',
+              'path_version': 'v1',
+              'methods': {'guestbook_api.get': fake_method}}
+    self.config_manager.process_api_config_response({'items': [config]})
+
+    failures = []
+    done = threading.Event()
+
+    def reader():
+      while not done.is_set():
+        method_name, _, params = self.config_manager.lookup_rest_method(
+            'guestbook_api/v1/greetings/1', '', 'GET')
+        if method_name != 'guestbook_api.get' or params != {'id': '1'}:
+          failures.append((method_name, params))
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+      thread.start()
+    try:
+      for i in range(50):
+        other_method = {'httpMethod': 'GET', 'path': 'other%d/{id}' % i}
+        self.config_manager._save_rest_method(
+            'guestbook_api.other%d' % i, 'guestbook_api', 'v1', other_method)
+        self.config_manager.process_api_config_response({'items': [config]})
+    finally:
+      done.set()
+      for thread in readers:
+        thread.join()
+    self.assertEqual([], failures)
+
+
+class RouteCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.config_manager = api_config_manager.ApiConfigManager(
+        route_cache_size=2, negative_route_cache_ttl=30)
+    self.fake_method = {'httpMethod': 'GET', 'path': 'greetings/{id}'}
+    self.config_manager._save_rest_method(
+        'guestbook_api.get', 'guestbook_api', 'v1', self.fake_method)
+
+  def test_disabled_by_default(self):
+    self.assertIsNone(api_config_manager.ApiConfigManager().route_cache_info())
+
+  def test_hit(self):
+    for _ in range(2):
+      method_name, method, params = self.config_manager.lookup_rest_method(
+          'guestbook_api/v1/greetings/1', None, 'GET')
+      self.assertEqual('guestbook_api.get', method_name)
+      self.assertEqual(self.fake_method, method)
+      self.assertEqual({'id': '1'}, params)
+      # Modifying the returned params mustn't affect later lookups.
+      params['id'] = 'modified'
+    self.assertEqual({'hits': 1, 'misses': 1, 'size': 1, 'max_size': 2},
+                     self.config_manager.route_cache_info())
+
+  def test_negative_entry_expires(self):
+    with mock.patch.object(api_config_manager.time, 'time') as mock_time:
+      mock_time.return_value = 1000
+      for _ in range(2):
+        self.assertEqual((None, None, None),
+                         self.config_manager.lookup_rest_method(
+                             'guestbook_api/v1/missing', None, 'GET'))
+      self.assertEqual(1, self.config_manager.route_cache_info()['hits'])
+
+      mock_time.return_value = 1031
+      self.config_manager.lookup_rest_method(
+          'guestbook_api/v1/missing', None, 'GET')
+      info = self.config_manager.route_cache_info()
+      self.assertEqual(1, info['hits'])
+      self.assertEqual(2, info['misses'])
+
+  def test_invalidated_on_reload(self):
+    self.config_manager.lookup_rest_method(
+        'guestbook_api/v1/greetings', None, 'GET')
+    self.config_manager._save_rest_method(
+        'guestbook_api.list', 'guestbook_api', 'v1',
+        {'httpMethod': 'GET', 'path': 'greetings'})
+    self.assertEqual(0, self.config_manager.route_cache_info()['size'])
+    method_name, _, _ = self.config_manager.lookup_rest_method(
+        'guestbook_api/v1/greetings', None, 'GET')
+    self.assertEqual('guestbook_api.list', method_name)
+
+  def test_lru_eviction(self):
+    for path in ('greetings/1', 'greetings/2', 'greetings/1', 'greetings/3',
+                 'greetings/1', 'greetings/2'):
+      self.config_manager.lookup_rest_method(
+          'guestbook_api/v1/' + path, None, 'GET')
+    info = self.config_manager.route_cache_info()
+    self.assertEqual(2, info['hits'])
+    self.assertEqual(4, info['misses'])
+    self.assertEqual(2, info['size'])
+
+  def test_request_uri_ignored_when_unused(self):
+    self.config_manager.lookup_rest_method(
+        'guestbook_api/v1/greetings/1', 'guestbook_api/v1/greetings/1?a', 'GET')
+    self.config_manager.lookup_rest_method(
+        'guestbook_api/v1/greetings/1', 'guestbook_api/v1/greetings/1?b', 'GET')
+    self.assertEqual(1, self.config_manager.route_cache_info()['hits'])
+
 
 class ParameterizedPathTest(unittest.TestCase):
 
@@ -1787,6 +1787,78 @@ class ApiConfigTest(unittest.TestCase):
     test_util.AssertDictEqual(expected_adapter, api['adapter'], self)
 
 
+def _make_fingerprint_service(field_type=messages.StringField, scopes=None,
+                              hostname='example.appspot.com',
+                              nested_type=Nested):
+
+  class Request(messages.Message):
+    value = field_type(1)
+    nested = messages.MessageField(nested_type, 2)
+
+  @api_config.api('fingerprint', 'v1', scopes=scopes, hostname=hostname)
+  class FingerprintService(remote.Service):
+    """Describes FingerprintService."""
+
+    @api_config.method(Request, AllFields, path='items')
+    def get(self, request):
+      return AllFields()
+
+    @api_config.method(ALL_FIELDS_AS_PARAMETERS, message_types.VoidMessage,
+                       path='all', http_method='GET')
+    def query(self, request):
+      return message_types.VoidMessage()
+
+  return FingerprintService
+
+
+class ConfigFingerprintTest(unittest.TestCase):
+
+  def setUp(self):
+    self.generator = ApiConfigGenerator()
+
+  def fingerprint(self, service, hostname=None):
+    return self.generator.get_config_fingerprint([service], hostname=hostname)
+
+  def testFingerprintIsStable(self):
+    fingerprint = self.fingerprint(_make_fingerprint_service())
+    self.assertEqual(64, len(fingerprint))
+    self.assertEqual(fingerprint,
+                     ApiConfigGenerator().get_config_fingerprint(
+                         _make_fingerprint_service()))
+
+  def testFingerprintCoversSettingsAndMessages(self):
+    fingerprint = self.fingerprint(_make_fingerprint_service())
+    self.assertNotEqual(fingerprint, self.fingerprint(
+        _make_fingerprint_service(field_type=messages.IntegerField)))
+    self.assertNotEqual(fingerprint, self.fingerprint(
+        _make_fingerprint_service(scopes=['scope'])))
+
+  def testFingerprintCoversNestedMessages(self):
+
+    def make_nested(number):
+
+      class Inner(messages.Message):
+        int_value = messages.IntegerField(number)
+
+      return Inner
+
+    self.assertEqual(
+        self.fingerprint(_make_fingerprint_service(nested_type=make_nested(1))),
+        self.fingerprint(_make_fingerprint_service(nested_type=make_nested(1))))
+    self.assertNotEqual(
+        self.fingerprint(_make_fingerprint_service(nested_type=make_nested(1))),
+        self.fingerprint(_make_fingerprint_service(nested_type=make_nested(2))))
+
+  def testFingerprintUsesEffectiveHostname(self):
+    fingerprint = self.fingerprint(
+        _make_fingerprint_service(hostname='example.appspot.com'))
+    self.assertEqual(fingerprint, self.fingerprint(
+        _make_fingerprint_service(hostname=None),
+        hostname='example.appspot.com'))
+    self.assertNotEqual(fingerprint, self.fingerprint(
+        _make_fingerprint_service(), hostname='other.appspot.com'))
+
+
 class ApiConfigParamsDescriptorTest(unittest.TestCase):
 
   def setUp(self):
@@ -2218,7 +2290,8 @@ class MethodDecoratorTest(unittest.TestCase):
                          scopes=['foo'],
                          audiences=['bar'],
                          allowed_client_ids=['baz', 'bim'],
-                         auth_level=AUTH_LEVEL.REQUIRED)
+                         auth_level=AUTH_LEVEL.REQUIRED,
+                         compress_response=False)
       def my_method(self):
         pass
 
@@ -2233,6 +2306,7 @@ class MethodDecoratorTest(unittest.TestCase):
     self.assertEqual(['bar'], method_info.audiences)
     self.assertEqual(['baz', 'bim'], method_info.allowed_client_ids)
     self.assertEqual(AUTH_LEVEL.REQUIRED, method_info.auth_level)
+    self.assertFalse(method_info.compress_response)
 
   def testMethodInfoDefaults(self):
 
@@ -2256,6 +2330,7 @@ class MethodDecoratorTest(unittest.TestCase):
     self.assertEqual(None, method_info.audiences)
     self.assertEqual(None, method_info.allowed_client_ids)
     self.assertEqual(None, method_info.auth_level)
+    self.assertEqual(None, method_info.compress_response)
 
   def testMethodInfoPath(self):
 
@@ -24,12 +24,19 @@ Tests:
 import httplib
 import json
 import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 import urllib2
 
 import mock
 import test_util
 import webtest
+from google.appengine.api import apiproxy_stub_map
+from endpoints import _endpointscfg_impl
 from endpoints import api_config
 from endpoints import api_exceptions
 from endpoints import apiserving
@@ -37,6 +44,9 @@ from endpoints import message_types
 from endpoints import messages
 from endpoints import remote
 from endpoints import resource_container
+from endpoints import shared_cache
+from endpoints import types as endpoints_types
+from endpoints import users_id_token
 
 package = 'endpoints.test'
 
@@ -337,6 +347,243 @@ class ApiServerTestApiConfigRegistryEndToEnd(unittest.TestCase):
     self.assertEqual(TEST_SERVICE_API_CONFIG, configs)
 
 
+@api_config.api('issuerservice', 'v1', issuers={
+    'auth0': endpoints_types.Issuer(
+        'https://test.auth0.com',
+        'https://test.auth0.com/.well-known/jwks.json'),
+    'service_account': endpoints_types.Issuer(
+        'sa@example.iam.gserviceaccount.com',
+        'https://www.googleapis.com/robot/v1/metadata/x509/'
+        'sa@example.iam.gserviceaccount.com'),
+})
+class IssuerService(remote.Service):
+
+  @api_config.method(path='noop')
+  def Noop(self, unused_request):
+    return message_types.VoidMessage()
+
+
+class ApiServerCertRefreshTest(unittest.TestCase):
+
+  @mock.patch.object(users_id_token, '_start_cert_refresh')
+  def testCertsAreRefreshed(self, mock_start):
+    apiserving.api_server([IssuerService, AService], refresh_certs=True)
+    mock_start.assert_called_once_with([
+        'https://test.auth0.com/.well-known/jwks.json',
+        'https://www.googleapis.com/service_accounts/v1/metadata/raw/'
+        'federated-signon@system.gserviceaccount.com',
+        'https://www.googleapis.com/service_accounts/v1/metadata/raw/'
+        'sa@example.iam.gserviceaccount.com',
+    ])
+
+  @mock.patch.object(users_id_token, '_start_cert_refresh')
+  def testCertsAreNotRefreshedByDefault(self, mock_start):
+    apiserving.api_server([IssuerService])
+    self.assertFalse(mock_start.called)
+
+
+class ApiServerAuthCacheTest(unittest.TestCase):
+
+  def tearDown(self):
+    users_id_token._set_auth_cache(None)
+
+  @mock.patch.object(users_id_token._cert_manager, 'start')
+  def testAuthCacheIsUsed(self, mock_start):
+    cache = mock.Mock()
+    apiserving.api_server([IssuerService], refresh_certs=True,
+                          auth_cache=cache)
+    self.assertIs(cache, users_id_token._auth_cache)
+    self.assertIs(cache, mock_start.call_args[0][1])
+
+  def testMemcacheIsUsedByDefault(self):
+    apiserving.api_server([IssuerService])
+    self.assertIs(users_id_token.memcache, users_id_token._auth_cache)
+
+
+class ApiServerAuthPolicyTest(unittest.TestCase):
+
+  def testAuthPoliciesAreBuiltAtStartup(self):
+    with mock.patch.object(api_config._MethodInfo,
+                           'get_auth_policy') as mock_get_policy:
+      apiserving.api_server([IssuerService])
+    mock_get_policy.assert_called_once_with(IssuerService.api_info)
+
+
+class ServeCommandTest(unittest.TestCase):
+
+  def setUp(self):
+    self.addCleanup(users_id_token._set_auth_cache, None)
+    environ = dict(os.environ, ENDPOINTS_SERVICE_NAME='service.example.com')
+    environ.pop('SERVER_SOFTWARE', None)
+    self.start_patch(mock.patch.dict(os.environ, environ, clear=True))
+    self.start_patch(mock.patch.object(
+        apiproxy_stub_map, 'apiproxy', apiproxy_stub_map.APIProxyStubMap()))
+    self.start_patch(mock.patch.object(
+        _endpointscfg_impl, '_GetServiceClasses', return_value=[AService]))
+    self.start_patch(mock.patch.object(
+        apiserving.app_identity, 'get_application_id', return_value='app'))
+    self.mock_loaders = self.start_patch(
+        mock.patch('endpoints_management.control.client.Loaders'))
+    self.mock_use_gae_thread = self.start_patch(
+        mock.patch('endpoints_management.control.client.use_gae_thread'))
+    # endpoints_management decides this when it's first imported.
+    self.start_patch(mock.patch(
+        'endpoints_management.control.wsgi.running_on_devserver',
+        side_effect=lambda: os.environ.get(
+            'SERVER_SOFTWARE', '').startswith('Development')))
+    self.mock_add_all = self.start_patch(
+        mock.patch('endpoints_management.control.wsgi.add_all'))
+    self.mock_server = self.start_patch(
+        mock.patch('endpoints.prefork_server.PreforkServer'))
+
+  def start_patch(self, patcher):
+    self.addCleanup(patcher.stop)
+    return patcher.start()
+
+  def testServiceControlStaysOn(self):
+    _endpointscfg_impl.main(['endpointscfg.py', 'serve', 'AService'])
+    self.assertEqual(self.mock_add_all.return_value,
+                     self.mock_server.call_args[0][0])
+    self.assertFalse(
+        os.environ.get('SERVER_SOFTWARE', '').startswith('Development'))
+    # Only urlfetch is stubbed, and the auth cache isn't memcache.
+    self.assertIsNotNone(apiproxy_stub_map.apiproxy.GetStub('urlfetch'))
+    self.assertIsNone(apiproxy_stub_map.apiproxy.GetStub('memcache'))
+    self.assertIsInstance(users_id_token._auth_cache,
+                          shared_cache.SharedMemoryCache)
+
+  def testServiceControlStartsInEachWorker(self):
+    _endpointscfg_impl.main(['endpointscfg.py', 'serve', 'AService'])
+    controller = self.mock_loaders.DEFAULT.load.return_value
+    self.assertFalse(self.mock_use_gae_thread.called)
+    self.assertFalse(controller.start.called)
+    app = self.mock_server.call_args[0][0]
+    app.after_fork()
+    controller.start.assert_called_once_with()
+
+
+class ApiServerConfigCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'api_config_cache.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def read_cache(self):
+    with open(self.path) as cache_file:
+      return json.load(cache_file)
+
+  def testConfigsAreCachedAndReused(self):
+    apiserving.api_server([AService, BService], config_cache=self.path)
+    cache = self.read_cache()
+    self.assertEqual(2, len(cache['configs']))
+
+    with mock.patch.object(api_config.ApiConfigGenerator,
+                           'get_config_dict') as mock_get_config:
+      server = apiserving._ApiServer([AService, BService],
+                                     config_cache=self.path)
+    self.assertFalse(mock_get_config.called)
+    self.assertEqual(cache, self.read_cache())
+    self.assertItemsEqual(
+        cache['configs'].values(),
+        server.api_config_registry.all_api_configs())
+
+  def testChangedApisAreRegenerated(self):
+    apiserving.api_server([AService], config_cache=self.path)
+    with mock.patch.object(api_config.ApiConfigGenerator,
+                           'get_config_fingerprint', return_value='changed'):
+      apiserving.api_server([AService], config_cache=self.path)
+    self.assertEqual(['changed'], self.read_cache()['configs'].keys())
+
+  def testInvalidCacheIsIgnored(self):
+    with open(self.path, 'w') as cache_file:
+      cache_file.write('not json')
+    server = apiserving._ApiServer([AService], config_cache=self.path)
+    self.assertEqual(1, len(server.api_config_registry.all_api_configs()))
+    self.assertEqual(1, len(self.read_cache()['configs']))
+
+  def testUnwritableCacheIsIgnored(self):
+    path = os.path.join(self.directory, 'missing', 'api_config_cache.json')
+    server = apiserving._ApiServer([AService], config_cache=path)
+    self.assertEqual(1, len(server.api_config_registry.all_api_configs()))
+    self.assertFalse(os.path.exists(path))
+
+  def testEndpointscfgCacheIsUsed(self):
+    # pylint: disable=protected-access
+    path = _endpointscfg_impl._GenApiConfigCache(
+        ['%s.%s' % (AService.__module__, AService.__name__)], self.directory)
+    self.assertEqual(self.path, path)
+    with mock.patch.object(api_config.ApiConfigGenerator,
+                           'get_config_dict') as mock_get_config:
+      apiserving.api_server([AService], config_cache=self.path)
+    self.assertFalse(mock_get_config.called)
+
+
+class ApiServerWarmTest(unittest.TestCase):
+
+  @mock.patch.object(users_id_token, '_warm_certs')
+  @mock.patch.object(users_id_token, '_start_cert_refresh')
+  def testWarm(self, mock_start, mock_warm_certs):
+    app = apiserving.api_server([IssuerService])
+    app.warm([])
+    mock_warm_certs.assert_called_once_with(
+        apiserving._ApiServer([IssuerService]).get_cert_uris())
+    self.assertFalse(mock_start.called)
+
+  def testHandleWarmupIsPassedToTheDispatcher(self):
+    with mock.patch.object(apiserving.endpoints_dispatcher,
+                           'EndpointsDispatcherMiddleware') as mock_dispatcher:
+      apiserving.api_server([AService], handle_warmup=True)
+    self.assertEqual({'handle_warmup': True}, mock_dispatcher.call_args[1])
+
+
+class ApiServerStartupReportTest(unittest.TestCase):
+
+  def testStartupIsReported(self):
+    with mock.patch.object(apiserving._logger, 'info') as mock_info:
+      apiserving.api_server([AService, BService])
+    report = apiserving.get_startup_report()
+    names = [phase.name for phase in report.phases]
+    for name in ('api_server',
+                 'api_server/create_api_server',
+                 'api_server/create_api_server/register_services',
+                 'api_server/create_api_server/register_services/'
+                 'generate_config',
+                 'api_server/create_api_server/build_auth_policies',
+                 'api_server/create_dispatcher',
+                 'api_server/create_dispatcher/compile_routes'):
+      self.assertIn(name, names)
+    self.assertEqual(2, report.get_phase(
+        'api_server/create_api_server/register_services/'
+        'generate_config').calls)
+    self.assertIsNone(report.get_phase('api_server').allocations)
+    self.assertEqual(report.seconds, report.get_phase('api_server').seconds)
+    mock_info.assert_called_once_with(
+        'Endpoints startup took %.1f ms:\n%s', report.seconds * 1000,
+        report.format())
+
+  def testAllocationsAreCounted(self):
+    apiserving.api_server([AService], count_startup_allocations=True)
+    report = apiserving.get_startup_report()
+    self.assertIsNotNone(report.get_phase('api_server').allocations)
+
+
+class LazyImportTest(unittest.TestCase):
+
+  def testHeavyModulesAreNotImported(self):
+    # Run in a new interpreter, since other tests import these modules.
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, endpoints; print " ".join(sys.modules)'])
+    modules = output.split()
+    self.assertIn('endpoints.apiserving', modules)
+    for name in ('endpoints_management', 'endpoints.discovery_generator',
+                 'endpoints.openapi_generator', 'pkg_resources'):
+      self.assertNotIn(name, modules)
+
+
 class GetAppRevisionTest(unittest.TestCase):
   def testGetAppRevision(self):
     environ = {'CURRENT_VERSION_ID': '1.1'}
@@ -16,12 +16,15 @@
 
 import os
 import unittest
+import zlib
 
+import mock
 import test_util
 import webtest
 from endpoints import api_config
 from endpoints import api_config_manager
 from endpoints import apiserving
+from endpoints import discovery_generator
 from endpoints import discovery_service
 from endpoints import message_types
 from endpoints import messages
@@ -222,5 +225,130 @@ class DiscoveryServiceVersionTest(unittest.TestCase):
       self.assertEqual(resp.json['version'], version)
       self.assertItemsEqual(resp.json['methods'].keys(), [u'list_airports'])
 
+
+class DiscoveryDocumentCacheTest(unittest.TestCase):
+
+  def testLruEviction(self):
+    cache = discovery_service.DiscoveryDocumentCache(max_size=2)
+    self.assertIsNone(cache.get('a', 1))
+    cache.put('a', 1, 'doc a')
+    cache.put('b', 1, 'doc b')
+    self.assertEqual('doc a', cache.get('a', 1))
+    cache.put('c', 1, 'doc c')
+    self.assertIsNone(cache.get('b', 1))
+    self.assertEqual('doc a', cache.get('a', 1))
+    self.assertEqual('doc c', cache.get('c', 1))
+    self.assertEqual({'hits': 3, 'misses': 2, 'size': 2, 'max_size': 2},
+                     cache.info())
+
+  def testNewGenerationClearsCache(self):
+    cache = discovery_service.DiscoveryDocumentCache()
+    cache.get('a', 1)
+    cache.put('a', 1, 'doc a')
+    self.assertIsNone(cache.get('a', 2))
+    # A document generated from older configs isn't cached.
+    cache.put('a', 1, 'doc a')
+    self.assertIsNone(cache.get('a', 2))
+
+
+class DiscoveryServiceCachingTest(unittest.TestCase):
+
+  _REST_PATH = '/_ah/api/discovery/v1/apis/iata/v1/rest'
+  _LIST_PATH = '/_ah/api/discovery/v1/apis'
+
+  def setUp(self):
+    self.app = apiserving.api_server([V1Service, V2Service])
+    generate = discovery_generator.DiscoveryGenerator.pretty_print_config_to_json
+    patcher = mock.patch.object(
+        discovery_generator.DiscoveryGenerator, 'pretty_print_config_to_json',
+        autospec=True, side_effect=generate)
+    self.generate = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _get(self, path, server='localhost', **headers):
+    """Returns the (status, headers, body) of a response."""
+    environ = test_util.create_fake_environ('http', server, path=path)
+    for header, value in headers.iteritems():
+      environ['HTTP_' + header.upper()] = value
+    start_response = mock.Mock()
+    body = ''.join(self.app(environ, start_response))
+    status, response_headers = start_response.call_args[0]
+    return status, dict(response_headers), body
+
+  def testRestDocIsCached(self):
+    status, headers, body = self._get(self._REST_PATH)
+    self.assertEqual('200 OK', status)
+    self.assertEqual(body, self._get(self._REST_PATH)[2])
+    self.assertEqual(1, self.generate.call_count)
+    self.assertEqual(discovery_service.util.compute_etag(body),
+                     headers['ETag'])
+
+  def testRestDocPerRootUrl(self):
+    _, _, body = self._get(self._REST_PATH)
+    _, _, other_body = self._get(self._REST_PATH, server='example.com')
+    self.assertIn('http://localhost/_ah/api/', body)
+    self.assertIn('http://example.com/_ah/api/', other_body)
+    self.assertEqual(2, self.generate.call_count)
+
+  def testDirectoryIsCached(self):
+    _, _, body = self._get(self._LIST_PATH)
+    self.assertEqual(body, self._get(self._LIST_PATH)[2])
+    _, _, other_body = self._get(self._LIST_PATH, server='example.com')
+    self.assertIn('http://example.com/_ah/api/discovery/v1/apis/iata/v1/rest',
+                  other_body)
+
+  def testNotModified(self):
+    _, headers, _ = self._get(self._REST_PATH)
+    status, _, body = self._get(self._REST_PATH,
+                                if_none_match=headers['ETag'])
+    self.assertEqual('304 Not Modified', status)
+    self.assertEqual('', body)
+
+  def testGzip(self):
+    _, headers, body = self._get(self._REST_PATH)
+    status, gzip_headers, gzip_body = self._get(self._REST_PATH,
+                                                accept_encoding='gzip')
+    self.assertEqual('200 OK', status)
+    self.assertEqual('gzip', gzip_headers['Content-Encoding'])
+    self.assertEqual('W/' + headers['ETag'], gzip_headers['ETag'])
+    self.assertEqual(str(len(gzip_body)), gzip_headers['Content-Length'])
+    self.assertEqual(body, zlib.decompress(gzip_body, 16 + zlib.MAX_WBITS))
+    self.assertEqual(1, self.generate.call_count)
+
+  def testDeflate(self):
+    _, headers, body = self._get(self._REST_PATH)
+    _, deflate_headers, deflate_body = self._get(self._REST_PATH,
+                                                 accept_encoding='deflate')
+    self.assertEqual('deflate', deflate_headers['Content-Encoding'])
+    self.assertEqual('W/' + headers['ETag'], deflate_headers['ETag'])
+    self.assertEqual(body, zlib.decompress(deflate_body))
+
+  def testCompressionLevel(self):
+    self.app = apiserving.api_server([V1Service, V2Service],
+                                     compression_level=1)
+    _, _, body = self._get(self._REST_PATH)
+    _, _, gzip_body = self._get(self._REST_PATH, accept_encoding='gzip')
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    self.assertEqual(compressor.compress(body) + compressor.flush(), gzip_body)
+
+  def testCompressionDisabled(self):
+    self.app = apiserving.api_server([V1Service, V2Service],
+                                     compression_level=0)
+    _, headers, body = self._get(self._REST_PATH)
+    status, gzip_headers, gzip_body = self._get(self._REST_PATH,
+                                                accept_encoding='gzip')
+    self.assertEqual('200 OK', status)
+    self.assertNotIn('Content-Encoding', gzip_headers)
+    self.assertNotIn('Vary', gzip_headers)
+    self.assertEqual(headers['ETag'], gzip_headers['ETag'])
+    self.assertEqual(body, gzip_body)
+
+  def testConfigChangeInvalidatesCache(self):
+    self._get(self._REST_PATH)
+    self.app.config_manager.process_api_config_response({'items': []})
+    self._get(self._REST_PATH)
+    self.assertEqual(2, self.generate.call_count)
+
+
 if __name__ == '__main__':
   unittest.main()
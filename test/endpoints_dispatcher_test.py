@@ -14,12 +14,26 @@
 
 """Tests for endpoints.endpoints_dispatcher."""
 
+import os
 import unittest
+import zlib
 
+from google.appengine.api import users
+
+import mock
+import test_util
 from endpoints import api_config
+from endpoints import api_exceptions
+from endpoints import api_request
 from endpoints import apiserving
 from endpoints import endpoints_dispatcher
+from endpoints import errors
+from endpoints import message_types
+from endpoints import messages
 from endpoints import remote
+from endpoints import resource_container
+from endpoints import users_id_token
+from endpoints import util
 from webtest import TestApp
 
 
@@ -32,6 +46,129 @@ class AService(remote.Service):
     return message_types.VoidMessage()
 
 
+class Color(messages.Enum):
+  RED = 1
+  BLUE = 2
+
+
+class Inner(messages.Message):
+  name = messages.StringField(1)
+
+
+class EchoMessage(messages.Message):
+  text = messages.StringField(1)
+  numbers = messages.IntegerField(2, variant=messages.Variant.INT64,
+                                  repeated=True)
+  color = messages.EnumField(Color, 3)
+  inner = messages.MessageField(Inner, 4)
+  data = messages.BytesField(5)
+  header = messages.StringField(6)
+  remote_address = messages.StringField(7)
+
+
+class RequiredMessage(messages.Message):
+  value = messages.StringField(1, required=True)
+
+
+ECHO_RESOURCE = resource_container.ResourceContainer(
+    EchoMessage, id=messages.IntegerField(8, required=True))
+
+
+@api_config.api('echo', 'v1', base_path='/anapi/')
+class EchoService(remote.Service):
+
+  @api_config.method(ECHO_RESOURCE, EchoMessage, path='echo/{id}',
+                     http_method='POST')
+  def Echo(self, request):
+    headers = self.request_state.headers
+    return EchoMessage(text=request.text, numbers=request.numbers,
+                color=request.color, inner=request.inner, data=request.data,
+                header=headers.get('x-echo-header'),
+                remote_address=self.request_state.remote_address)
+
+  @api_config.method(EchoMessage, EchoMessage, path='fail',
+                     http_method='POST')
+  def Fail(self, request):
+    if request.text == 'not found':
+      raise api_exceptions.NotFoundException('No %s' % request.inner.name)
+    if request.text == 'custom':
+      raise remote.ApplicationError('Custom error', 'custom')
+    raise ValueError('Unexpected')
+
+  @api_config.method(RequiredMessage, message_types.VoidMessage,
+                     path='required', http_method='POST')
+  def Required(self, unused_request):
+    return message_types.VoidMessage()
+
+  @api_config.method(EchoMessage, EchoMessage, path='uncompressed',
+                     http_method='POST', compress_response=False)
+  def Uncompressed(self, request):
+    return request
+
+
+ITEM_RESOURCE = resource_container.ResourceContainer(
+    message_types.VoidMessage, id=messages.IntegerField(1, required=True))
+
+
+def _item_etag(request):
+  version = VersionedService.versions.get(request.id, 0)
+  if isinstance(version, Exception):
+    raise version
+  return 'v%d' % version
+
+
+@api_config.api('versioned', 'v1', base_path='/anapi/')
+class VersionedService(remote.Service):
+
+  versions = {}
+  calls = []
+
+  @api_config.method(ITEM_RESOURCE, EchoMessage, path='items/{id}',
+                     http_method='GET', etag=_item_etag, scopes=[],
+                     allowed_client_ids=[])
+  def Get(self, request):
+    VersionedService.calls.append(request.id)
+    return EchoMessage(text='item %d' % request.id)
+
+  @api_config.method(ITEM_RESOURCE, EchoMessage, path='private/{id}',
+                     http_method='GET', etag=_item_etag)
+  def GetPrivate(self, request):
+    if users_id_token.get_current_user() is None:
+      raise api_exceptions.UnauthorizedException('Sign in')
+    VersionedService.calls.append(request.id)
+    return EchoMessage(text='item %d' % request.id)
+
+  @api_config.method(ITEM_RESOURCE, EchoMessage, path='hashed/{id}',
+                     http_method='GET')
+  def GetHashed(self, request):
+    VersionedService.calls.append(request.id)
+    return EchoMessage(text='item %d' % request.id)
+
+  @api_config.method(ITEM_RESOURCE, EchoMessage, path='items/{id}',
+                     http_method='POST')
+  def Update(self, request):
+    return EchoMessage(text='item %d' % request.id)
+
+
+@api_config.api('user', 'v1', base_path='/anapi/',
+                audiences=['audience'], allowed_client_ids=['client'],
+                scopes=[users_id_token._EMAIL_SCOPE])
+class UserService(remote.Service):
+
+  @api_config.method(message_types.VoidMessage, EchoMessage, path='me',
+                     http_method='GET')
+  def Me(self, unused_request):
+    user = users_id_token.get_current_user()
+    return EchoMessage(text=user and user.email())
+
+
+class _WsgiOnlyDispatcher(endpoints_dispatcher.EndpointsDispatcherMiddleware):
+  """Dispatcher that always calls the backend through WSGI."""
+
+  def _call_backend_directly(self, orig_request, params, method_config):
+    return None
+
+
 class EndpointsDispatcherBaseTest(unittest.TestCase):
 
   def setUp(self):
@@ -70,7 +207,512 @@ class EndpointsDispatcherGetProxyHtmlTest(EndpointsDispatcherBaseTest):
     resp = app.get('/anapi/static/proxy.html')
     assert '/_ah/api' not in resp.body
     assert '.init()' in resp.body
+    assert resp.body == endpoints_dispatcher.PROXY_HTML
 
   def testGetProxyHtmlBadUrl(self):
     app = TestApp(self.dispatcher)
     resp = app.get('/anapi/static/missing.html', status=404)
+
+
+class EndpointsDispatcherWarmTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+        apiserving._ApiServer([AService, EchoService]), handle_warmup=True)
+    # pylint: disable=protected-access
+    self.document_cache = self.dispatcher._discovery._document_cache
+
+  def _get(self, server, path, port=None):
+    environ = test_util.create_fake_environ('https', server, port=port,
+                                            path=path)
+    start_response = mock.Mock()
+    body = ''.join(self.dispatcher(environ, start_response))
+    return start_response.call_args[0][0], body
+
+  @mock.patch.object(users_id_token, '_warm_certs')
+  def testDiscoveryDocsAreGenerated(self, mock_warm_certs):
+    self.dispatcher.warm(['https://example.appspot.com'])
+    self.assertEqual(3, self.document_cache.misses)
+    for path in ('/anapi/discovery/v1/apis',
+                 '/anapi/discovery/v1/apis/aservice/v1/rest',
+                 '/anapi/discovery/v1/apis/echo/v1/rest'):
+      self.assertEqual('200 OK', self._get('example.appspot.com', path)[0])
+    self.assertEqual(3, self.document_cache.hits)
+    self.assertEqual(3, self.document_cache.misses)
+    self.assertTrue(mock_warm_certs.called)
+
+  @mock.patch.object(users_id_token, '_warm_certs')
+  @mock.patch.object(util, 'get_app_hostname')
+  def testDefaultsToTheAppHostname(self, mock_hostname, unused_warm_certs):
+    mock_hostname.return_value = None
+    self.dispatcher.warm()
+    self.assertEqual(0, self.document_cache.misses)
+
+    mock_hostname.return_value = 'example.appspot.com'
+    self.dispatcher.warm()
+    self._get('example.appspot.com', '/anapi/discovery/v1/apis')
+    self.assertEqual(1, self.document_cache.hits)
+
+  @mock.patch.object(endpoints_dispatcher.EndpointsDispatcherMiddleware,
+                     'warm')
+  @mock.patch.object(util, 'get_app_hostname', return_value=None)
+  def testWarmupRequest(self, unused_hostname, mock_warm):
+    status, body = self._get('localhost', '/_ah/warmup', port=8080)
+    self.assertEqual(('200 OK', 'OK'), (status, body))
+    mock_warm.assert_called_once_with(['https://localhost:8080'])
+
+  def testWarmupRequestsAreIgnoredByDefault(self):
+    dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+        apiserving._ApiServer([AService]))
+    with mock.patch.object(dispatcher, 'warm') as mock_warm:
+      with self.assertRaises(ValueError):
+        ''.join(dispatcher(test_util.create_fake_environ(
+            'https', 'localhost', path='/_ah/warmup'), mock.Mock()))
+    self.assertFalse(mock_warm.called)
+
+
+class EndpointsDispatcherTransformRequestTest(EndpointsDispatcherBaseTest):
+
+  _METHOD_CONFIG = {
+      'rosyMethod': 'AService.List',
+      'request': {
+          'parameters': {
+              'ids': {'type': 'int32', 'repeated': True},
+              'flag': {'type': 'boolean'},
+              'color': {'type': 'string',
+                        'enum': {'RED': {'backendValue': 'RED'},
+                                 'BLUE': {'backendValue': 'BLUE'}}},
+              'page.size': {'type': 'uint32'},
+          },
+      },
+  }
+
+  def _transform(self, query_string, params=None, body=None):
+    environ = test_util.create_fake_environ(
+        'https', 'example.appspot.com', path='/anapi/aservice/v1/items',
+        query_string=query_string, body=body, http_method='POST')
+    request = api_request.ApiRequest(environ, base_paths=['/anapi/'])
+    return self.dispatcher.transform_request(
+        request, params or {}, self._METHOD_CONFIG)
+
+  def testTransformParameters(self):
+    request = self._transform(
+        'ids=3&ids=4&flag=true&color=RED&page.size=10&page.token=abc&other=x',
+        params={'ids': '2'}, body='{"page": {"token": "def"}}')
+    self.assertEqual('AService.List', request.path)
+    self.assertEqual({'ids': [3, 4, 2],
+                      'flag': True,
+                      'color': 'RED',
+                      'page': {'size': 10, 'token': 'def'},
+                      'other': 'x'}, request.body_json)
+
+  def testInvalidEnum(self):
+    with self.assertRaises(errors.EnumRejectionError) as context:
+      self._transform('color=GREEN')
+    self.assertEqual(['BLUE', 'RED'], sorted(context.exception.allowed_values))
+
+  def testInvalidRepeatedValue(self):
+    with self.assertRaises(errors.BasicTypeParameterError) as context:
+      self._transform('ids=1&ids=x')
+    self.assertEqual('ids[1]', context.exception.parameter_name)
+
+  def testPlanIsReused(self):
+    method_parameters = self._METHOD_CONFIG['request']['parameters']
+    plan = self.dispatcher._get_transform_plan(method_parameters)
+    self._transform('flag=0')
+    self.assertIs(plan, self.dispatcher._get_transform_plan(method_parameters))
+
+
+class EndpointsDispatcherDirectCallTest(unittest.TestCase):
+
+  def setUp(self):
+    self.direct_app = TestApp(
+        endpoints_dispatcher.EndpointsDispatcherMiddleware(
+            apiserving._ApiServer([EchoService])), lint=False)
+    self.wsgi_app = TestApp(
+        _WsgiOnlyDispatcher(apiserving._ApiServer([EchoService])), lint=False)
+
+  def _check_same_response(self, path, body, expected_status):
+    extra_environ = {'REMOTE_ADDR': '10.1.2.3'}
+    headers = {'X-Echo-Header': 'hello', 'Origin': 'https://example.com'}
+    responses = [
+        app.post(path, body, headers=headers, extra_environ=extra_environ,
+                 content_type='application/json', status=expected_status)
+        for app in (self.direct_app, self.wsgi_app)]
+    direct, wsgi = responses
+    self.assertEqual(wsgi.status, direct.status)
+    self.assertEqual(sorted(wsgi.headerlist), sorted(direct.headerlist))
+    self.assertEqual(wsgi.body, direct.body)
+    return direct
+
+  def testEcho(self):
+    response = self._check_same_response(
+        '/anapi/echo/v1/echo/7?numbers=1&numbers=2&color=BLUE&inner.name=%C3%A9'
+        '&text=query&unknown=x',
+        '{"text": "body", "data": "YWJj"}', 200)
+    # Fields of the request body aren't repeated query parameters, so only
+    # the first number is used.
+    self.assertEqual({'text': 'body', 'numbers': ['1'], 'color': 'BLUE',
+                      'inner': {'name': u'\xe9'}, 'data': 'YWJj',
+                      'header': 'hello', 'remote_address': '10.1.2.3'},
+                     response.json)
+
+  def testMissingRequiredField(self):
+    self._check_same_response('/anapi/echo/v1/required', '{}', 400)
+
+  def testDecodeError(self):
+    self._check_same_response('/anapi/echo/v1/echo/7', '{"color": "GREEN"}',
+                              400)
+
+  def testMappedApplicationError(self):
+    self._check_same_response(
+        '/anapi/echo/v1/fail', '{"text": "not found", "inner": {"name": "x"}}',
+        404)
+
+  def testUnmappedApplicationError(self):
+    self._check_same_response('/anapi/echo/v1/fail', '{"text": "custom"}', 400)
+
+  def testUnexpectedError(self):
+    self._check_same_response('/anapi/echo/v1/fail', '{}', 503)
+
+
+class EndpointsDispatcherAuthContextTest(unittest.TestCase):
+
+  def setUp(self):
+    self.apps = [
+        TestApp(endpoints_dispatcher.EndpointsDispatcherMiddleware(
+            apiserving._ApiServer([UserService])), lint=False),
+        TestApp(_WsgiOnlyDispatcher(apiserving._ApiServer([UserService])),
+                lint=False),
+    ]
+
+  @mock.patch.dict(os.environ, {'AUTH_DOMAIN': 'example.com'})
+  @mock.patch.object(users_id_token, '_get_id_token_user')
+  def testUserIsKeptOutOfOsEnviron(self, mock_get_user):
+    mock_get_user.side_effect = (
+        lambda token, *unused_args: users.User(token + '@example.com'))
+    for app in self.apps:
+      for token in ('user1', 'user2'):
+        response = app.get('/anapi/user/v1/me',
+                           headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(token + '@example.com', response.json['text'])
+        self.assertNotIn('ENDPOINTS_AUTH_EMAIL', os.environ)
+        self.assertNotIn('HTTP_AUTHORIZATION', os.environ)
+      self.assertNotIn('text', app.get('/anapi/user/v1/me').json)
+
+
+class EndpointsDispatcherPrettyPrintTest(unittest.TestCase):
+
+  _PATH = '/anapi/echo/v1/echo/7'
+  _BODY = '{"text": "hi", "inner": {"name": "x"}}'
+
+  def _post(self, query='', status=200, **kwargs):
+    app = TestApp(endpoints_dispatcher.EndpointsDispatcherMiddleware(
+        apiserving._ApiServer([EchoService]), **kwargs), lint=False)
+    return app.post(self._PATH + query, self._BODY,
+                    content_type='application/json', status=status)
+
+  def testDefault(self):
+    response = self._post()
+    self.assertEqual(
+        '{\n "inner": {\n  "name": "x"\n }, \n "text": "hi"\n}', response.body)
+
+  def testPrettyPrintFalse(self):
+    pretty = self._post()
+    compact = self._post('?prettyPrint=false')
+    self.assertEqual(pretty.json, compact.json)
+    self.assertNotIn('\n', compact.body)
+    self.assertLess(len(compact.body), len(pretty.body))
+    self.assertEqual(str(len(compact.body)), compact.headers['Content-Length'])
+
+  def testServerDefault(self):
+    self.assertNotIn('\n', self._post(pretty_print=False).body)
+    self.assertIn('\n', self._post('?prettyPrint=true', pretty_print=False).body)
+
+  def testInvalidValue(self):
+    response = self._post('?prettyPrint=maybe', status=400)
+    self.assertIn('prettyPrint', response.body)
+
+
+class EndpointsDispatcherCompressionTest(unittest.TestCase):
+
+  _BODY = '{"text": "%s"}' % ('compressible ' * 100)
+
+  def _post(self, path='/anapi/echo/v1/echo/7', accept_encoding='gzip',
+            **kwargs):
+    """Returns the (headers, body) of a response, without decoding it."""
+    dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+        apiserving._ApiServer([EchoService]), **kwargs)
+    environ = test_util.create_fake_environ(
+        'https', 'example.appspot.com', path=path, body=self._BODY,
+        http_method='POST')
+    environ.update({'CONTENT_TYPE': 'application/json',
+                    'CONTENT_LENGTH': str(len(self._BODY)),
+                    'HTTP_ORIGIN': 'https://example.com'})
+    if accept_encoding:
+      environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    start_response = mock.Mock()
+    body = ''.join(dispatcher(environ, start_response))
+    status, headers = start_response.call_args[0]
+    self.assertEqual('200 OK', status)
+    return dict(headers), body
+
+  def testGzip(self):
+    headers, body = self._post()
+    self.assertEqual('gzip', headers['Content-Encoding'])
+    self.assertEqual('Accept-Encoding', headers['Vary'])
+    self.assertEqual('https://example.com',
+                     headers['Access-Control-Allow-Origin'])
+    self.assertEqual(str(len(body)), headers['Content-Length'])
+    _, uncompressed = self._post(accept_encoding=None)
+    self.assertEqual(uncompressed,
+                     zlib.decompress(body, 16 + zlib.MAX_WBITS))
+
+  def testDeflate(self):
+    headers, body = self._post(accept_encoding='gzip;q=0.5, deflate')
+    self.assertEqual('deflate', headers['Content-Encoding'])
+    self.assertIn('compressible', zlib.decompress(body))
+
+  def testNotAccepted(self):
+    headers, _ = self._post(accept_encoding=None)
+    self.assertNotIn('Content-Encoding', headers)
+    self.assertEqual('Accept-Encoding', headers['Vary'])
+
+  def testBelowMinSize(self):
+    headers, _ = self._post(compression_min_size=100000)
+    self.assertNotIn('Content-Encoding', headers)
+
+  def testDisabled(self):
+    headers, _ = self._post(compression_level=0)
+    self.assertNotIn('Content-Encoding', headers)
+    self.assertNotIn('Vary', headers)
+
+  def testMethodOptOut(self):
+    headers, body = self._post('/anapi/echo/v1/uncompressed')
+    self.assertNotIn('Content-Encoding', headers)
+    self.assertIn('compressible', body)
+
+
+class EndpointsDispatcherEtagTest(unittest.TestCase):
+
+  def setUp(self):
+    VersionedService.versions = {}
+    VersionedService.calls = []
+
+  def _request(self, path, http_method='GET', dispatcher_class=None,
+               **headers):
+    """Returns the (status, headers, body) of a response."""
+    dispatcher_class = (dispatcher_class or
+                        endpoints_dispatcher.EndpointsDispatcherMiddleware)
+    dispatcher = dispatcher_class(apiserving._ApiServer([VersionedService]))
+    environ = test_util.create_fake_environ(
+        'https', 'example.appspot.com', path=path, http_method=http_method,
+        body='{}' if http_method == 'POST' else None)
+    environ['HTTP_ORIGIN'] = 'https://example.com'
+    for header, value in headers.iteritems():
+      environ['HTTP_' + header.upper()] = value
+    start_response = mock.Mock()
+    body = ''.join(dispatcher(environ, start_response))
+    status, response_headers = start_response.call_args[0]
+    return status, dict(response_headers), body
+
+  def testHashedEtag(self):
+    status, headers, body = self._request('/anapi/versioned/v1/hashed/1')
+    self.assertEqual('200 OK', status)
+    etag = headers['ETag']
+    self.assertEqual(util.compute_etag(body), etag)
+
+    status, headers, body = self._request('/anapi/versioned/v1/hashed/1',
+                                          if_none_match=etag)
+    self.assertEqual('304 Not Modified', status)
+    self.assertEqual('', body)
+    self.assertEqual(etag, headers['ETag'])
+    self.assertEqual('https://example.com',
+                     headers['Access-Control-Allow-Origin'])
+    self.assertNotIn('Content-Length', headers)
+    # The method is called either way.
+    self.assertEqual([1, 1], VersionedService.calls)
+
+    status, _, _ = self._request('/anapi/versioned/v1/hashed/2',
+                                 if_none_match=etag)
+    self.assertEqual('200 OK', status)
+
+  def testEtagFunction(self):
+    VersionedService.versions[1] = 3
+    status, headers, _ = self._request('/anapi/versioned/v1/items/1')
+    self.assertEqual('200 OK', status)
+    self.assertEqual('"v3"', headers['ETag'])
+
+    status, headers, body = self._request('/anapi/versioned/v1/items/1',
+                                          if_none_match='"v3"')
+    self.assertEqual('304 Not Modified', status)
+    self.assertEqual('"v3"', headers['ETag'])
+    self.assertEqual('https://example.com',
+                     headers['Access-Control-Allow-Origin'])
+    self.assertEqual('', body)
+    # The method isn't called for the 304.
+    self.assertEqual([1], VersionedService.calls)
+
+    VersionedService.versions[1] = 4
+    status, headers, _ = self._request('/anapi/versioned/v1/items/1',
+                                       if_none_match='"v3"')
+    self.assertEqual('200 OK', status)
+    self.assertEqual('"v4"', headers['ETag'])
+
+  def testEtagFunctionThroughWsgi(self):
+    status, headers, _ = self._request(
+        '/anapi/versioned/v1/items/1', if_none_match='"v0"',
+        dispatcher_class=_WsgiOnlyDispatcher)
+    self.assertEqual('304 Not Modified', status)
+    self.assertEqual([], VersionedService.calls)
+
+  def testEtagFunctionError(self):
+    VersionedService.versions[1] = RuntimeError('broken')
+    for dispatcher_class in (None, _WsgiOnlyDispatcher):
+      VersionedService.calls = []
+      with mock.patch.object(apiserving, '_logger') as mock_logger:
+        status, headers, body = self._request(
+            '/anapi/versioned/v1/items/1', if_none_match='"v0"',
+            dispatcher_class=dispatcher_class)
+      self.assertEqual('200 OK', status)
+      # The ETag is computed from the body instead.
+      self.assertEqual(util.compute_etag(body), headers['ETag'])
+      self.assertEqual([1], VersionedService.calls)
+      self.assertEqual(1, mock_logger.exception.call_count)
+
+  def testNoNotModifiedBeforeAuth(self):
+    for if_none_match in ('*', '"v0"'):
+      status, headers, _ = self._request('/anapi/versioned/v1/private/1',
+                                         if_none_match=if_none_match)
+      self.assertEqual('401 Unauthorized', status)
+      self.assertNotIn('ETag', headers)
+
+  def testNotModifiedAfterAuth(self):
+    with mock.patch.object(users_id_token, 'get_current_user',
+                           return_value=users_id_token.users.User(
+                               'user@example.com')):
+      status, headers, body = self._request('/anapi/versioned/v1/private/1',
+                                            if_none_match='"v0"')
+    self.assertEqual('304 Not Modified', status)
+    self.assertEqual('"v0"', headers['ETag'])
+    self.assertEqual('', body)
+    # The method is called, so it can check the user.
+    self.assertEqual([1], VersionedService.calls)
+
+  def testPostHasNoEtag(self):
+    status, headers, _ = self._request('/anapi/versioned/v1/items/1',
+                                       http_method='POST', if_none_match='*')
+    self.assertEqual('200 OK', status)
+    self.assertNotIn('ETag', headers)
+
+  def testCompressedEtagIsWeak(self):
+    etag = util.compute_etag(
+        self._request('/anapi/versioned/v1/hashed/1')[2])
+    dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware
+    status, headers, _ = self._request(
+        '/anapi/versioned/v1/hashed/1', accept_encoding='gzip',
+        dispatcher_class=lambda backend: dispatcher(
+            backend, compression_min_size=0))
+    self.assertEqual('200 OK', status)
+    self.assertEqual('W/' + etag, headers['ETag'])
+
+    status, _, _ = self._request('/anapi/versioned/v1/hashed/1',
+                                 if_none_match=headers['ETag'])
+    self.assertEqual('304 Not Modified', status)
+
+
+class _StreamingBackend(object):
+  """A backend that streams its response in chunks."""
+
+  base_paths = frozenset(['/anapi/'])
+
+  def __init__(self, chunks, etag=None):
+    self.chunks = chunks
+    self.etag = etag
+    self.closed = False
+
+  def get_etag_function(self, unused_path):
+    if self.etag is None:
+      return None
+    return lambda unused_payload: self.etag
+
+  def get_api_configs(self):
+    return {'items': [{
+        'name': 'stream', 'version': 'v1', 'api_version': 'v1',
+        'path_version': 'v1',
+        'methods': {'stream.list': {'httpMethod': 'GET', 'path': 'items',
+                                    'rosyMethod': 'StreamService.list'}}}]}
+
+  def __call__(self, environ, start_response):
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return self._generate()
+
+  def _generate(self):
+    try:
+      for chunk in self.chunks:
+        yield chunk
+    finally:
+      self.closed = True
+
+
+class EndpointsDispatcherStreamingTest(unittest.TestCase):
+
+  _CHUNKS = ['{"items": [', '1, ', '2', ']}']
+
+  def setUp(self):
+    self.backend = _StreamingBackend(self._CHUNKS)
+    self.dispatcher = endpoints_dispatcher.EndpointsDispatcherMiddleware(
+        self.backend)
+
+  def _call(self, query_string, accept_encoding=None, if_none_match=None):
+    environ = test_util.create_fake_environ(
+        'https', 'example.appspot.com', path='/anapi/stream/v1/items',
+        query_string=query_string)
+    if accept_encoding:
+      environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    if if_none_match:
+      environ['HTTP_IF_NONE_MATCH'] = if_none_match
+    start_response = mock.Mock()
+    body = self.dispatcher(environ, start_response)
+    return start_response, list(body)
+
+  def testStreamed(self):
+    start_response, chunks = self._call('prettyPrint=false')
+    self.assertEqual(self._CHUNKS, chunks)
+    status, headers = start_response.call_args[0]
+    self.assertEqual('200 OK', status)
+    self.assertNotIn('content-length', [name.lower() for name, _ in headers])
+    # Without an etag function, there's no ETag to send before the body.
+    self.assertNotIn('etag', [name.lower() for name, _ in headers])
+    self.assertTrue(self.backend.closed)
+
+  def testStreamedWithEtagFunction(self):
+    self.backend.etag = '"v1"'
+    start_response, chunks = self._call('prettyPrint=false')
+    self.assertEqual(self._CHUNKS, chunks)
+    self.assertIn(('ETag', '"v1"'), start_response.call_args[0][1])
+
+  def testBufferedWithIfNoneMatch(self):
+    etag = util.compute_etag(''.join(self._CHUNKS))
+    start_response, chunks = self._call('prettyPrint=false',
+                                        if_none_match='"other"')
+    self.assertEqual([''.join(self._CHUNKS)], chunks)
+    self.assertIn(('ETag', etag), start_response.call_args[0][1])
+
+    start_response, chunks = self._call('prettyPrint=false',
+                                        if_none_match=etag)
+    self.assertEqual('304 Not Modified', start_response.call_args[0][0])
+    self.assertEqual([''], chunks)
+
+  def testPrettyPrintBuffered(self):
+    _, chunks = self._call('')
+    self.assertEqual(['{\n "items": [\n  1, \n  2\n ]\n}'], chunks)
+
+  def testStreamedCompressed(self):
+    start_response, chunks = self._call('prettyPrint=false', 'gzip')
+    headers = dict(start_response.call_args[0][1])
+    self.assertEqual('gzip', headers['Content-Encoding'])
+    self.assertNotIn('Content-Length', headers)
+    self.assertEqual(''.join(self._CHUNKS),
+                     zlib.decompress(''.join(chunks), 16 + zlib.MAX_WBITS))
+    self.assertTrue(self.backend.closed)
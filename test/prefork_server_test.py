@@ -0,0 +1,216 @@
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for prefork_server."""
+
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import urllib2
+
+import mock
+import test_util
+from endpoints import prefork_server
+
+
+class ModuleInterfaceTest(test_util.ModuleInterfaceTest,
+                          unittest.TestCase):
+
+  MODULE = prefork_server
+
+
+class _App(object):
+  """Responds with the pid of the worker, and whether it was warmed."""
+
+  def __init__(self):
+    self.warmed_by = None
+    self.forked_pid = None
+
+  def warm(self, base_urls):
+    self.warmed_by = os.getpid(), base_urls
+
+  def after_fork(self):
+    self.forked_pid = os.getpid()
+
+  def __call__(self, environ, start_response):
+    if environ['PATH_INFO'] == '/slow':
+      # Signals cut sleeps short.
+      deadline = time.time() + 0.5
+      while time.time() < deadline:
+        time.sleep(max(0, deadline - time.time()))
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    if environ['PATH_INFO'] == '/server':
+      return ['%s %s' % (environ['SERVER_NAME'], environ['SERVER_PORT'])]
+    if environ['PATH_INFO'] == '/forked':
+      return ['%d %d' % (os.getpid(), self.forked_pid)]
+    if environ['REQUEST_METHOD'] == 'POST':
+      # Reading all of the input mustn't wait for the client to disconnect.
+      return [environ['wsgi.input'].read()]
+    return ['%d %r' % (os.getpid(), self.warmed_by)]
+
+
+class PreforkServerTest(unittest.TestCase):
+
+  def start(self, **kwargs):
+    """Run a server in a new process, which is stopped after the test."""
+    server = prefork_server.PreforkServer(_App(), port=0, **kwargs)
+    self.port = server.server_address[1]
+    self.master_pid = os.fork()
+    if not self.master_pid:
+      status = 1
+      try:
+        server.serve_forever(base_urls=['http://example.com'])
+        status = 0
+      finally:
+        os._exit(status)  # pylint: disable=protected-access
+    server.socket.close()
+    self.addCleanup(self.stop)
+
+  def stop(self):
+    if self.master_pid:
+      os.kill(self.master_pid, signal.SIGTERM)
+      status = os.waitpid(self.master_pid, 0)[1]
+      self.master_pid = None
+      return status
+
+  def get(self, path='/'):
+    url = 'http://127.0.0.1:%d%s' % (self.port, path)
+    pid, warmed_by = urllib2.urlopen(url, timeout=10).read().split(' ', 1)
+    return int(pid), warmed_by
+
+  def testSocketIsReusable(self):
+    server = prefork_server.PreforkServer(_App(), port=0)
+    try:
+      self.assertTrue(server.socket.getsockopt(
+          socket.SOL_SOCKET, prefork_server._SO_REUSEPORT))
+    finally:
+      server.socket.close()
+
+  def testAppIsWarmedBeforeForking(self):
+    self.start(workers=2)
+    pid, warmed_by = self.get()
+    self.assertNotEqual(self.master_pid, pid)
+    self.assertEqual(repr((self.master_pid, ['http://example.com'])),
+                     warmed_by)
+
+  def testEachWorkerCallsAfterFork(self):
+    self.start(workers=2)
+    pid, forked_pid = self.get('/forked')
+    self.assertEqual(str(pid), forked_pid)
+
+  def testReadsTheRequestBody(self):
+    self.start(workers=1)
+    url = 'http://127.0.0.1:%d/' % self.port
+    self.assertEqual('body', urllib2.urlopen(url, 'body', timeout=10).read())
+
+  def testIdleConnectionsTimeOut(self):
+    self.start(workers=1, connection_timeout=0.5)
+    idle = socket.create_connection(('127.0.0.1', self.port))
+    try:
+      # The worker is busy with the idle connection until it times out.
+      self.get()
+      idle.settimeout(10)
+      self.assertEqual('', idle.recv(1))
+    finally:
+      idle.close()
+
+  def testServerNameIsTakenFromTheHostHeader(self):
+    self.start(workers=1)
+    url = 'http://127.0.0.1:%d/server' % self.port
+    for host, expected in (('api.example.com', 'api.example.com 80'),
+                           ('API.example.com:8080', 'api.example.com 8080'),
+                           ('[::1]:9000', '::1 9000')):
+      request = urllib2.Request(url, headers={'Host': host})
+      self.assertEqual(expected, urllib2.urlopen(request, timeout=10).read())
+
+  def testWorkersAreReplacedAfterTheirBudget(self):
+    self.start(workers=1, max_requests=2)
+    pids = [self.get()[0] for _ in xrange(6)]
+    self.assertEqual(3, len(set(pids)))
+    self.assertEqual(pids[0], pids[1])
+
+  def testStopsGracefully(self):
+    self.start(workers=1)
+    self.get()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(self.get('/slow')))
+    thread.start()
+    time.sleep(0.2)
+    self.assertEqual(0, self.stop())
+    thread.join()
+    self.assertEqual(1, len(results))
+
+  def testFailingWorkersAreReplacedWithBackoff(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    starts_path = os.path.join(directory, 'starts')
+
+    def fail(*unused_args):
+      with open(starts_path, 'a') as starts_file:
+        starts_file.write('%d\n' % os.getpid())
+      raise ValueError('Worker failed')
+
+    with mock.patch.object(prefork_server, '_WorkerServer', side_effect=fail):
+      self.start(workers=1)
+    time.sleep(1)
+    # Stopping interrupts the wait to replace the worker.
+    start_time = time.time()
+    self.assertEqual(0, self.stop())
+    self.assertLess(time.time() - start_time, 1)
+    with open(starts_path) as starts_file:
+      starts = len(starts_file.readlines())
+    # The delays are 0.1, 0.2 and 0.4 seconds, then 0.8.
+    self.assertGreaterEqual(starts, 3)
+    self.assertLessEqual(starts, 5)
+
+  def testDescribeExitStatus(self):
+    self.assertEqual('exited with status 1',
+                     prefork_server._describe_exit_status(1 << 8))
+    self.assertEqual('was killed by signal 9',
+                     prefork_server._describe_exit_status(signal.SIGKILL))
+
+  def testWorkersAreReplacedOnSighup(self):
+    self.start(workers=1)
+    pid = self.get()[0]
+    os.kill(self.master_pid, signal.SIGHUP)
+    for _ in xrange(50):
+      if self.get()[0] != pid:
+        break
+      time.sleep(0.1)
+    else:
+      self.fail('The worker was not replaced')
+
+  def testSighupStartsNewWorkersBeforeStoppingOldOnes(self):
+    self.start(workers=1)
+    pid = self.get()[0]
+    results = []
+    thread = threading.Thread(target=lambda: results.append(self.get('/slow')))
+    thread.start()
+    time.sleep(0.1)
+    os.kill(self.master_pid, signal.SIGHUP)
+    # A new worker serves this while the old one finishes the slow request.
+    start_time = time.time()
+    self.assertNotEqual(pid, self.get()[0])
+    self.assertLess(time.time() - start_time, 0.3)
+    thread.join()
+    self.assertEqual(pid, results[0][0])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,171 @@
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for shared_cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import test_util
+from endpoints import shared_cache
+
+
+class ModuleInterfaceTest(test_util.ModuleInterfaceTest,
+                          unittest.TestCase):
+
+  MODULE = shared_cache
+
+
+class SharedMemoryCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'cache')
+    self.cache = shared_cache.SharedMemoryCache(self.path, num_slots=16,
+                                                slot_size=256)
+
+  def tearDown(self):
+    self.cache.close()
+    shutil.rmtree(self.directory)
+
+  def testGetAndSet(self):
+    self.assertIsNone(self.cache.get('key'))
+    self.assertTrue(self.cache.set('key', {'values': [1, 'two']}))
+    self.assertEqual({'values': [1, 'two']}, self.cache.get('key'))
+    self.assertTrue(self.cache.set('key', 'replaced'))
+    self.assertEqual('replaced', self.cache.get('key'))
+    self.assertTrue(self.cache.set(u'\xe9', 'unicode'))
+    self.assertEqual('unicode', self.cache.get(u'\xe9'))
+
+  def testNamespaces(self):
+    self.cache.set('key', 'namespaced', namespace='namespace')
+    self.assertIsNone(self.cache.get('key'))
+    self.assertEqual('namespaced', self.cache.get('key', namespace='namespace'))
+
+  @mock.patch.object(shared_cache, '_now')
+  def testExpiration(self, mock_now):
+    mock_now.return_value = 1000
+    self.cache.set('relative', 'value', time=10)
+    self.cache.set('absolute', 'value', time=1500000000)
+    self.cache.set('forever', 'value')
+    mock_now.return_value = 1009
+    self.assertEqual('value', self.cache.get('relative'))
+    mock_now.return_value = 1010
+    self.assertIsNone(self.cache.get('relative'))
+    self.assertEqual('value', self.cache.get('absolute'))
+    mock_now.return_value = 1500000000
+    self.assertIsNone(self.cache.get('absolute'))
+    self.assertEqual('value', self.cache.get('forever'))
+
+  def testValuesTooLargeAreNotCached(self):
+    self.assertFalse(self.cache.set('key', 'x' * 256))
+    self.assertIsNone(self.cache.get('key'))
+
+  @mock.patch.object(shared_cache, '_now')
+  def testSoonestToExpireIsEvicted(self, mock_now):
+    mock_now.return_value = 1000
+    cache = shared_cache.SharedMemoryCache(
+        os.path.join(self.directory, 'small'), num_slots=2, slot_size=64)
+    try:
+      cache.set('a', 'value', time=100)
+      cache.set('b', 'value', time=200)
+      cache.set('c', 'value', time=300)
+      self.assertIsNone(cache.get('a'))
+      self.assertEqual('value', cache.get('b'))
+      self.assertEqual('value', cache.get('c'))
+      # An expired entry's slot is reused before any other.
+      mock_now.return_value = 1250
+      cache.set('d', 'value', time=10)
+      self.assertIsNone(cache.get('b'))
+      self.assertEqual('value', cache.get('c'))
+      self.assertEqual('value', cache.get('d'))
+    finally:
+      cache.close()
+
+  def testDeleteAndFlushAll(self):
+    self.cache.set('key', 'value')
+    self.cache.set('other', 'value')
+    self.cache.delete('key')
+    self.assertIsNone(self.cache.get('key'))
+    self.assertEqual('value', self.cache.get('other'))
+    self.cache.flush_all()
+    self.assertIsNone(self.cache.get('other'))
+
+  def testEntriesAreSharedThroughTheFile(self):
+    self.cache.set('key', 'value')
+    other = shared_cache.SharedMemoryCache(self.path, num_slots=32,
+                                           slot_size=128)
+    try:
+      self.assertEqual('value', other.get('key'))
+      other.set('other', 'value')
+      self.assertEqual('value', self.cache.get('other'))
+    finally:
+      other.close()
+
+  def testOtherFilesAreRejected(self):
+    other_path = os.path.join(self.directory, 'other')
+    with open(other_path, 'w') as f:
+      f.write('not a cache')
+    os.chmod(other_path, 0600)
+    self.assertRaises(ValueError, shared_cache.SharedMemoryCache, other_path)
+
+  def testFilesOtherUsersCanAccessAreRejected(self):
+    self.cache.close()
+    os.chmod(self.path, 0620)
+    self.assertRaises(ValueError, shared_cache.SharedMemoryCache, self.path)
+    os.chmod(self.path, 0604)
+    self.assertRaises(ValueError, shared_cache.SharedMemoryCache, self.path)
+    os.chmod(self.path, 0600)
+    shared_cache.SharedMemoryCache(self.path).close()
+
+  def testFilesOwnedByOtherUsersAreRejected(self):
+    self.cache.close()
+    with mock.patch.object(os, 'geteuid', return_value=os.geteuid() + 1):
+      self.assertRaises(ValueError, shared_cache.SharedMemoryCache, self.path)
+
+  def testSymlinksAreRejected(self):
+    link_path = os.path.join(self.directory, 'link')
+    os.symlink(self.path, link_path)
+    self.assertRaises(ValueError, shared_cache.SharedMemoryCache, link_path)
+
+  def testForkedProcessesShareEntries(self):
+    self.cache.set('parent', 'value')
+    pids = []
+    for i in xrange(4):
+      pid = os.fork()
+      if pid == 0:
+        # Each child writes and reads back its own keys while the others do.
+        status = 0
+        try:
+          if self.cache.get('parent') != 'value':
+            status = 1
+          for j in xrange(200):
+            key = 'child%d-%d' % (i, j % 2)
+            self.cache.set(key, [i, j])
+            if self.cache.get(key) != [i, j]:
+              status = 1
+        finally:
+          os._exit(status)  # pylint: disable=protected-access
+      pids.append(pid)
+    for pid in pids:
+      self.assertEqual(0, os.waitpid(pid, 0)[1])
+    for i in xrange(4):
+      self.assertEqual([i, 199], self.cache.get('child%d-1' % i))
+
+
+if __name__ == '__main__':
+  unittest.main()
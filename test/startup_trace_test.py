@@ -0,0 +1,98 @@
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for startup_trace."""
+
+import gc
+import json
+import threading
+import unittest
+
+import mock
+import test_util
+from endpoints import startup_trace
+
+
+class ModuleInterfaceTest(test_util.ModuleInterfaceTest,
+                          unittest.TestCase):
+
+  MODULE = startup_trace
+
+
+class StartupTraceTest(unittest.TestCase):
+
+  @mock.patch.object(startup_trace.time, 'time')
+  def testPhasesAreTimed(self, mock_time):
+    mock_time.side_effect = [0, 1, 3, 3, 7, 10]
+    with startup_trace.start() as tracer:
+      with startup_trace.trace('outer'):
+        with startup_trace.trace('inner'):
+          pass
+        with startup_trace.trace('inner'):
+          pass
+    report = tracer.report()
+    self.assertEqual([
+        startup_trace.StartupPhase('outer', 10, None, 1),
+        startup_trace.StartupPhase('outer/inner', 6, None, 2),
+    ], list(report.phases))
+    self.assertEqual(10, report.seconds)
+    self.assertEqual(1, report.get_phase('outer/inner').depth)
+    self.assertIsNone(report.get_phase('inner'))
+
+  def testAllocationsAreCounted(self):
+    # A collection during the phase would lower the count.
+    gc.disable()
+    try:
+      with startup_trace.start(count_allocations=True) as tracer:
+        with startup_trace.trace('allocate'):
+          objects = [[] for _ in xrange(1000)]
+    finally:
+      gc.enable()
+    allocations = tracer.report().get_phase('allocate').allocations
+    self.assertGreaterEqual(allocations, len(objects))
+
+  def testNothingIsRecordedOutsideStart(self):
+    with startup_trace.start() as tracer:
+      pass
+    with startup_trace.trace('ignored'):
+      pass
+    self.assertEqual((), tracer.report().phases)
+
+  def testTracesAreSeparatePerThread(self):
+    with startup_trace.start() as tracer:
+      thread = threading.Thread(
+          target=lambda: startup_trace.trace('other thread').__enter__())
+      thread.start()
+      thread.join()
+    self.assertEqual((), tracer.report().phases)
+
+  def testReportFormats(self):
+    report = startup_trace.StartupReport([
+        startup_trace.StartupPhase('api_server', 0.5, 120),
+        startup_trace.StartupPhase('api_server/generate_config', 0.25, 100,
+                                   calls=2),
+    ])
+    self.assertEqual(
+        'api_server                                          500.00 ms'
+        '       120 objects\n'
+        '  generate_config (x2)                              250.00 ms'
+        '       100 objects', report.format())
+    report_dict = json.loads(json.dumps(report.to_dict()))
+    self.assertEqual(0.5, report_dict['seconds'])
+    self.assertEqual(['api_server', 'api_server/generate_config'],
+                     [phase['name'] for phase in report_dict['phases']])
+
+
+if __name__ == '__main__':
+  unittest.main()
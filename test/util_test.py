@@ -17,6 +17,7 @@
 import os
 import sys
 import unittest
+import zlib
 
 import endpoints._endpointscfg_setup  # pylint: disable=unused-import
 import mock
@@ -68,5 +69,173 @@ class GetProtocolForEnvTest(unittest.TestCase):
           self.assertEqual('devversion-dot-devmodule-dot-', result)
 
 
+class _ClosableBody(object):
+
+  def __init__(self, chunks):
+    self.chunks = chunks
+    self.closed = False
+
+  def __iter__(self):
+    return iter(self.chunks)
+
+  def close(self):
+    self.closed = True
+
+
+class StartResponseProxyTest(unittest.TestCase):
+
+  def testResponseBodyIterWithoutWrites(self):
+    body_iter = _ClosableBody(['a', 'b'])
+    with util.StartResponseProxy() as proxy:
+      proxy.Proxy('200 OK', [])
+      self.assertIs(body_iter, proxy.get_response_body_iter(body_iter))
+
+  def testResponseBodyIterWithWrites(self):
+    body_iter = _ClosableBody(['b', 'c'])
+    with util.StartResponseProxy() as proxy:
+      proxy.Proxy('200 OK', [])('a')
+      result = proxy.get_response_body_iter(body_iter)
+    self.assertEqual(['a', 'b', 'c'], list(result))
+    result.close()
+    self.assertTrue(body_iter.closed)
+
+
+class SendWsgiStreamingResponseTest(unittest.TestCase):
+
+  def _send(self, headers, body_iter):
+    start_response = mock.Mock()
+    result = util.send_wsgi_streaming_response(
+        '200 OK', headers, body_iter, start_response)
+    self.assertIs(body_iter, result)
+    return start_response.call_args[0][1]
+
+  def testLengthFromList(self):
+    headers = self._send([('Content-Length', '1')], ['ab', 'c'])
+    self.assertEqual([('Content-Length', '3')], headers)
+
+  def testLengthFromHeaders(self):
+    headers = self._send([('Content-Length', '3')], _ClosableBody(['abc']))
+    self.assertEqual([('Content-Length', '3')], headers)
+
+  def testUnknownLength(self):
+    headers = self._send([('Content-Type', 'application/json')],
+                         _ClosableBody(['abc']))
+    self.assertEqual([('Content-Type', 'application/json')], headers)
+
+
+class ChooseResponseEncodingTest(unittest.TestCase):
+
+  def testEncodings(self):
+    for accept_encoding, expected in (
+        (None, None),
+        ('', None),
+        ('identity', None),
+        ('gzip', 'gzip'),
+        ('deflate, gzip', 'gzip'),
+        ('GZIP;q=0.5, deflate', 'deflate'),
+        ('gzip;q=0, deflate;q=0', None),
+        ('*', 'gzip'),
+        ('*;q=0.5, gzip;q=0.1', 'deflate'),
+        ('gzip;q=bad, deflate', 'deflate')):
+      self.assertEqual(expected, util.choose_response_encoding(accept_encoding),
+                       accept_encoding)
+
+
+class ResponseCompressionTest(unittest.TestCase):
+
+  _CONTENT = 'abc' * 100
+
+  def testCompress(self):
+    compression = util.ResponseCompression('gzip', 6, 10)
+    headers, content = compression.compress_response(
+        [('Content-Length', '300'), ('Vary', 'Origin')], self._CONTENT)
+    self.assertEqual([('Vary', 'Origin, Accept-Encoding'),
+                      ('Content-Encoding', 'gzip'),
+                      ('Content-Length', str(len(content)))], headers)
+    self.assertEqual(self._CONTENT,
+                     zlib.decompress(content, 16 + zlib.MAX_WBITS))
+
+  def testBelowMinSize(self):
+    compression = util.ResponseCompression('gzip', 6, 1000)
+    headers, content = compression.compress_response([], self._CONTENT)
+    self.assertEqual([('Vary', 'Accept-Encoding')], headers)
+    self.assertEqual(self._CONTENT, content)
+
+  def testAlreadyEncoded(self):
+    compression = util.ResponseCompression('deflate', 6, 0)
+    headers, content = compression.compress_response(
+        [('Content-Encoding', 'br')], self._CONTENT)
+    self.assertEqual(self._CONTENT, content)
+    self.assertEqual('br', dict(headers)['Content-Encoding'])
+
+  def testNotAccepted(self):
+    compression = util.ResponseCompression(None, 6, 0)
+    _, content = compression.compress_response([], self._CONTENT)
+    self.assertEqual(self._CONTENT, content)
+
+  def testStreamed(self):
+    body_iter = _ClosableBody(['abc'] * 100)
+    compression = util.ResponseCompression('deflate', 6, 1000)
+    headers, result = compression.compress_response_iter([], body_iter)
+    self.assertEqual([('Vary', 'Accept-Encoding'),
+                      ('Content-Encoding', 'deflate')], headers)
+    self.assertEqual(self._CONTENT, zlib.decompress(''.join(result)))
+    result.close()
+    self.assertTrue(body_iter.closed)
+
+  def testStreamedKnownLengthBelowMinSize(self):
+    body_iter = _ClosableBody(['abc'])
+    compression = util.ResponseCompression('gzip', 6, 1000)
+    _, result = compression.compress_response_iter(
+        [('Content-Length', '3')], body_iter)
+    self.assertIs(body_iter, result)
+
+  def testStreamedList(self):
+    compression = util.ResponseCompression('gzip', 6, 10)
+    start_response = mock.Mock()
+    result = util.send_wsgi_streaming_response(
+        '200 OK', [], ['abc'] * 100, start_response, compression=compression)
+    self.assertEqual(1, len(result))
+    self.assertEqual(str(len(result[0])),
+                     dict(start_response.call_args[0][1])['Content-Length'])
+
+
+class EtagTest(unittest.TestCase):
+
+  def testComputeEtag(self):
+    etag = util.compute_etag('abc')
+    self.assertEqual(etag, util.compute_etag('abc'))
+    self.assertNotEqual(etag, util.compute_etag('abd'))
+    self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+
+  def testEtagMatches(self):
+    for if_none_match, expected in (
+        (None, False),
+        ('', False),
+        ('"v1"', True),
+        ('W/"v1"', True),
+        ('"v0", "v1"', True),
+        ('"v0"', False),
+        ('*', True),
+        ('v1', False)):
+      self.assertEqual(expected, util.etag_matches(if_none_match, '"v1"'),
+                       if_none_match)
+    self.assertTrue(util.etag_matches('"v1"', 'W/"v1"'))
+
+  def testNotModifiedResponse(self):
+    start_response = mock.Mock()
+    compression = util.ResponseCompression('gzip', 6, 0)
+    body = util.send_wsgi_not_modified_response(
+        '"v1"', start_response, compression=compression)
+    self.assertEqual('', body)
+    start_response.assert_called_once_with(
+        '304 Not Modified', [('ETag', '"v1"'), ('Vary', 'Accept-Encoding')])
+
+  def testCompressionWeakensEtag(self):
+    compression = util.ResponseCompression('gzip', 6, 0)
+    headers, _ = compression.compress_response([('ETag', '"v1"')], 'abc')
+    self.assertEqual('W/"v1"', dict(headers)['ETag'])
+
+
 if __name__ == '__main__':
   unittest.main()